@@ -23,7 +23,10 @@
 # THE SOFTWARE.
 
 """\
-Outputs statistics and a scatterplot for the given XY data set.
+Outputs statistics and a scatterplot for each of the given XY data sets. When several data sets are given, they are
+analyzed in parallel and a summary table and the statistics of the combined data set are printed after the statistics of
+each data set. The scatterplot of each data set is then saved using the input file name as a suffix of the output file
+name e.g. scatterplot_kellogg_txt.png.
 
 Usage:
     analyze.py [options] <inputfile>...
@@ -32,8 +35,26 @@ Options:
     -o FILE --output FILE
         File name for the generated scatterplot [default: scatterplot.png]
 
-The input file should be a comma-separated values file where the first three columns are:
- ID,Experimental,Predicted
+    -b BACKEND --backend BACKEND
+        The plotting backend. This should be "R" (ggplot2) or "matplotlib" [default: R]
+
+    --bootstrap_samples N
+        If N is positive, 95% confidence intervals are reported for every metric using N bootstrap resamples of the data set. [default: 0]
+
+    --random_seed SEED
+        The seed used to draw the bootstrap resamples. [default: 0]
+
+    -p NUM_PROCESSES --processes NUM_PROCESSES
+        The number of processes used to analyze the input files and to compute the bootstrap resamples. [default: 1]
+
+    --metrics METRICS
+        A comma-separated list of the metrics to compute e.g. "pearsonr,MAE". All metrics are computed by default.
+
+The input files should be JSON files containing a list of objects with Experimental and Predicted values, or
+comma-separated (tab-separated for .tsv files) values files where the first two or three columns are:
+ Experimental,Predicted[,ID]
+Lines starting with # are treated as comments. The IDs are passed to the scatterplot; the rows are numbered from 1 if
+there is no ID column.
 
 Authors:
     Shane O'Connor
@@ -42,7 +63,7 @@ Authors:
 import sys
 import os
 from .libraries import docopt
-from .stats import get_xy_dataset_statistics, plot, read_file, RInterface, format_stats_for_printing
+from .stats import _get_xy_dataset_statistics, plot, read_file, RInterface, format_stats_for_printing, set_plot_backend, get_metric_dependencies, keymap
 
 correlation_coefficient_scatterplotplot = RInterface.correlation_coefficient_gplot
 
@@ -58,26 +79,70 @@ def read_json(filename):
         return None
 
 
-def parse_csv(filename):
+def read_xy_arrays(filename):
+    '''Returns a triple (x_values, y_values, ids) of the float arrays of the experimental and predicted values in a JSON,
+       CSV, or TSV file and the list of record IDs. The IDs are read from the ID (or DatasetID) field of the JSON records or
+       from the third column of the CSV/TSV file; ids is None if the file has no IDs. The CSV/TSV columns are read with
+       numpy.loadtxt and numpy.genfromtxt rather than converting each cell in Python.'''
+    import numpy
+    with open(filename, 'r') as f:
+        first_character = f.read(1024).lstrip()[:1]
+    if filename.endswith('.json') or first_character in ['[', '{']:
+        analysis_table = read_json(filename)
+        if not analysis_table:
+            raise Exception('The JSON file %s could not be parsed.' % filename)
+        ids = None
+        for id_field in ['ID', 'DatasetID']:
+            if all(id_field in r for r in analysis_table):
+                ids = [r[id_field] for r in analysis_table]
+                break
+        return numpy.array([r['Experimental'] for r in analysis_table], dtype = float), numpy.array([r['Predicted'] for r in analysis_table], dtype = float), ids
+
     separator = ','
     if filename.endswith('.tsv'):
         separator = '\t'
     try:
-        table = []
-        id = 1
-        contents = read_file(filename)
-        lines = [l.strip().split(separator) for l in contents.split('\n') if l.strip() and not(l.strip().startswith('#'))]
-        for linetokens in lines:
-            if len(linetokens) >= 3:
-                table.append(dict(Experimental = float(linetokens[0]), Predicted = float(linetokens[1]), ID = str(linetokens[2])))
-            elif len(linetokens) == 2:
-                table.append(dict(Experimental = float(linetokens[0]), Predicted = float(linetokens[1]), ID = id))
-                id += 1
-            else:
-                raise Exception('At least two columns (experimental DDG, predicted DDG) are expected.')
-        return table
+        values = numpy.loadtxt(filename, delimiter = separator, comments = '#', usecols = (0, 1), ndmin = 2, dtype = float)
     except Exception as e:
-        raise Exception('An exception occurred parsing the CSV/TSV file: %s' % str(e))
+        raise Exception('An exception occurred parsing the CSV/TSV file %s. At least two columns (experimental DDG, predicted DDG) are expected: %s' % (filename, str(e)))
+    if len(values) == 0:
+        raise Exception('The file %s contains no data.' % filename)
+
+    # The third column, if present, holds the record IDs
+    ids = None
+    with open(filename, 'r') as f:
+        first_line = [l for l in f if l.strip() and not(l.strip().startswith('#'))][0]
+    if len(first_line.strip().split(separator)) >= 3:
+        try:
+            ids = numpy.atleast_1d(numpy.genfromtxt(filename, delimiter = separator, comments = '#', usecols = (2,), dtype = str, autostrip = True)).tolist()
+        except Exception as e:
+            raise Exception('An exception occurred reading the IDs in the third column of the CSV/TSV file %s: %s' % (filename, str(e)))
+    return values[:, 0].copy(), values[:, 1].copy(), ids
+
+
+def analyze_file(job):
+    '''Reads one input file and computes its statistics. Returns a (x_values, y_values, ids, statistics) tuple. This is a
+       module-level function so that it can be sent to a process pool.'''
+    filename, options = job
+    x_values, y_values, ids = read_xy_arrays(filename)
+    return x_values, y_values, ids, _get_xy_dataset_statistics(x_values, y_values, **options)
+
+
+def format_summary_table(filenames, file_statistics):
+    '''Returns a table with one row per input file of the number of points and the main metrics.'''
+    columns = [k for k in ['pearsonr', 'spearmanr', 'MAE', 'fraction_correct'] if k in file_statistics[0][3]]
+    name_width = max([len('File')] + [len(os.path.basename(f)) for f in filenames])
+    lines = ['  '.join(['File'.ljust(name_width), 'Points'.rjust(8)] + [keymap.get(k, k).rjust(16) for k in columns])]
+    for filename, (x_values, y_values, ids, stats) in zip(filenames, file_statistics):
+        values = [stats[k][0] if k in ['pearsonr', 'spearmanr'] else stats[k] for k in columns]
+        lines.append('  '.join([os.path.basename(filename).ljust(name_width), str(len(x_values)).rjust(8)] + [('%0.3f' % v).rjust(16) for v in values]))
+    return '\n'.join(lines)
+
+
+def get_plot_table(x_values, y_values, ids = None):
+    if ids is None:
+        ids = list(range(1, len(x_values) + 1))
+    return [dict(ID = i, DatasetID = i, Experimental = e, Predicted = p) for i, e, p in zip(ids, x_values.tolist(), y_values.tolist())]
 
 
 if __name__ == '__main__':
@@ -87,14 +152,36 @@ if __name__ == '__main__':
         print(('Failed while parsing arguments: %s.' % str(e)))
         sys.exit(1)
 
-    # Read file input file
-    input_filename = arguments['<inputfile>'][0]
-    if not os.path.exists(input_filename):
-        print(('Error: the input file %s does not exist.' % input_filename))
-        sys.exit(2)
-    analysis_table = read_json(input_filename)
-    if not analysis_table:
-        analysis_table = parse_csv(input_filename)
+    try:
+        set_plot_backend(arguments['--backend'])
+    except Exception as e:
+        print(('Error: %s' % str(e)))
+        sys.exit(1)
+
+    try:
+        bootstrap_samples = int(arguments['--bootstrap_samples'])
+        random_seed = int(arguments['--random_seed'])
+        num_processes = int(arguments['--processes'])
+        assert(bootstrap_samples >= 0 and num_processes > 0)
+    except:
+        print('Error: the --bootstrap_samples argument must be a non-negative integer, the --random_seed argument must be an integer, and the --processes argument must be a positive integer.')
+        sys.exit(1)
+
+    metrics = None
+    if arguments['--metrics']:
+        metrics = [m.strip() for m in arguments['--metrics'].split(',') if m.strip()]
+        try:
+            get_metric_dependencies(metrics)
+        except Exception as e:
+            print(('Error: %s' % str(e)))
+            sys.exit(1)
+
+    # Check the input files
+    input_filenames = arguments['<inputfile>']
+    for input_filename in input_filenames:
+        if not os.path.exists(input_filename):
+            print(('Error: the input file %s does not exist.' % input_filename))
+            sys.exit(2)
 
     # Set up the output filename
     output_filename = arguments['--output']
@@ -102,9 +189,42 @@ if __name__ == '__main__':
     if output_filename_ext not in ['.png', '.pdf']: # todo: check eps output ('.eps')
         output_filename += '.png'
 
-    print(('\n' + '*'*10 + ' Statistics ' +'*'*10))
-    print((format_stats_for_printing(get_xy_dataset_statistics(analysis_table))))
-
-    print(('\nSaving scatterplot to %s.\n' % output_filename))
-    plot(analysis_table, output_filename, correlation_coefficient_scatterplotplot)
+    # Read the files and compute their statistics, one file per process when there are several files. The bootstrap
+    # resamples of a single file are computed in parallel instead.
+    options = dict(bootstrap_samples = bootstrap_samples, random_seed = random_seed, num_processes = 1, metrics = metrics)
+    jobs = [(input_filename, options) for input_filename in input_filenames]
+    try:
+        if len(jobs) > 1 and num_processes > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(num_processes, len(jobs)))
+            try:
+                file_statistics = pool.map(analyze_file, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            options['num_processes'] = num_processes
+            file_statistics = [analyze_file(job) for job in jobs]
+    except Exception as e:
+        print(('Error: %s' % str(e)))
+        sys.exit(2)
 
+    for input_filename, (x_values, y_values, ids, stats) in zip(input_filenames, file_statistics):
+        print(('\n' + '*'*10 + ' Statistics: %s ' % input_filename +'*'*10))
+        print((format_stats_for_printing(stats)))
+
+    if len(input_filenames) > 1:
+        import numpy
+        print(('\n' + '*'*10 + ' Summary ' +'*'*10))
+        print((format_summary_table(input_filenames, file_statistics)))
+        print(('\n' + '*'*10 + ' Statistics: all files ' +'*'*10))
+        all_x_values = numpy.concatenate([x_values for x_values, y_values, ids, stats in file_statistics])
+        all_y_values = numpy.concatenate([y_values for x_values, y_values, ids, stats in file_statistics])
+        print((format_stats_for_printing(_get_xy_dataset_statistics(all_x_values, all_y_values, bootstrap_samples = bootstrap_samples, random_seed = random_seed, num_processes = num_processes, metrics = metrics))))
+
+    for input_filename, (x_values, y_values, ids, stats) in zip(input_filenames, file_statistics):
+        plot_filename = output_filename
+        if len(input_filenames) > 1:
+            plot_filename = '%s_%s%s' % (os.path.splitext(output_filename)[0], os.path.basename(input_filename).replace('.', '_'), os.path.splitext(output_filename)[1])
+        print(('\nSaving scatterplot to %s.\n' % plot_filename))
+        plot(get_plot_table(x_values, y_values, ids), plot_filename, correlation_coefficient_scatterplotplot)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""\
+Measures the import time of the analysis scripts and checks that importing them does not load the heavy numerical
+libraries (NumPy, pandas, SciPy, matplotlib). These libraries are imported in the functions which use them so that e.g.
+--help or an argument error returns quickly. Each module is imported in a fresh Python process and the fastest of the
+repeats is reported. The exit code is non-zero if a heavy library is loaded or an import is slower than the limit.
+
+Usage:
+    benchmark_imports.py [options]
+
+Options:
+    -n REPEATS --repeats REPEATS
+        The number of times each module is imported. [default: 5]
+
+    --max_seconds SECONDS
+        The maximum allowed import time of each module in seconds. [default: 0.5]
+
+The script also runs run_analysis.py with an invalid argument and checks that the argument error is raised before any
+heavy library is loaded.
+
+Run this script from the root of the repository with:
+    python -m analysis.benchmark_imports
+"""
+
+import sys
+import os
+import subprocess
+import tempfile
+import shutil
+from .libraries import docopt
+
+
+# The libraries which should not be loaded by importing the analysis modules
+heavy_modules = ['numpy', 'pandas', 'scipy', 'matplotlib', 'rpy2']
+
+# The root of the repository
+root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# (module name, directory added to the start of sys.path) pairs for the benchmarked modules
+benchmarked_modules = [
+    ('analysis.stats', root_path),
+    ('analysis.analyze', root_path),
+    ('run_analysis', os.path.join(root_path, 'protocols', 'ddg_monomer_16')),
+]
+
+import_script = '''
+import sys, time
+sys.path.insert(0, %(path)r)
+t = time.time()
+import %(module)s
+t = time.time() - t
+print('%%f %%s' %% (t, ','.join(m for m in %(heavy_modules)r if m in sys.modules)))
+'''
+
+# Runs a script as __main__ with the given arguments and prints the heavy libraries which were loaded when it exited
+run_script = '''
+import sys, runpy
+sys.path.insert(0, %(path)r)
+sys.argv = [%(script)r] + %(script_arguments)r
+try:
+    runpy.run_path(%(script)r, run_name = '__main__')
+except BaseException:
+    pass
+sys.stdout.write('\\nloaded:' + ','.join(m for m in %(heavy_modules)r if m in sys.modules) + '\\n')
+'''
+
+
+def time_import(module, path):
+    '''Imports the module in a new Python process. Returns the import time in seconds and the list of heavy libraries which
+       were loaded.'''
+    script = import_script % dict(module = module, path = path, heavy_modules = heavy_modules)
+    p = subprocess.Popen([sys.executable, '-c', script], stdout = subprocess.PIPE, stderr = subprocess.PIPE, cwd = path)
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        raise Exception('Importing %s failed:\n%s' % (module, stderr.decode('utf-8', 'replace')))
+    tokens = stdout.decode('utf-8').strip().split('\n')[-1].split(' ')
+    return float(tokens[0]), [m for m in (tokens[1:] or [''])[0].split(',') if m]
+
+
+def benchmark_imports(repeats = 5, max_seconds = 0.5):
+    '''Returns a list of (module, fastest import time in seconds, loaded heavy libraries, passed) tuples.'''
+    results = []
+    for module, path in benchmarked_modules:
+        timings, loaded_modules = [], set()
+        for x in range(repeats):
+            t, loaded = time_import(module, path)
+            timings.append(t)
+            loaded_modules = loaded_modules.union(loaded)
+        fastest = min(timings)
+        results.append((module, fastest, sorted(loaded_modules), (not loaded_modules) and fastest <= max_seconds))
+    return results
+
+
+def check_argument_error():
+    '''Runs run_analysis.py with an invalid --take_lowest argument in a new Python process. Returns the list of heavy
+       libraries which were loaded before the script exited.'''
+    path = os.path.join(root_path, 'protocols', 'ddg_monomer_16')
+    output_directory = tempfile.mkdtemp()
+    try:
+        script = run_script % dict(path = path, script = os.path.join(path, 'run_analysis.py'), script_arguments = [output_directory, '--take_lowest', 'abc'], heavy_modules = heavy_modules)
+        p = subprocess.Popen([sys.executable, '-c', script], stdout = subprocess.PIPE, stderr = subprocess.PIPE, cwd = path)
+        stdout, stderr = p.communicate()
+    finally:
+        shutil.rmtree(output_directory)
+    loaded = stdout.decode('utf-8', 'replace').strip().split('\n')[-1]
+    if not loaded.startswith('loaded:'):
+        raise Exception('Running run_analysis.py failed:\n%s' % stderr.decode('utf-8', 'replace'))
+    return [m for m in loaded[len('loaded:'):].split(',') if m]
+
+
+if __name__ == '__main__':
+    try:
+        arguments = docopt.docopt(__doc__.format(**locals()))
+        repeats = int(arguments['--repeats'])
+        max_seconds = float(arguments['--max_seconds'])
+        assert(repeats > 0 and max_seconds > 0)
+    except Exception as e:
+        print('Error: the --repeats argument must be a positive integer and the --max_seconds argument must be a positive number.')
+        sys.exit(1)
+
+    failed = False
+    for module, fastest, loaded_modules, passed in benchmark_imports(repeats = repeats, max_seconds = max_seconds):
+        print('%s %s %0.3fs%s' % (['FAIL', 'ok  '][passed], module.ljust(20), fastest, (loaded_modules and ' (loads %s)' % ', '.join(loaded_modules)) or ''))
+        failed = failed or not passed
+    loaded_modules = check_argument_error()
+    print('%s %s%s' % (['FAIL', 'ok  '][not loaded_modules], 'run_analysis.py --take_lowest abc', (loaded_modules and ' (loads %s)' % ', '.join(loaded_modules)) or ''))
+    failed = failed or bool(loaded_modules)
+    sys.exit(int(failed))
@@ -187,13 +187,13 @@ class Option(ChildPattern):
 
     def __init__(self, short=None, long=None, argcount=0, value=False):
         assert argcount in (0, 1)
-        self.short, self.long = short, int
+        self.short, self.long = short, long
         self.argcount, self.value = argcount, value
         self.value = None if value is False and argcount else value
 
     @classmethod
     def parse(class_, option_description):
-        short, int, argcount, value = None, None, 0, False
+        short, long, argcount, value = None, None, 0, False
         options, _, description = option_description.strip().partition('  ')
         options = options.replace(',', ' ').replace('=', ' ')
         for s in options.split():
@@ -206,7 +206,7 @@ class Option(ChildPattern):
         if argcount:
             matched = re.findall('\[default: (.*)\]', description, flags=re.I)
             value = matched[0] if matched else None
-        return class_(short, int, argcount, value)
+        return class_(short, long, argcount, value)
 
     def single_match(self, left):
         for n, p in enumerate(left):
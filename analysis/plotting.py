@@ -0,0 +1,326 @@
+#!/usr/bin/env python2
+
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+'''
+Native Python versions of the R/ggplot2 plots used by the analysis scripts. These functions render figures with matplotlib
+directly from in-memory data so no intermediate CSV files or external R processes are needed. Figures are created with
+the object-oriented matplotlib API (rather than pyplot) so that no global plotting state is shared between figures.
+
+Scatterplots of more than density_plot_threshold points are rendered as binned densities: the points are counted in a
+fixed grid of bins with NumPy and each non-empty bin is drawn once with an opacity which grows with the (log) number of
+points in it, so the rendering time and the size of the output file do not grow with the number of points. The regression
+lines and the annotations are still computed from all of the points.
+'''
+
+import math
+
+# Plot dimensions, matching the R plots (4096x4096 pixels at 600 dpi)
+plot_size = 4096
+plot_dpi = 600
+
+# ggplot2 text sizes are given in millimetres. This converts them to points.
+ggplot_text_size_to_points = 72.27 / 25.4
+
+# Scatterplots with more points than this are rendered as binned densities
+density_plot_threshold = 20000
+
+# The number of bins along each axis of the binned density plots
+density_plot_bins = 200
+
+# The colors used when no color scale is given, similar to the ggplot2 default hue palette
+default_colors = ['#F8766D', '#CD9600', '#7CAE00', '#00BE67', '#00BFC4', '#00A9FF', '#C77CFF', '#FF61CC', '#999999', '#E58700', '#00BA38', '#619CFF']
+
+
+def create_figure():
+    '''Returns a new (figure, axes) pair rendered with the Agg canvas.'''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize = (plot_size / float(plot_dpi), plot_size / float(plot_dpi)), dpi = plot_dpi, facecolor = 'white')
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    return figure, axes
+
+
+def save_figure(figure, output_filename, filetype = 'png'):
+    if filetype == 'postscript':
+        filetype = 'eps'
+    figure.savefig(output_filename, format = filetype, dpi = plot_dpi, facecolor = 'white')
+    return output_filename
+
+
+def _style_axes(axes, title, xlabel, ylabel):
+    axes.set_title(title, fontsize = 7)
+    axes.set_xlabel(xlabel, fontsize = 6)
+    axes.set_ylabel(ylabel, fontsize = 6)
+    axes.tick_params(labelsize = 5)
+    axes.grid(True, color = '#EBEBEB', linewidth = 0.5)
+    axes.set_axisbelow(True)
+
+
+def regression_coefficients(x_values, y_values):
+    '''Returns the (intercept, slope) of the least-squares regression line and the slope of the least-squares line through
+       the origin, as computed by lm in the R plots.'''
+    import numpy
+    x_values = numpy.asarray(x_values, dtype = float)
+    y_values = numpy.asarray(y_values, dtype = float)
+    slope, intercept = numpy.polyfit(x_values, y_values, 1)
+    return intercept, slope, numpy.dot(x_values, y_values) / numpy.dot(x_values, x_values)
+
+
+def _add_regression_lines(axes, x_values, y_values):
+    '''Adds the least-squares regression line (black) and the least-squares line through the origin (blue) to the axes.'''
+    import numpy
+    intercept, slope, origin_slope = regression_coefficients(x_values, y_values)
+    xlim = numpy.array(axes.get_xlim())
+    axes.plot(xlim, intercept + slope * xlim, color = 'black', linewidth = 0.5)
+    axes.plot(xlim, origin_slope * xlim, color = 'blue', linewidth = 0.5)
+    axes.set_xlim(xlim)
+
+
+def _annotate(axes, x_values, y_values, labels, fontsize, offsets):
+    '''Adds left-aligned text labels near the top-left of the data range as in the R plots.'''
+    minx, maxx = min(x_values), max(x_values)
+    miny, maxy = min(y_values), max(y_values)
+    xpos = minx + ((maxx - minx) * 0.05)
+    for label, offset in zip(labels, offsets):
+        if label:
+            axes.text(xpos, maxy - ((maxy - miny) * offset), label, fontsize = fontsize, horizontalalignment = 'left', verticalalignment = 'center')
+
+
+def use_density_plot(num_points):
+    '''Returns True if a scatterplot of num_points points should be rendered as a binned density.'''
+    return num_points > density_plot_threshold
+
+
+def _bin_indices(values, num_bins):
+    '''Returns the bin of each value in num_bins equal-width bins spanning the values and the bin edges.'''
+    import numpy
+    low, high = values.min(), values.max()
+    if high <= low:
+        low, high = low - 0.5, high + 0.5
+    edges = numpy.linspace(low, high, num_bins + 1)
+    return numpy.clip(((values - low) * (num_bins / (high - low))).astype(int), 0, num_bins - 1), edges
+
+
+def binned_density(x_values, y_values, categories = None, num_categories = 1, weights = None, num_bins = None):
+    '''
+    Counts the points in a grid of num_bins x num_bins bins.
+    :param categories: An optional array with the category index (from 0 to num_categories - 1) of each point. The points of
+                       each category are counted separately.
+    :param weights: An optional array of values. The sum of the values of the points in each bin is also returned.
+    :return: A tuple (counts, sums, xedges, yedges) where counts has the shape (num_bins, num_bins, num_categories) and
+             counts[i, j, c] is the number of points of category c between xedges[i] and xedges[i + 1] and between
+             yedges[j] and yedges[j + 1]. sums has the shape (num_bins, num_bins) or is None if no weights are given.
+    '''
+    import numpy
+    num_bins = num_bins or density_plot_bins
+    x_bins, xedges = _bin_indices(numpy.asarray(x_values, dtype = float), num_bins)
+    y_bins, yedges = _bin_indices(numpy.asarray(y_values, dtype = float), num_bins)
+    bins = x_bins * num_bins + y_bins
+    if categories is None:
+        categories = numpy.zeros(len(bins), dtype = int)
+    counts = numpy.bincount(bins * num_categories + categories, minlength = num_bins * num_bins * num_categories).reshape((num_bins, num_bins, num_categories))
+    sums = None
+    if weights is not None:
+        sums = numpy.bincount(bins, weights = weights, minlength = num_bins * num_bins).reshape((num_bins, num_bins))
+    return counts, sums, xedges, yedges
+
+
+def density_opacity(counts, max_opacity = 1.0, min_opacity = 0.15):
+    '''Returns the opacity of each bin given the number of points in it. The opacity grows with the log of the count from
+       min_opacity for a single point to max_opacity for the fullest bin. Empty bins are transparent.'''
+    import numpy
+    scale = numpy.log1p(counts.max())
+    opacity = min_opacity + (max_opacity - min_opacity) * numpy.log1p(counts) / (scale if scale > 0 else 1.0)
+    return numpy.where(counts > 0, numpy.minimum(opacity, max_opacity), 0.0)
+
+
+def _draw_density(axes, colors, opacity, xedges, yedges):
+    '''Draws the bins as an image. colors is a (num_bins, num_bins, 3) array of RGB values and opacity a (num_bins, num_bins) array.'''
+    import numpy
+    image = numpy.concatenate((colors, opacity[:, :, numpy.newaxis]), axis = 2).transpose((1, 0, 2)) # rows are y bins
+    axes.imshow(image, origin = 'lower', extent = (xedges[0], xedges[-1], yedges[0], yedges[-1]), aspect = 'auto', interpolation = 'nearest')
+
+
+def correlation_coefficient_plot(x_values, y_values, output_filename, filetype = 'png', title = '', xlabel = 'Experimental $\\Delta\\Delta$G (kcal/mol)', ylabel = 'Predicted $\\Delta\\Delta$G'):
+    '''The matplotlib version of RInterface.correlation_coefficient_gplot (ggplot_pearsons.R).'''
+    import numpy
+    x_values = numpy.asarray(x_values, dtype = float)
+    y_values = numpy.asarray(y_values, dtype = float)
+    alpha = dict(pdf = 0.3, png = 0.25).get(filetype, 1.0)
+    rvalue = numpy.corrcoef(y_values, x_values)[0, 1]
+    maevalue = numpy.mean(numpy.abs(x_values - y_values))
+
+    figure, axes = create_figure()
+    if use_density_plot(len(x_values)):
+        counts, sums, xedges, yedges = binned_density(x_values, y_values)
+        counts = counts[:, :, 0]
+        _draw_density(axes, numpy.zeros(counts.shape + (3,)), density_opacity(counts), xedges, yedges)
+    else:
+        axes.scatter(x_values, y_values, s = 4, c = 'black', alpha = alpha, linewidths = 0)
+    _add_regression_lines(axes, x_values, y_values)
+    _annotate(axes, x_values, y_values, ['cor(y,x) = %f' % round(rvalue, 4), 'MAE = %0.4f' % round(maevalue, 4)], 8, [0.015, 0.085])
+    _style_axes(axes, title, xlabel, ylabel)
+    return save_figure(figure, output_filename, filetype)
+
+
+def scatterplot_color_by_series(plot_data, xseries, yseries, colorseries, output_filename, title = '', color_scale = None, point_opacity = 0.4, mae_str = '',
+                                xlabel = 'Experimental (kcal/mol)', ylabel = 'Predictions (energy units)'):
+    '''The matplotlib version of BenchmarkRun.scatterplot_color_by_series.
+    :param plot_data: A pandas dataframe.
+    :param color_scale: None to use the default colors or a dict with optional elements: name (the legend title); values, a
+                        list of (series value, color) pairs; labels, a list of (series value, legend label) pairs; and
+                        gradient, a (low color, high color) pair for continuous series.
+    Above density_plot_threshold points, each bin is drawn in the color of its most common category (or of the mean value
+    of colorseries for a gradient) with an opacity given by density_opacity.
+    '''
+    import numpy
+    x_values = plot_data[xseries].values.astype(float)
+    y_values = plot_data[yseries].values.astype(float)
+    color_scale = color_scale or {}
+    legend_title = color_scale.get('name') or colorseries
+
+    figure, axes = create_figure()
+    density = use_density_plot(len(x_values))
+    if color_scale.get('gradient'):
+        from matplotlib.colors import LinearSegmentedColormap, Normalize, to_rgb
+        from matplotlib.cm import ScalarMappable
+        colormap = LinearSegmentedColormap.from_list(colorseries, list(color_scale['gradient']))
+        color_values = plot_data[colorseries].values.astype(float)
+        has_value = ~numpy.isnan(color_values)
+        if density:
+            # Color the bins by the mean value of the points with a value
+            counts, sums, xedges, yedges = binned_density(x_values, y_values, categories = has_value.astype(int), num_categories = 2, weights = numpy.where(has_value, color_values, 0.0))
+            norm = Normalize(numpy.nanmin(color_values), numpy.nanmax(color_values))
+            with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+                colors = colormap(norm(sums / counts[:, :, 1]))[:, :, :3]
+            colors[counts[:, :, 1] == 0] = to_rgb('#777777')
+            _draw_density(axes, colors, density_opacity(counts.sum(axis = 2), max_opacity = max(point_opacity, 0.6)), xedges, yedges)
+            points = ScalarMappable(norm = norm, cmap = colormap)
+            points.set_array(numpy.zeros(0))
+        else:
+            axes.scatter(x_values[~has_value], y_values[~has_value], s = 4, c = '#777777', alpha = point_opacity, linewidths = 0)
+            points = axes.scatter(x_values[has_value], y_values[has_value], s = 4, c = color_values[has_value], cmap = colormap, alpha = point_opacity, linewidths = 0)
+        colorbar = figure.colorbar(points, ax = axes)
+        colorbar.set_label(legend_title, fontsize = 5)
+        colorbar.ax.tick_params(labelsize = 4)
+    else:
+        categories = plot_data[colorseries].fillna('None').astype(str).values
+        colors = dict(color_scale.get('values', []))
+        labels = dict(color_scale.get('labels', []))
+        ordered_categories = [c for c, color in color_scale.get('values', []) if c in set(categories)] + sorted(set(categories).difference(colors.keys()))
+        default_color_index = 0
+        for category in ordered_categories:
+            if category not in colors:
+                colors[category] = default_colors[default_color_index % len(default_colors)]
+                default_color_index += 1
+            if density:
+                # Only add the legend entry here. The bins are drawn below.
+                axes.scatter([], [], s = 4, c = colors[category], alpha = point_opacity, linewidths = 0, label = labels.get(category, category))
+            else:
+                mask = categories == category
+                axes.scatter(x_values[mask], y_values[mask], s = 4, c = colors[category], alpha = point_opacity, linewidths = 0, label = labels.get(category, category))
+        if density:
+            from matplotlib.colors import to_rgb
+            unique_categories, inverse = numpy.unique(categories, return_inverse = True)
+            category_indices = numpy.array([ordered_categories.index(c) for c in unique_categories])[inverse.ravel()]
+            counts, sums, xedges, yedges = binned_density(x_values, y_values, categories = category_indices, num_categories = len(ordered_categories))
+            palette = numpy.array([to_rgb(colors[category]) for category in ordered_categories])
+            _draw_density(axes, palette[counts.argmax(axis = 2)], density_opacity(counts.sum(axis = 2), max_opacity = max(point_opacity, 0.6)), xedges, yedges)
+        legend = axes.legend(title = legend_title, fontsize = 4, loc = 'center left', bbox_to_anchor = (1.0, 0.5), frameon = False, markerscale = 2)
+        legend.get_title().set_fontsize(5)
+        figure.subplots_adjust(right = 0.75)
+
+    _add_regression_lines(axes, x_values, y_values)
+    rvalue = numpy.corrcoef(y_values, x_values)[0, 1]
+    _annotate(axes, x_values, y_values, ['R = %0.3f' % round(rvalue, 4), mae_str], 4, [0.015, 0.055])
+    _style_axes(axes, title, xlabel, ylabel)
+    return save_figure(figure, output_filename)
+
+
+def histogram(values, output_filename, title = '', xlabel = '', ylabel = 'Number of cases', binwidth = 0.5, edgecolor = 'darkgreen', facecolor = 'green'):
+    '''A histogram of the values with fixed-width bins as created by geom_histogram.'''
+    import numpy
+    values = numpy.asarray(values, dtype = float)
+    values = values[~numpy.isnan(values)]
+    first_bin = math.floor(values.min() / binwidth - 0.5) * binwidth if len(values) else 0.0
+    bins = numpy.arange(first_bin, (values.max() if len(values) else 0.0) + binwidth * 1.5, binwidth)
+
+    figure, axes = create_figure()
+    axes.hist(values, bins = bins, edgecolor = edgecolor, facecolor = facecolor, linewidth = 0.5)
+    _style_axes(axes, title, xlabel, ylabel)
+    return save_figure(figure, output_filename)
+
+
+def barchart(categories, values, output_filename, title = '', xlabel = '', ylabel = '', edgecolor = '#774400', facecolor = '#B22222'):
+    '''A horizontal barchart as created by geom_bar(stat = 'identity') + coord_flip().'''
+    import numpy
+    figure, axes = create_figure()
+    positions = numpy.arange(len(categories))
+    axes.barh(positions, values, color = facecolor, edgecolor = edgecolor, linewidth = 0.5)
+    axes.set_yticks(positions)
+    axes.set_yticklabels(categories)
+    axes.set_ylim(-0.5, len(categories) - 0.5)
+    _style_axes(axes, title, ylabel, xlabel)
+    axes.tick_params(axis = 'y', labelsize = max(1, min(5, 300.0 / max(1, len(categories)))))
+    return save_figure(figure, output_filename)
+
+
+def fraction_correct_cutoff_plot(cutoffs, fraction_correct_values, max_value_cutoff, max_value, output_filename, title = ''):
+    '''The fraction correct metric as a function of the prediction cutoff with the best value highlighted.'''
+    import numpy
+    cutoffs = numpy.asarray(cutoffs, dtype = float)
+    fraction_correct_values = numpy.asarray(fraction_correct_values, dtype = float)
+    best = fraction_correct_values == max_value
+
+    figure, axes = create_figure()
+    axes.plot(cutoffs, fraction_correct_values, color = 'black', linewidth = 0.5)
+    axes.scatter(cutoffs[~best], fraction_correct_values[~best], s = 4, c = '#666666', linewidths = 0)
+    axes.scatter(cutoffs[best], fraction_correct_values[best], s = 4, c = '#00dd00', linewidths = 0)
+    axes.text(6.5, max_value, 'Max = %0.2f\nCutoff = %0.2f' % (max_value, max_value_cutoff), fontsize = 4, horizontalalignment = 'left', verticalalignment = 'center')
+    _style_axes(axes, title, 'Neutrality cutoff (energy units)', 'Fraction correct')
+    return save_figure(figure, output_filename)
+
+
+def line_plot(x_values, y_values, output_filename, title = '', xlabel = '', ylabel = '', labels = None):
+    '''A line plot with points. The labels are drawn at the top-left of the plot.'''
+    labels = labels or []
+    figure, axes = create_figure()
+    axes.plot(x_values, y_values, color = 'black', linewidth = 0.5, marker = 'o', markersize = 1.5)
+    max_y = max(y_values)
+    for x in range(len(labels)):
+        axes.text(min(x_values), max_y - (0.5 * x), labels[x], fontsize = 4, horizontalalignment = 'left', verticalalignment = 'center')
+    _style_axes(axes, title, xlabel, ylabel)
+    return save_figure(figure, output_filename)
+
+
+def section_slide(output_filename, title, subtitle = '', footer = '', extra = '', title_size = 16, subtitle_size = 16, footer_size = 6):
+    '''A text-only slide used to separate sections in the generated PDF.'''
+    figure, axes = create_figure()
+    axes.set_xlim(0, 100)
+    axes.set_ylim(0, 100)
+    axes.set_axis_off()
+    for text, y, size, style, weight in ((title, 90, title_size, 'normal', 'normal'), (subtitle, 50, subtitle_size, 'normal', 'normal'), (footer, 5, footer_size, 'italic', 'normal'), (extra, 20, footer_size, 'normal', 'bold')):
+        if text:
+            axes.text(5, y, text, fontsize = size * ggplot_text_size_to_points * 0.5, family = 'serif', style = style, weight = weight, horizontalalignment = 'left', verticalalignment = 'top')
+    return save_figure(figure, output_filename)
+
@@ -32,6 +32,8 @@ import subprocess
 import traceback
 import inspect
 import gzip
+import atexit
+import threading
 
 
 def _id(x): pass
@@ -80,18 +82,140 @@ def prompt_yn(q):
         answer = sys.stdin.readline().upper().strip()
     return answer == 'Y'
 
+class RServer(object):
+    '''A long-lived R process which renders a queue of R scripts sent to it over a pipe. The common plotting libraries are
+       loaded once when the server starts rather than once per script. Scripts are sourced in order with top-level values
+       printed, as with R CMD BATCH, and the server reports the status of each job on its standard output.'''
+
+    done_token = '__RSERVER_JOB_DONE__'
+    libraries = ['ggplot2', 'gridExtra', 'scales', 'qualV']
+    bootstrap_script = '''
+for (library_name in c(%(libraries)s)) {
+    suppressWarnings(suppressPackageStartupMessages(require(library_name, character.only = TRUE, quietly = TRUE)))
+}
+server_input <- file('stdin', 'r')
+while (length(server_job <- readLines(server_input, n = 1)) > 0) {
+    server_job <- strsplit(server_job, '\\t', fixed = TRUE)[[1]]
+    server_status <- tryCatch({
+        source(server_job[2], local = new.env(), echo = FALSE, print.eval = TRUE)
+        'OK'
+    }, error = function(e) paste('ERROR', gsub('[\\r\\n]+', ' ', conditionMessage(e))))
+    graphics.off()
+    cat(sprintf('\\n%(done_token)s %%s %%s\\n', server_job[1], server_status))
+    flush(stdout())
+}
+'''
+
+
+    def __init__(self):
+        bootstrap_script = RServer.bootstrap_script % dict(libraries = ', '.join(["'%s'" % l for l in RServer.libraries]), done_token = RServer.done_token)
+        self.process = subprocess.Popen(['Rscript', '--vanilla', '-e', bootstrap_script], stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+        self.job_counter = 0
+        self.pending_jobs = []
+        self.completed_jobs = {}
+
+
+    def is_alive(self):
+        return self.process.poll() == None
+
+
+    def submit(self, rscriptname):
+        '''Adds the R script file to the server queue and returns a job ID which can be passed to wait.'''
+        self.job_counter += 1
+        job_id = self.job_counter
+        self.process.stdin.write('%d\t%s\n' % (job_id, os.path.abspath(rscriptname)))
+        self.process.stdin.flush()
+        self.pending_jobs.append(job_id)
+        return job_id
+
+
+    def wait(self, job_id):
+        '''Blocks until the job has been run. Returns a pair (success, output) where output is the R output for the job.'''
+        while job_id not in self.completed_jobs:
+            assert(self.pending_jobs)
+            output = []
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise Exception('The R server process terminated unexpectedly.')
+                if line.startswith(RServer.done_token):
+                    tokens = line.strip().split(' ', 2)
+                    assert(int(tokens[1]) == self.pending_jobs[0])
+                    self.completed_jobs[self.pending_jobs.pop(0)] = (tokens[2] == 'OK', ''.join(output) + tokens[2] + '\n')
+                    break
+                output.append(line)
+        return self.completed_jobs.pop(job_id)
+
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait()
+            except:
+                self.process.kill()
+
+
 class RInterface(object):
 
+    # When set, R scripts are run using persistent R servers rather than a new R CMD BATCH process per script. One server
+    # is started for each thread that runs R scripts concurrently and idle servers are reused.
+    use_server = True
+    idle_servers = []
+    server_lock = threading.Lock()
+
+
+    @staticmethod
+    def acquire_server():
+        '''Returns an idle R server, starting a new one if all servers are busy. Returns None if a server could not be started.'''
+        with RInterface.server_lock:
+            while RInterface.idle_servers:
+                server = RInterface.idle_servers.pop()
+                if server.is_alive():
+                    return server
+        try:
+            server = RServer()
+            atexit.register(server.close)
+            return server
+        except OSError:
+            RInterface.use_server = False
+            return None
+
+
+    @staticmethod
+    def release_server(server):
+        with RInterface.server_lock:
+            RInterface.idle_servers.append(server)
+
+
     @staticmethod
     def _runRScript(RScript):
+        if RInterface.use_server:
+            server = RInterface.acquire_server()
+            if server:
+                rscriptname = write_temp_file(".", RScript)
+                try:
+                    success, rout_contents = server.wait(server.submit(rscriptname))
+                    RInterface.release_server(server)
+                except Exception as e:
+                    # Fall back to the one-shot path if the server has died
+                    server.close()
+                    success, rout_contents = None, None
+                delete_file(rscriptname)
+                if success == False:
+                    print(rout_contents)
+                    raise Exception('The R script failed: %s' % rout_contents.strip().split('\n')[-1])
+                elif success:
+                    return rout_contents
+        return RInterface._runRScriptBatch(RScript)
+
+
+    @staticmethod
+    def _runRScriptBatch(RScript):
         rscriptname = write_temp_file(".", RScript)
         #p = subprocess.Popen(["/opt/R-2.15.1/bin/R","CMD", "BATCH", rscriptname])
         p = subprocess.Popen(["R", "CMD", "BATCH", rscriptname])
-        while True:
-            time.sleep(0.3)
-            errcode = p.poll()
-            if errcode != None:
-                break
+        errcode = p.wait()
         rout = "%s.Rout" % rscriptname
         delete_file(rscriptname)
 
@@ -107,7 +231,7 @@ class RInterface(object):
 
 
     @staticmethod
-    def correlation_coefficient_gplot(inputfname, output_filename, filetype, experiment_field = "Experimental", title = ''):
+    def correlation_coefficient_gplot(inputfname, output_filename, filetype, experiment_field = "Experimental", title = '', predicted_field = "Predicted"):
         '''File suffix: pearsons_r_gplot
            Description: Pearson's r
            Filename: ggplot_pearsons.R
@@ -117,6 +241,73 @@ class RInterface(object):
         return RInterface._runRScript(RScript)
 
 
+    @staticmethod
+    def correlation_coefficient_density_gplot(inputfname, output_filename, filetype, bin_width, bin_height, intercept, slope, origin_slope, rvalue, maevalue, minx, maxx, miny, maxy, title = ''):
+        '''File suffix: pearsons_r_density_gplot
+           Description: Pearson's r (binned density)
+           Filename: ggplot_pearsons_density.R
+           Priority: 1
+           '''
+        RScript = read_file(os.path.join(script_path, "ggplot_pearsons_density.R")) % vars()
+        return RInterface._runRScript(RScript)
+
+
+# The backend used to render plots. 'R' uses the R scripts via RInterface and 'matplotlib' renders the plots in-process
+# using the functions in plotting.py
+plot_backends = ['R', 'matplotlib']
+plot_backend = 'R'
+
+
+def set_plot_backend(backend):
+    global plot_backend
+    if backend not in plot_backends:
+        raise Exception('The plot backend must be one of: %s.' % ', '.join(plot_backends))
+    plot_backend = backend
+
+
+def plot_density_R(x_values, y_values, output_filename, filetype, title = ''):
+    '''Renders the binned density version of RInterface.correlation_coefficient_gplot for large data sets. The points are
+       binned with NumPy so that only the non-empty bins are written to the CSV file read by R.'''
+    import numpy
+    from . import plotting
+    x_values, y_values = numpy.asarray(x_values, dtype = float), numpy.asarray(y_values, dtype = float)
+    counts, sums, xedges, yedges = plotting.binned_density(x_values, y_values)
+    counts = counts[:, :, 0]
+    opacity = plotting.density_opacity(counts)
+    x_bins, y_bins = numpy.nonzero(counts)
+    x_centers, y_centers = (xedges[:-1] + xedges[1:]) / 2.0, (yedges[:-1] + yedges[1:]) / 2.0
+    contents = '\n'.join(['X,Y,Opacity'] + ['%r,%r,%0.4f' % (x, y, o) for x, y, o in zip(x_centers[x_bins].tolist(), y_centers[y_bins].tolist(), opacity[x_bins, y_bins].tolist())])
+    input_filename = write_temp_file('.', contents)
+    intercept, slope, origin_slope = plotting.regression_coefficients(x_values, y_values)
+    try:
+        RInterface.correlation_coefficient_density_gplot(input_filename, output_filename, filetype, xedges[1] - xedges[0], yedges[1] - yedges[0], intercept, slope, origin_slope,
+                                                         numpy.corrcoef(y_values, x_values)[0, 1], numpy.mean(numpy.abs(x_values - y_values)),
+                                                         x_values.min(), x_values.max(), y_values.min(), y_values.max(), title = title)
+    finally:
+        delete_file(input_filename)
+    return output_filename
+
+
+def get_density_plot_function(RFunction):
+    '''Returns the function which renders the binned density version of an RInterface function or None if there is none.'''
+    density_functions = dict(
+        correlation_coefficient_gplot = plot_density_R,
+    )
+    return density_functions.get(RFunction.__name__)
+
+
+def get_native_plot_function(RFunction):
+    '''Returns the matplotlib function corresponding to an RInterface function.'''
+    from . import plotting
+    native_functions = dict(
+        correlation_coefficient_gplot = plotting.correlation_coefficient_plot,
+    )
+    try:
+        return native_functions[RFunction.__name__]
+    except KeyError:
+        raise Exception('There is no native plotting function corresponding to %s.' % RFunction.__name__)
+
+
 def create_csv(analysis_table):
     contents = '\n'.join(['DatasetID,Experimental,Predicted'] + ['%s,%s,%s' % (str(l['DatasetID']), str(l['Experimental']), str(l['Predicted'])) for l in analysis_table])
     return write_temp_file('.', contents)
@@ -137,6 +328,107 @@ def get_ranks(values):
     return ranks
 
 
+def _count_tied_pairs(sorted_values):
+    '''Returns the number of pairs of equal values in a sorted list.'''
+    num_tied_pairs = 0
+    run_length = 1
+    for i in range(1, len(sorted_values)):
+        if sorted_values[i] == sorted_values[i - 1]:
+            run_length += 1
+        else:
+            num_tied_pairs += run_length * (run_length - 1) // 2
+            run_length = 1
+    return num_tied_pairs + run_length * (run_length - 1) // 2
+
+
+def _merge_sort_swaps(values):
+    '''
+    Sorts values with a bottom-up merge sort and counts the swaps (pairs i < j with values[i] > values[j]) on the way.
+    Equal values are not counted as swaps.
+    :param values: a list of values
+    :return: a pair (sorted list, number of swaps)
+    '''
+    num_items = len(values)
+    values = list(values)
+    buffer = [None] * num_items
+    num_swaps = 0
+    width = 1
+    while width < num_items:
+        for left in range(0, num_items, 2 * width):
+            middle = min(left + width, num_items)
+            right = min(left + 2 * width, num_items)
+            i, j, k = left, middle, left
+            while i < middle and j < right:
+                if values[j] < values[i]:
+                    buffer[k] = values[j]
+                    num_swaps += middle - i
+                    j += 1
+                else:
+                    buffer[k] = values[i]
+                    i += 1
+                k += 1
+            while i < middle:
+                buffer[k] = values[i]
+                i += 1
+                k += 1
+            while j < right:
+                buffer[k] = values[j]
+                j += 1
+                k += 1
+        values, buffer = buffer, values
+        width *= 2
+    return values, num_swaps
+
+
+def concordance_counts(values_list1, values_list2):
+    '''
+    Counts the concordant, discordant, and tied pairs of two lists of values in O(n log n) time using Knight's algorithm
+    (sort by the first list, then count the swaps needed to merge-sort the second list).
+    :param values_list1: a list of values (or ranks)
+    :param values_list2: a second list of values (or ranks) of equal length with corresponding entries
+    :return: a dict with the number of concordant pairs, discordant pairs, pairs tied only in the first list (tied_x),
+             pairs tied only in the second list (tied_y), and pairs tied in both lists (tied_xy)
+    '''
+    num_items = len(values_list1)
+    assert(num_items == len(values_list2))
+    pairs = sorted(zip(values_list1, values_list2))
+    num_pairs = num_items * (num_items - 1) // 2
+
+    # Pairs tied in the first list (including joint ties) and pairs tied in both lists
+    num_tied_x_all = _count_tied_pairs([p[0] for p in pairs])
+    num_tied_xy = _count_tied_pairs(pairs)
+
+    # Pairs tied in the first list are already ordered by the second list so they never contribute swaps
+    sorted_values_list2, num_discordant_pairs = _merge_sort_swaps([p[1] for p in pairs])
+    num_tied_y_all = _count_tied_pairs(sorted_values_list2)
+
+    return dict(
+        concordant = num_pairs - num_tied_x_all - num_tied_y_all + num_tied_xy - num_discordant_pairs,
+        discordant = num_discordant_pairs,
+        tied_x = num_tied_x_all - num_tied_xy,
+        tied_y = num_tied_y_all - num_tied_xy,
+        tied_xy = num_tied_xy,
+    )
+
+
+def gamma_from_counts(counts):
+    '''Goodman and Kruskal's gamma correlation coefficient computed from the output of concordance_counts.'''
+    try:
+        return float(counts['concordant'] - counts['discordant']) / float(counts['concordant'] + counts['discordant'])
+    except ZeroDivisionError:
+        return 'n/a'
+
+
+def kendall_tau_b_from_counts(counts):
+    '''Kendall's tau-b rank correlation coefficient (adjusted for ties) computed from the output of concordance_counts.'''
+    num_untied_x = counts['concordant'] + counts['discordant'] + counts['tied_y']
+    num_untied_y = counts['concordant'] + counts['discordant'] + counts['tied_x']
+    try:
+        return float(counts['concordant'] - counts['discordant']) / math.sqrt(float(num_untied_x) * float(num_untied_y))
+    except ZeroDivisionError:
+        return 'n/a'
+
+
 def gamma(ranks_list1, ranks_list2):
     '''
     Goodman and Kruskal's gamma correlation coefficient
@@ -144,33 +436,8 @@ def gamma(ranks_list1, ranks_list2):
     :param ranks_list2: a second list of ranks (integers) of equal length with corresponding entries
     :return: Gamma correlation coefficient (rank correlation ignoring ties)
     '''
-    num_concordant_pairs = 0
-    num_discordant_pairs = 0
-    num_tied_x = 0
-    num_tied_y = 0
-    num_tied_xy = 0
-    num_items = len(ranks_list1)
-    for i in range(num_items):
-        rank_1 = ranks_list1[i]
-        rank_2 = ranks_list2[i]
-        for j in range(i + 1, num_items):
-            diff1 = ranks_list1[j] - rank_1
-            diff2 = ranks_list2[j] - rank_2
-            if (diff1 > 0 and diff2 > 0) or (diff1 < 0 and diff2 < 0):
-                num_concordant_pairs += 1
-            elif (diff1 > 0 and diff2 < 0) or (diff1 < 0 and diff2 > 0):
-                num_discordant_pairs += 1
-            elif diff1 == 0 and diff2 == 0:
-                num_tied_xy += 1
-            elif diff1 == 0:
-                num_tied_x += 1
-            elif diff2 == 0:
-                num_tied_y += 1
-    try:
-        gamma_corr_coeff = float(num_concordant_pairs - num_discordant_pairs)/float(num_concordant_pairs + num_discordant_pairs)
-    except:
-        gamma_corr_coeff = 'n/a'
-    return [num_tied_x, num_tied_y, num_tied_xy, gamma_corr_coeff]
+    counts = concordance_counts(ranks_list1, ranks_list2)
+    return [counts['tied_x'], counts['tied_y'], counts['tied_xy'], gamma_from_counts(counts)]
 
 
 def gamma_CC(values_list1, values_list2):
@@ -180,17 +447,53 @@ def gamma_CC(values_list1, values_list2):
     :param values_list2: a second list of values of equal length with corresponding entries
     :return: Gamma correlation coefficient (rank correlation ignoring ties)
     '''
-    ranks1 = get_ranks(values_list1)
-    ranks_list1 = []
-    for value in values_list1:
-        rank = ranks1[value]
-        ranks_list1.append(rank)
-    ranks2 = get_ranks(values_list2)
-    ranks_list2 = []
-    for value in values_list2:
-        rank = ranks2[value]
-        ranks_list2.append(rank)
-    return gamma(ranks_list1, ranks_list2)[3]
+    # The coefficient only depends on the relative order of the values so we do not need to convert them into ranks
+    return gamma_from_counts(concordance_counts(values_list1, values_list2))
+
+
+def kendall_tau_b(values_list1, values_list2):
+    '''
+    Kendall's tau-b rank correlation coefficient
+    :param values_list1: a list of values
+    :param values_list2: a second list of values of equal length with corresponding entries
+    :return: Kendall's tau-b (rank correlation adjusted for ties)
+    '''
+    return kendall_tau_b_from_counts(concordance_counts(values_list1, values_list2))
+
+
+def gamma_and_kendall_tau_b(values_list1, values_list2):
+    '''
+    Computes Goodman and Kruskal's gamma and Kendall's tau-b from a single count of the concordant and discordant pairs.
+    :param values_list1: a list of values
+    :param values_list2: a second list of values of equal length with corresponding entries
+    :return: a pair (gamma correlation coefficient, Kendall's tau-b)
+    '''
+    counts = concordance_counts(values_list1, values_list2)
+    return gamma_from_counts(counts), kendall_tau_b_from_counts(counts)
+
+
+def fraction_correct_values_array(x_values, y_values, x_cutoff = 1.0, y_cutoff = 1.0):
+    '''
+    Classifies every (x, y) pair at once: an entry of the returned array is 1.0 if both values are positive, both are
+    negative, or both are neutral w.r.t. their cutoffs and 0.0 otherwise.
+    :param x_values: A NumPy array, pandas Series, or list of X-axis (experimental) values.
+    :param y_values: A NumPy array, pandas Series, or list of Y-axis (predicted) values.
+    :return: A NumPy array of floats.
+    '''
+    import numpy
+    x_values = numpy.asarray(x_values, dtype = float)
+    y_values = numpy.asarray(y_values, dtype = float)
+    assert(x_values.shape == y_values.shape)
+    both_positive = (x_values >= x_cutoff) & (y_values >= y_cutoff)
+    both_negative = (x_values <= -x_cutoff) & (y_values <= -y_cutoff)
+    both_neutral = (numpy.abs(x_values) < x_cutoff) & (numpy.abs(y_values) < y_cutoff)
+    return (both_positive | both_negative | both_neutral).astype(float)
+
+
+def fraction_correct_array(x_values, y_values, x_cutoff = 1.0, y_cutoff = 1.0):
+    '''A version of fraction_correct which operates on NumPy arrays or pandas Series.'''
+    correct = fraction_correct_values_array(x_values, y_values, x_cutoff = x_cutoff, y_cutoff = y_cutoff)
+    return correct.sum() / float(len(correct))
 
 
 def fraction_correct_values(indices, x_values, y_values, x_cutoff = 1.0, y_cutoff = 1.0):
@@ -199,20 +502,7 @@ def fraction_correct_values(indices, x_values, y_values, x_cutoff = 1.0, y_cutof
     '''
     num_points = len(indices)
     assert(num_points == len(x_values) == len(y_values))
-    correct = []
-    for i in range(num_points):
-        index = indices[i]
-        x = x_values[i]
-        y = y_values[i]
-        if (x >= x_cutoff) and (y >= y_cutoff): # both positive
-            correct.append(1.0)
-        elif (x <= -x_cutoff) and (y <= -y_cutoff): # both negative
-            correct.append(1.0)
-        elif (-x_cutoff < x < x_cutoff) and (-y_cutoff < y < y_cutoff): # both neutral
-            correct.append(1.0)
-        else:
-            correct.append(0.0)
-    return correct
+    return fraction_correct_values_array(x_values, y_values, x_cutoff = x_cutoff, y_cutoff = y_cutoff).tolist()
 
 
 def fraction_correct(x_values, y_values, x_cutoff = 1.0, y_cutoff = 1.0):
@@ -221,51 +511,130 @@ def fraction_correct(x_values, y_values, x_cutoff = 1.0, y_cutoff = 1.0):
     '''
     num_points = len(x_values)
     assert(num_points == len(y_values))
-    correct = 0.0
-    for i in range(num_points):
-        x = x_values[i]
-        y = y_values[i]
-        if (x >= x_cutoff) and (y >= y_cutoff): # both positive
-            correct += 1.0
-        elif (x <= -x_cutoff) and (y <= -y_cutoff): # both negative
-            correct += 1.0
-        elif (-x_cutoff < x < x_cutoff) and (-y_cutoff < y < y_cutoff): # both neutral
-            correct += 1.0
-    return correct / float(num_points)
+    return fraction_correct_array(x_values, y_values, x_cutoff = x_cutoff, y_cutoff = y_cutoff)
 
 
 def fraction_correct_pandas(dataframe, x_series, y_series, x_cutoff = 1.0, y_cutoff = 1.0):
-    '''A little (<6%) slower than fraction_correct due to the data extraction overhead.'''
-    return fraction_correct(dataframe[x_series].values.tolist(), dataframe[y_series].values.tolist(), x_cutoff = x_cutoff, y_cutoff = y_cutoff)
+    '''A version of fraction_correct which reads the X and Y values directly from the dataframe columns.'''
+    return fraction_correct_array(dataframe[x_series].values, dataframe[y_series].values, x_cutoff = x_cutoff, y_cutoff = y_cutoff)
 
 
 def add_fraction_correct_values_to_dataframe(dataframe, x_series, y_series, new_label, x_cutoff = 1.0, y_cutoff = 1.0):
     '''Adds a new column (new_label) to the dataframe with the fraction correct computed over X and Y values.'''
-    new_series_values = fraction_correct_values(dataframe.index.values.tolist(), dataframe[x_series].values.tolist(), dataframe[y_series].values.tolist(), x_cutoff = x_cutoff, y_cutoff = y_cutoff)
+    new_series_values = fraction_correct_values_array(dataframe[x_series].values, dataframe[y_series].values, x_cutoff = x_cutoff, y_cutoff = y_cutoff)
     dataframe.insert(len(dataframe.columns), new_label, new_series_values)
 
 
-def fraction_correct_fuzzy_linear_create_vector(z, z_cutoff, z_fuzzy_range):
-    '''A helper function for fraction_correct_fuzzy_linear.'''
+def fraction_correct_cutoff_surface(x_values, y_values, x_cutoffs, min_y_cutoff = 0.0, max_y_cutoff = None):
+    '''
+    Computes the fraction correct metric as a function of the (symmetric) Y-axis cutoff for each of a list of X-axis
+    cutoffs. For a fixed X-axis cutoff, the metric is a step function of the Y-axis cutoff which can only change at the
+    absolute Y-values (breakpoints) so, rather than sampling a grid of cutoffs, we evaluate it exactly at every distinct
+    breakpoint in [min_y_cutoff, max_y_cutoff] (and at both ends of that range). The Y-values are sorted once and all
+    cutoffs are then evaluated with binary searches.
+    :param x_values: A NumPy array, pandas Series, or list of X-axis (experimental) values.
+    :param y_values: A NumPy array, pandas Series, or list of Y-axis (predicted) values.
+    :param x_cutoffs: A list of X-axis cutoffs.
+    :param min_y_cutoff: The lowest Y-axis cutoff to consider.
+    :param max_y_cutoff: The highest Y-axis cutoff to consider. This defaults to the largest absolute Y-value.
+    :return: A list with one (y_cutoffs, fraction_correct_values) pair of NumPy arrays per X-axis cutoff.
+    '''
+    import numpy
+    x_values = numpy.asarray(x_values, dtype = float)
+    y_values = numpy.asarray(y_values, dtype = float)
+    num_points = len(x_values)
+    assert(num_points == len(y_values) and num_points > 0)
+
+    # Determine the Y-axis cutoffs to evaluate
+    breakpoints = numpy.unique(numpy.abs(y_values))
+    if max_y_cutoff == None:
+        max_y_cutoff = max(breakpoints[-1], min_y_cutoff)
+    assert(min_y_cutoff <= max_y_cutoff)
+    y_cutoffs = numpy.unique(numpy.concatenate(([min_y_cutoff], breakpoints[(breakpoints > min_y_cutoff) & (breakpoints < max_y_cutoff)], [max_y_cutoff])))
+
+    # Sort once. The negated Y-values of negative cases and the absolute Y-values of neutral cases are derived from these orders
+    y_order = numpy.argsort(y_values, kind = 'mergesort')
+    abs_y_order = numpy.argsort(numpy.abs(y_values), kind = 'mergesort')
+    x_by_y, y_sorted = x_values[y_order], y_values[y_order]
+    x_by_abs_y, abs_y_sorted = x_values[abs_y_order], numpy.abs(y_values)[abs_y_order]
+
+    surface = []
+    for x_cutoff in x_cutoffs:
+        # Positive cases are correct when y >= y_cutoff, negative cases when -y >= y_cutoff, and neutral cases when |y| < y_cutoff
+        positive_y = y_sorted[x_by_y >= x_cutoff]
+        negative_y = -(y_sorted[x_by_y <= -x_cutoff][::-1])
+        neutral_y = abs_y_sorted[numpy.abs(x_by_abs_y) < x_cutoff]
+        num_correct = (len(positive_y) - numpy.searchsorted(positive_y, y_cutoffs, side = 'left')) + \
+                      (len(negative_y) - numpy.searchsorted(negative_y, y_cutoffs, side = 'left')) + \
+                      numpy.searchsorted(neutral_y, y_cutoffs, side = 'left')
+        surface.append((y_cutoffs, num_correct / float(num_points)))
+    return surface
+
+
+def fraction_correct_cutoff_curve(x_values, y_values, x_cutoff = 1.0, min_y_cutoff = 0.0, max_y_cutoff = None):
+    '''
+    Computes the fraction correct metric as a function of the Y-axis cutoff for a fixed X-axis cutoff. See fraction_correct_cutoff_surface.
+    :return: A (y_cutoffs, fraction_correct_values) pair of NumPy arrays.
+    '''
+    return fraction_correct_cutoff_surface(x_values, y_values, [x_cutoff], min_y_cutoff = min_y_cutoff, max_y_cutoff = max_y_cutoff)[0]
+
+
+def optimum_fraction_correct_cutoff(y_cutoffs, fraction_correct_values):
+    '''
+    Returns the Y-axis cutoff which maximizes the fraction correct metric given a curve computed by fraction_correct_cutoff_curve.
+    In case of multiple maxima, the lowest cutoff is chosen.
+    :return: A (y_cutoff, fraction_correct) pair.
+    '''
+    import numpy
+    best_index = int(numpy.argmax(fraction_correct_values))
+    return float(y_cutoffs[best_index]), float(fraction_correct_values[best_index])
+
+
+def fraction_correct_fuzzy_linear_create_matrix(z_values, z_cutoff, z_fuzzy_range):
+    '''
+    A helper function for fraction_correct_fuzzy_linear_array. Returns an n x 3 matrix whose rows are the normalized
+    (negative, neutral, positive) classification vectors of the n values.
+    '''
     import numpy
     assert(z_fuzzy_range * 2 < z_cutoff)
-    if (z >= z_cutoff + z_fuzzy_range): # positive e.g. z >= 1.1
-        return [0, 0, 1]
-    elif (z <= -z_cutoff - z_fuzzy_range):  # negative e.g. z <= -1.1
-        return [1, 0, 0]
-    elif (-z_cutoff + z_fuzzy_range <= z <= z_cutoff - z_fuzzy_range): # neutral e.g. -0.9 <= z <= 0.9
-        return [0, 1, 0]
-    elif (-z_cutoff - z_fuzzy_range < z < -z_cutoff + z_fuzzy_range): # negative/neutral e.g. -1.1 < z < 0.9
-        neutrality = (z + z_cutoff + z_fuzzy_range) / (z_fuzzy_range * 2)
-        zvec = [1 - neutrality, neutrality, 0]
-    elif (z_cutoff - z_fuzzy_range < z < z_cutoff + z_fuzzy_range): # neutral/positive e.g. 0.9 < z < 1.1
-        positivity = (z - z_cutoff + z_fuzzy_range) / (z_fuzzy_range * 2)
-        zvec = [0, 1 - positivity, positivity]
-    else:
+    z_values = numpy.asarray(z_values, dtype = float)
+    positive = z_values >= z_cutoff + z_fuzzy_range # e.g. z >= 1.1
+    negative = z_values <= -z_cutoff - z_fuzzy_range # e.g. z <= -1.1
+    neutral = (-z_cutoff + z_fuzzy_range <= z_values) & (z_values <= z_cutoff - z_fuzzy_range) # e.g. -0.9 <= z <= 0.9
+    negative_neutral = (-z_cutoff - z_fuzzy_range < z_values) & (z_values < -z_cutoff + z_fuzzy_range) # e.g. -1.1 < z < 0.9
+    neutral_positive = (z_cutoff - z_fuzzy_range < z_values) & (z_values < z_cutoff + z_fuzzy_range) # e.g. 0.9 < z < 1.1
+    if not numpy.all(positive | negative | neutral | negative_neutral | neutral_positive):
         raise Exception('Logical error.')
-    # normalize the vector
-    length = math.sqrt(numpy.dot(zvec, zvec))
-    return numpy.divide(zvec, length)
+
+    zmat = numpy.zeros((len(z_values), 3))
+    zmat[negative, 0] = 1.0
+    zmat[neutral, 1] = 1.0
+    zmat[positive, 2] = 1.0
+    neutrality = (z_values[negative_neutral] + z_cutoff + z_fuzzy_range) / (z_fuzzy_range * 2)
+    zmat[negative_neutral, 0] = 1.0 - neutrality
+    zmat[negative_neutral, 1] = neutrality
+    positivity = (z_values[neutral_positive] - z_cutoff + z_fuzzy_range) / (z_fuzzy_range * 2)
+    zmat[neutral_positive, 1] = 1.0 - positivity
+    zmat[neutral_positive, 2] = positivity
+
+    # normalize the vectors
+    return zmat / numpy.sqrt((zmat * zmat).sum(axis = 1))[:, numpy.newaxis]
+
+
+def fraction_correct_fuzzy_linear_create_vector(z, z_cutoff, z_fuzzy_range):
+    '''A helper function for fraction_correct_fuzzy_linear.'''
+    return fraction_correct_fuzzy_linear_create_matrix([z], z_cutoff, z_fuzzy_range)[0]
+
+
+def fraction_correct_fuzzy_linear_array(x_values, y_values, x_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
+    '''A version of fraction_correct_fuzzy_linear which operates on NumPy arrays or pandas Series.'''
+    num_points = len(x_values)
+    assert(num_points == len(y_values))
+    y_cutoff = x_cutoff * y_scalar
+    y_fuzzy_range = x_fuzzy_range * y_scalar
+    xmat = fraction_correct_fuzzy_linear_create_matrix(x_values, x_cutoff, x_fuzzy_range)
+    ymat = fraction_correct_fuzzy_linear_create_matrix(y_values, y_cutoff, y_fuzzy_range)
+    return (xmat * ymat).sum() / float(num_points)
 
 
 def fraction_correct_fuzzy_linear(x_values, y_values, x_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
@@ -281,20 +650,8 @@ def fraction_correct_fuzzy_linear(x_values, y_values, x_cutoff = 1.0, x_fuzzy_ra
             \/      \/
             /\      /\
        ----/  \----/  \----
-    ''' 
-    import numpy
-    num_points = len(x_values)
-    assert(num_points == len(y_values))
-    correct = 0.0
-    for i in range(num_points):
-        x = x_values[i]
-        y = y_values[i]
-        y_cutoff = x_cutoff * y_scalar
-        y_fuzzy_range = x_fuzzy_range * y_scalar
-        xvec = fraction_correct_fuzzy_linear_create_vector(x, x_cutoff, x_fuzzy_range)
-        yvec = fraction_correct_fuzzy_linear_create_vector(y, y_cutoff, y_fuzzy_range)
-        correct += numpy.dot(xvec, yvec)
-    return correct / float(num_points)
+    '''
+    return fraction_correct_fuzzy_linear_array(x_values, y_values, x_cutoff = x_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar)
 
 
 def mae(x_values, y_values):
@@ -305,7 +662,102 @@ def mae(x_values, y_values):
     return numpy.sum(numpy.apply_along_axis(numpy.abs, 0, numpy.subtract(x_values, y_values))) / float(num_points)
 
 
-def _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
+###
+#  Metric registry
+###
+
+
+class MetricContext(object):
+    '''
+    Holds the X- and Y-values and the options of one metric computation. The intermediate values shared by several metrics
+    (e.g. the ranks of the values or the concordance counts) are computed on first use and then reused so that only the
+    intermediates of the requested metrics are computed.
+    '''
+
+    def __init__(self, x_values, y_values, **options):
+        self.x_values, self.y_values = x_values, y_values
+        self.options = options
+        self.intermediates = {}
+
+    def __getitem__(self, name):
+        if name not in self.intermediates:
+            if name not in intermediate_registry:
+                raise Exception('Unknown intermediate value "%s".' % name)
+            self.intermediates[name] = intermediate_registry[name](self)
+        return self.intermediates[name]
+
+
+# Functions which compute the intermediate values from a MetricContext. They may use other intermediates.
+intermediate_registry = {}
+
+# Each metric maps to a (function of a MetricContext, list of required intermediates) pair. The metrics are computed in
+# the order that they were registered.
+metric_registry = {}
+metric_order = []
+
+
+def register_intermediate(name, function):
+    '''Registers a function which takes a MetricContext and returns an intermediate value shared by several metrics.'''
+    intermediate_registry[name] = function
+
+
+def register_metric(name, function, dependencies = []):
+    '''
+    Registers a metric for _get_xy_dataset_statistics.
+    :param name: The key of the metric in the table of statistics.
+    :param function: A function which takes a MetricContext and returns the value of the metric.
+    :param dependencies: The names of the intermediates used by the metric (see register_intermediate). The values are
+                         computed on first use in any case; the list documents which intermediates a metric shares.
+    '''
+    for dependency in dependencies:
+        if dependency not in intermediate_registry:
+            raise Exception('The metric "%s" depends on the unknown intermediate value "%s".' % (name, dependency))
+    if name not in metric_registry:
+        metric_order.append(name)
+    metric_registry[name] = (function, list(dependencies))
+
+
+def get_metric_dependencies(metrics):
+    '''Returns the sorted names of the intermediates needed to compute the given metrics.'''
+    dependencies = set()
+    for metric in metrics:
+        if metric not in metric_registry:
+            raise Exception('Unknown metric "%s". The metric should be one of: %s.' % (metric, ', '.join(metric_order)))
+        dependencies = dependencies.union(metric_registry[metric][1])
+    return sorted(dependencies)
+
+
+def _scipy_stats():
+    import scipy.stats
+    return scipy.stats
+
+
+def _float_array(values):
+    import numpy
+    return numpy.asarray(values, dtype = float)
+
+
+register_intermediate('x_array', lambda c: _float_array(c.x_values))
+register_intermediate('y_array', lambda c: _float_array(c.y_values))
+register_intermediate('x_ranks', lambda c: average_ranks(c['x_array']))
+register_intermediate('y_ranks', lambda c: average_ranks(c['y_array']))
+register_intermediate('concordance', lambda c: concordance_counts(c.x_values, c.y_values))
+
+register_metric('pearsonr', lambda c: _scipy_stats().pearsonr(c['x_array'], c['y_array']), ['x_array', 'y_array'])
+register_metric('spearmanr', lambda c: _scipy_stats().pearsonr(c['x_ranks'], c['y_ranks']), ['x_ranks', 'y_ranks'])
+register_metric('gamma_CC', lambda c: gamma_from_counts(c['concordance']), ['concordance'])
+register_metric('kendalltau', lambda c: kendall_tau_b_from_counts(c['concordance']), ['concordance'])
+register_metric('MAE', lambda c: mae(c['x_array'], c['y_array']), ['x_array', 'y_array'])
+register_metric('normaltestx', lambda c: _scipy_stats().normaltest(c['x_array']), ['x_array'])
+register_metric('normaltesty', lambda c: _scipy_stats().normaltest(c['y_array']), ['y_array'])
+register_metric('kstestx', lambda c: _scipy_stats().kstest(c['x_array'], 'norm'), ['x_array'])
+register_metric('kstesty', lambda c: _scipy_stats().kstest(c['y_array'], 'norm'), ['y_array'])
+register_metric('ks_2samp', lambda c: _scipy_stats().ks_2samp(c['x_array'], c['y_array']), ['x_array', 'y_array'])
+register_metric('fraction_correct', lambda c: fraction_correct(c.x_values, c.y_values, x_cutoff = c.options['fcorrect_x_cutoff'], y_cutoff = c.options['fcorrect_y_cutoff']))
+register_metric('fraction_correct_fuzzy_linear', lambda c: fraction_correct_fuzzy_linear(c.x_values, c.y_values, x_cutoff = c.options['fcorrect_x_cutoff'], x_fuzzy_range = c.options['x_fuzzy_range'], y_scalar = c.options['y_scalar']))
+
+
+def _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, bootstrap_samples = 0, confidence_level = 0.95, random_seed = 0, num_processes = 1, metrics = None):
     '''
     A function which takes two lists of values of equal length with corresponding entries and returns a dict containing
     a variety of metrics.
@@ -315,26 +767,26 @@ def _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = 1.0, fcor
     :param fcorrect_y_cutoff: See get_xy_dataset_statistics.
     :param x_fuzzy_range: See get_xy_dataset_statistics.
     :param y_scalar: See get_xy_dataset_statistics.
+    :param bootstrap_samples: See get_xy_dataset_statistics.
+    :param confidence_level: See get_xy_dataset_statistics.
+    :param random_seed: See get_xy_dataset_statistics.
+    :param num_processes: See get_xy_dataset_statistics.
+    :param metrics: See get_xy_dataset_statistics.
     :return: A table of statistics.
     '''
-    from scipy.stats import pearsonr, spearmanr, normaltest, ks_2samp, kstest, norm
     assert(len(x_values) == len(y_values))
-    return dict(
-        pearsonr = pearsonr(x_values, y_values),
-        spearmanr = spearmanr(x_values, y_values),
-        gamma_CC = gamma_CC(x_values, y_values),
-        MAE = mae(x_values, y_values),
-        normaltestx = normaltest(x_values),
-        normaltesty = normaltest(y_values),
-        kstestx = kstest(x_values, 'norm'),
-        kstesty = kstest(y_values, 'norm'),
-        ks_2samp = ks_2samp(x_values, y_values),
-        fraction_correct = fraction_correct(x_values, y_values, x_cutoff = fcorrect_x_cutoff, y_cutoff = fcorrect_y_cutoff),
-        fraction_correct_fuzzy_linear = fraction_correct_fuzzy_linear(x_values, y_values, x_cutoff = fcorrect_x_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar),
-    )
+    if metrics is None:
+        metrics = metric_order
+    get_metric_dependencies(metrics) # check the metric names
+    context = MetricContext(x_values, y_values, fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar)
+    stats = dict((metric, metric_registry[metric][0](context)) for metric in metrics)
+    if bootstrap_samples:
+        stats['confidence_intervals'] = bootstrap_xy_dataset_statistics(x_values, y_values, num_samples = bootstrap_samples, confidence_level = confidence_level, random_seed = random_seed, num_processes = num_processes, fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar, metrics = metrics)
+        stats['confidence_level'] = confidence_level
+    return stats
 
 
-def get_xy_dataset_statistics(analysis_table, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
+def get_xy_dataset_statistics(analysis_table, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, bootstrap_samples = 0, confidence_level = 0.95, random_seed = 0, num_processes = 1, metrics = None):
     '''
     A version of _get_xy_dataset_statistics which accepts a list of dicts rather than X- and Y-value lists.
     :param analysis_table: A list of dict where each dict has Experimental and Predicted float elements
@@ -342,15 +794,20 @@ def get_xy_dataset_statistics(analysis_table, fcorrect_x_cutoff = 1.0, fcorrect_
     :param fcorrect_y_cutoff: The Y-axis cutoff value for the fraction correct metric.
     :param x_fuzzy_range: The X-axis fuzzy range value for the fuzzy fraction correct metric.
     :param y_scalar: The Y-axis scalar multiplier for the fuzzy fraction correct metric (used to calculate y_cutoff and y_fuzzy_range in that metric)
+    :param bootstrap_samples: If positive, percentile bootstrap confidence intervals are computed for every metric from this many resamples (see bootstrap_xy_dataset_statistics) and added to the table under the confidence_intervals key.
+    :param confidence_level: The confidence level of the bootstrap confidence intervals.
+    :param random_seed: The seed used to draw the bootstrap resamples.
+    :param num_processes: The number of processes used to compute the bootstrap resamples.
+    :param metrics: The names of the metrics to compute (see metric_registry) or None to compute all of them. Only the intermediate values needed by these metrics are computed.
     :return: A table of statistics.
     '''
 
     x_values = [record['Experimental'] for record in analysis_table]
     y_values = [record['Predicted'] for record in analysis_table]
-    return _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar)
+    return _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar, bootstrap_samples = bootstrap_samples, confidence_level = confidence_level, random_seed = random_seed, num_processes = num_processes, metrics = metrics)
 
 
-def get_xy_dataset_statistics_pandas(dataframe, x_series, y_series, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
+def get_xy_dataset_statistics_pandas(dataframe, x_series, y_series, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, bootstrap_samples = 0, confidence_level = 0.95, random_seed = 0, num_processes = 1, metrics = None):
     '''
     A version of _get_xy_dataset_statistics which accepts a pandas dataframe rather than X- and Y-value lists.
     :param dataframe: A pandas dataframe
@@ -360,18 +817,818 @@ def get_xy_dataset_statistics_pandas(dataframe, x_series, y_series, fcorrect_x_c
     :param fcorrect_y_cutoff: The Y-axis cutoff value for the fraction correct metric.
     :param x_fuzzy_range: The X-axis fuzzy range value for the fuzzy fraction correct metric.
     :param y_scalar: The Y-axis scalar multiplier for the fuzzy fraction correct metric (used to calculate y_cutoff and y_fuzzy_range in that metric)
+    :param bootstrap_samples: If positive, percentile bootstrap confidence intervals are computed for every metric from this many resamples (see bootstrap_xy_dataset_statistics) and added to the table under the confidence_intervals key.
+    :param confidence_level: The confidence level of the bootstrap confidence intervals.
+    :param random_seed: The seed used to draw the bootstrap resamples.
+    :param num_processes: The number of processes used to compute the bootstrap resamples.
+    :param metrics: The names of the metrics to compute (see metric_registry) or None to compute all of them. Only the intermediate values needed by these metrics are computed.
     :return: A table of statistics.
     '''
 
     x_values = dataframe[x_series].tolist()
     y_values = dataframe[y_series].tolist()
-    return _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar)
+    return _get_xy_dataset_statistics(x_values, y_values, fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar, bootstrap_samples = bootstrap_samples, confidence_level = confidence_level, random_seed = random_seed, num_processes = num_processes, metrics = metrics)
+
+
+###
+#  Bootstrap confidence intervals
+###
+
+
+def bootstrap_counts(num_samples, num_points, random_state):
+    '''
+    Draws num_samples bootstrap resamples of num_points points at once and returns a (num_samples, num_points) matrix
+    where entry [s, i] is the number of times that point i was drawn in resample s. All of the metrics are weighted by
+    these counts so the resampled values themselves are never materialized.
+    '''
+    import numpy
+    indices = random_state.randint(0, num_points, size = (num_samples, num_points))
+    offsets = (numpy.arange(num_samples) * num_points)[:, numpy.newaxis]
+    return numpy.bincount((indices + offsets).ravel(), minlength = num_samples * num_points).reshape((num_samples, num_points)).astype(float)
+
+
+def _group_starts(sorted_values):
+    '''Returns the indices of the first entry of each run of equal values in a sorted array (or of equal rows in a sorted
+       2D array).'''
+    import numpy
+    if len(sorted_values) == 0:
+        return numpy.zeros(0, dtype = int)
+    changes = sorted_values[1:] != sorted_values[:-1]
+    if changes.ndim > 1:
+        changes = changes.any(axis = 1)
+    return numpy.concatenate(([0], numpy.flatnonzero(changes) + 1))
+
+
+def _run_sums(sorted_counts, starts):
+    '''Returns the sums of the columns of sorted_counts in each run of equal values given the run starts. If there are no
+       ties, the counts themselves are returned.'''
+    import numpy
+    if len(starts) == sorted_counts.shape[1]:
+        return sorted_counts
+    return numpy.add.reduceat(sorted_counts, starts, axis = 1)
+
+
+def _weighted_tied_pairs(group_counts):
+    '''Returns the number of tied pairs in each resample given the number of drawn points in each run of equal values.'''
+    return (group_counts * (group_counts - 1.0) / 2.0).sum(axis = 1)
+
+
+def _weighted_ranks(group_counts, order, starts):
+    '''Returns the (average) ranks of the points in each resample, in the original point order, given the number of drawn
+       points in each run of equal values, the sorting order of the values, and the starts of the runs.'''
+    import numpy
+    group_ranks = numpy.cumsum(group_counts, axis = 1) - group_counts + (group_counts + 1.0) / 2.0
+    is_group_start = numpy.zeros(len(order), dtype = int)
+    is_group_start[starts] = 1
+    group_of_point = numpy.empty(len(order), dtype = int)
+    group_of_point[order] = numpy.cumsum(is_group_start) - 1
+    return group_ranks[:, group_of_point]
+
+
+def _weighted_pearsonr(x_values, y_values, counts, num_points):
+    '''The Pearson correlation coefficient of each resample. The values are either arrays with one value per point or
+       matrices with one row per resample (e.g. ranks).'''
+    import numpy
+    def weighted_mean(values):
+        if values.ndim == 1:
+            return counts.dot(values) / num_points
+        return (counts * values).sum(axis = 1) / num_points
+    x_values = x_values - x_values.mean()
+    y_values = y_values - y_values.mean()
+    mean_x, mean_y = weighted_mean(x_values), weighted_mean(y_values)
+    covariance = weighted_mean(x_values * y_values) - mean_x * mean_y
+    variance_x = weighted_mean(x_values * x_values) - mean_x ** 2
+    variance_y = weighted_mean(y_values * y_values) - mean_y ** 2
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        return covariance / numpy.sqrt(variance_x * variance_y)
+
+
+def _preceding_greater_weights(keys, weights):
+    '''
+    Returns a matrix with one row per row of weights where entry [s, j] is the sum of weights[s, i] over the positions
+    i < j with keys[i] > keys[j]. With unit weights, the sum of the entries of a row is the number of inversions of the
+    keys. The keys are sorted with a bottom-up merge sort; at each level, the elements of each right block are located in
+    the sorted left block with one vectorized binary search for all blocks, so the cost is O(n log^2 n) per row of weights
+    rather than O(n^2).
+    :param keys: A 1D array of values which can be ordered.
+    :param weights: A (number of rows, len(keys)) matrix of non-negative integer weights e.g. bootstrap counts.
+    '''
+    import numpy
+    num_items = len(keys)
+    weights = numpy.asarray(weights, dtype = float)
+    if num_items < 2:
+        return numpy.zeros(weights.shape)
+    # The weights are stored with one row per key so that the rows of the blocks are gathered contiguously. The partial
+    # sums of integer weights are exact in single precision as long as the total weight is below 2^24.
+    dtype = numpy.float32 if weights.sum(axis = 1).max() < (1 << 24) else numpy.float64
+    current_weights = numpy.ascontiguousarray(weights.T, dtype = dtype)
+    preceding_weights = numpy.zeros(current_weights.shape, dtype = dtype)
+    zero_row = numpy.zeros((1, weights.shape[0]), dtype = dtype)
+    # Dense ranks keep the block offsets below (number of blocks) * (number of distinct keys)
+    current_keys = numpy.unique(keys, return_inverse = True)[1].ravel().astype(numpy.int64)
+    num_keys = int(current_keys.max()) + 1
+    current_index = numpy.arange(num_items)
+    positions = numpy.arange(num_items)
+    width = 1
+    while width < num_items:
+        block = positions // (2 * width)
+        is_right = (positions % (2 * width)) >= width
+        offset_keys = block * num_keys + current_keys
+        left = numpy.flatnonzero(~is_right)
+        right = numpy.flatnonzero(is_right)
+        left_keys = offset_keys[left]
+        left_cumulative_weights = numpy.concatenate((zero_row, numpy.cumsum(current_weights[left], axis = 0)))
+        block_ends = numpy.searchsorted(left_keys, (block[right] + 1) * num_keys, side = 'left')
+        first_greater = numpy.searchsorted(left_keys, offset_keys[right], side = 'right')
+        preceding_weights[current_index[right]] += left_cumulative_weights[block_ends] - left_cumulative_weights[first_greater]
+        # Merge each pair of blocks
+        order = numpy.argsort(offset_keys, kind = 'mergesort')
+        current_keys, current_index, current_weights = current_keys[order], current_index[order], current_weights[order]
+        width *= 2
+    return preceding_weights.T.astype(float)
+
+
+def _weighted_discordant_pairs(x_values, y_values, counts):
+    '''
+    Returns the number of discordant pairs in each resample i.e. the sum of counts[i] * counts[j] over the pairs of points
+    with x_i < x_j and y_i > y_j. The points are sorted by (X, Y) once and the discordant pairs are the inversions of the
+    Y-values in that order weighted by the counts, which are computed for all resamples with one merge count (see
+    _preceding_greater_weights) in O(num_points log^2 num_points) time per resample.
+    '''
+    import numpy
+    order = numpy.lexsort((y_values, x_values))
+    sorted_counts = counts[:, order]
+    return (_preceding_greater_weights(y_values[order], sorted_counts) * sorted_counts).sum(axis = 1)
+
+
+def _normaltest_statistic(n, m2, m3, m4):
+    '''D'Agostino and Pearson's omnibus normality test statistic (as in scipy.stats.normaltest) given the number of points
+       and the second, third, and fourth central moments. n may be a number or an array with one entry per sample.'''
+    import numpy
+    n = numpy.asarray(n, dtype = float)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        # Skewness test
+        b2 = m3 / m2 ** 1.5
+        y = b2 * numpy.sqrt(((n + 1) * (n + 3)) / (6.0 * (n - 2)))
+        beta2 = (3.0 * (n ** 2 + 27 * n - 70) * (n + 1) * (n + 3)) / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+        W2 = -1 + numpy.sqrt(2 * (beta2 - 1))
+        delta = 1 / numpy.sqrt(0.5 * numpy.log(W2))
+        alpha = numpy.sqrt(2.0 / (W2 - 1))
+        y = numpy.where(y == 0, 1, y)
+        z_skew = delta * numpy.log(y / alpha + numpy.sqrt((y / alpha) ** 2 + 1))
+
+        # Kurtosis test
+        b2 = m4 / m2 ** 2
+        E = 3.0 * (n - 1) / (n + 1)
+        varb2 = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+        x = (b2 - E) / numpy.sqrt(varb2)
+        sqrtbeta1 = 6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) * numpy.sqrt((6.0 * (n + 3) * (n + 5)) / (n * (n - 2) * (n - 3)))
+        A = 6.0 + 8.0 / sqrtbeta1 * (2.0 / sqrtbeta1 + numpy.sqrt(1 + 4.0 / (sqrtbeta1 ** 2)))
+        term1 = 1 - 2 / (9.0 * A)
+        denom = 1 + x * numpy.sqrt(2 / (A - 4.0))
+        term2 = numpy.sign(denom) * numpy.where(denom == 0.0, numpy.nan, ((1 - 2.0 / A) / numpy.abs(denom)) ** (1 / 3.0))
+        z_kurtosis = (term1 - term2) / numpy.sqrt(2 / (9.0 * A))
+    return z_skew ** 2 + z_kurtosis ** 2
+
+
+def _weighted_normaltest_statistic(values, counts, num_points):
+    '''D'Agostino and Pearson's omnibus normality test statistic (as in scipy.stats.normaltest) of each resample.'''
+    n = float(num_points)
+    # The central moments of each resample are computed from its raw moments about the mean of the full sample
+    values = values - values.mean()
+    mean, r2, r3, r4 = [counts.dot(values ** k) / n for k in range(1, 5)]
+    m2 = r2 - mean ** 2
+    m3 = r3 - 3 * mean * r2 + 2 * mean ** 3
+    m4 = r4 - 4 * mean * r3 + 6 * mean ** 2 * r2 - 3 * mean ** 4
+    return _normaltest_statistic(n, m2, m3, m4)
+
+
+def _weighted_kstest_statistic(sorted_values, sorted_counts, num_points):
+    '''The Kolmogorov-Smirnov statistic of each resample against the standard normal distribution given the sorted values
+       and the counts in that order.'''
+    import numpy
+    from scipy.stats import norm
+    cdf = norm.cdf(sorted_values)
+    empirical_cdf = numpy.cumsum(sorted_counts, axis = 1) / float(num_points)
+    # Points which were not drawn and entries within runs of equal values never exceed the statistic at the drawn points
+    return numpy.maximum(empirical_cdf - cdf, cdf - (empirical_cdf - sorted_counts / float(num_points))).max(axis = 1)
+
+
+def _weighted_ks_2samp_statistic(x_values, y_values, counts, num_points):
+    '''The two-sample Kolmogorov-Smirnov statistic of the X- and Y-values of each resample.'''
+    import numpy
+    merged_values = numpy.concatenate((x_values, y_values))
+    order = numpy.argsort(merged_values, kind = 'mergesort')
+    merged_counts = numpy.concatenate((counts, -counts), axis = 1)[:, order]
+    # The difference of the empirical CDFs is only evaluated after the last of each run of equal values
+    group_ends = numpy.concatenate((_group_starts(merged_values[order])[1:], [len(merged_values)])) - 1
+    return numpy.abs(numpy.cumsum(merged_counts, axis = 1)[:, group_ends]).max(axis = 1) / float(num_points)
+
+
+def xy_dataset_statistics_from_counts(x_values, y_values, counts, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, metrics = None):
+    '''
+    Computes the metrics of _get_xy_dataset_statistics for many resamples at once.
+    :param x_values: A NumPy array of X-axis (experimental) values.
+    :param y_values: A NumPy array of Y-axis (predicted) values.
+    :param counts: A (number of resamples, number of points) matrix of the number of times each point appears in each resample e.g. from bootstrap_counts.
+    :param metrics: The names of the metrics to compute or None to compute all of them.
+    :return: A dict mapping the keys of _get_xy_dataset_statistics to arrays with one value per resample. For the tests
+             (e.g. pearsonr), the value is the statistic rather than the p-value.
+    '''
+    import numpy
+    x_values, y_values = numpy.asarray(x_values, dtype = float), numpy.asarray(y_values, dtype = float)
+    counts = numpy.asarray(counts, dtype = float)
+    num_points = float(len(x_values))
+    metrics = set(metric_order if metrics is None else metrics)
+    stats = {}
+
+    # Sort the values (and the counts) once per axis. The numbers of drawn points in each run of equal values give the
+    # tied pairs and the ranks.
+    sorted_data = {}
+    if metrics.intersection(['spearmanr', 'gamma_CC', 'kendalltau', 'kstestx', 'kstesty']):
+        for axis, values in [('x', x_values), ('y', y_values)]:
+            order = numpy.argsort(values, kind = 'mergesort')
+            starts = _group_starts(values[order])
+            sorted_counts = counts[:, order]
+            sorted_data[axis] = (values[order], sorted_counts, _run_sums(sorted_counts, starts), order, starts)
+        x_sorted, x_counts, x_group_counts, x_order, x_starts = sorted_data['x']
+        y_sorted, y_counts, y_group_counts, y_order, y_starts = sorted_data['y']
+
+    if metrics.intersection(['gamma_CC', 'kendalltau']):
+        # Concordance counts (see concordance_counts) from the weighted tied and discordant pairs
+        xy_order = numpy.lexsort((y_values, x_values))
+        num_pairs = num_points * (num_points - 1) / 2.0
+        tied_x_all = _weighted_tied_pairs(x_group_counts)
+        tied_y_all = _weighted_tied_pairs(y_group_counts)
+        tied_xy = _weighted_tied_pairs(_run_sums(counts[:, xy_order], _group_starts(numpy.column_stack((x_values, y_values))[xy_order])))
+        discordant = _weighted_discordant_pairs(x_values, y_values, counts)
+        concordant = num_pairs - tied_x_all - tied_y_all + tied_xy - discordant
+        with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+            stats['gamma_CC'] = (concordant - discordant) / (concordant + discordant)
+            stats['kendalltau'] = (concordant - discordant) / numpy.sqrt((concordant + discordant + tied_y_all - tied_xy) * (concordant + discordant + tied_x_all - tied_xy))
+
+    if 'pearsonr' in metrics:
+        stats['pearsonr'] = _weighted_pearsonr(x_values, y_values, counts, num_points)
+    if 'spearmanr' in metrics:
+        stats['spearmanr'] = _weighted_pearsonr(_weighted_ranks(x_group_counts, x_order, x_starts), _weighted_ranks(y_group_counts, y_order, y_starts), counts, num_points)
+    if 'MAE' in metrics:
+        stats['MAE'] = counts.dot(numpy.abs(x_values - y_values)) / num_points
+    if 'normaltestx' in metrics:
+        stats['normaltestx'] = _weighted_normaltest_statistic(x_values, counts, num_points)
+    if 'normaltesty' in metrics:
+        stats['normaltesty'] = _weighted_normaltest_statistic(y_values, counts, num_points)
+    if 'kstestx' in metrics:
+        stats['kstestx'] = _weighted_kstest_statistic(x_sorted, x_counts, num_points)
+    if 'kstesty' in metrics:
+        stats['kstesty'] = _weighted_kstest_statistic(y_sorted, y_counts, num_points)
+    if 'ks_2samp' in metrics:
+        stats['ks_2samp'] = _weighted_ks_2samp_statistic(x_values, y_values, counts, num_points)
+    if 'fraction_correct' in metrics:
+        stats['fraction_correct'] = counts.dot(fraction_correct_values_array(x_values, y_values, x_cutoff = fcorrect_x_cutoff, y_cutoff = fcorrect_y_cutoff)) / num_points
+    if 'fraction_correct_fuzzy_linear' in metrics:
+        fuzzy_correct = (fraction_correct_fuzzy_linear_create_matrix(x_values, fcorrect_x_cutoff, x_fuzzy_range) * fraction_correct_fuzzy_linear_create_matrix(y_values, fcorrect_x_cutoff * y_scalar, x_fuzzy_range * y_scalar)).sum(axis = 1)
+        stats['fraction_correct_fuzzy_linear'] = counts.dot(fuzzy_correct) / num_points
+    return stats
+
+
+def _bootstrap_statistics_job(job):
+    '''Computes the metrics for one chunk of bootstrap resamples. This is a module-level function so that it can be sent to
+       a process pool.'''
+    import numpy
+    x_values, y_values, seed, num_samples, max_chunk_size, options = job
+    random_state = numpy.random.RandomState(seed)
+    chunk_statistics = []
+    chunk_size = max(1, max_chunk_size // len(x_values))
+    for start in range(0, num_samples, chunk_size):
+        counts = bootstrap_counts(min(chunk_size, num_samples - start), len(x_values), random_state)
+        chunk_statistics.append(xy_dataset_statistics_from_counts(x_values, y_values, counts, **options))
+    return dict((k, numpy.concatenate([s[k] for s in chunk_statistics])) for k in chunk_statistics[0])
+
+
+def bootstrap_xy_dataset_statistics(x_values, y_values, num_samples = 10000, confidence_level = 0.95, random_seed = 0, num_processes = 1, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, samples_per_job = 1000, max_chunk_size = 1 << 21, metrics = None):
+    '''
+    Computes percentile bootstrap confidence intervals for the metrics of _get_xy_dataset_statistics. The resamples are
+    split into jobs of samples_per_job resamples, each seeded from random_seed, so the intervals only depend on the seed
+    and not on the number of processes. The jobs are run in a pool of num_processes processes. If metrics is given, only
+    those metrics are resampled.
+    :return: A dict mapping the keys of _get_xy_dataset_statistics to (lower bound, upper bound) pairs. For the tests
+             (e.g. pearsonr), the interval is for the statistic rather than the p-value.
+    '''
+    import numpy
+    x_values, y_values = numpy.asarray(x_values, dtype = float), numpy.asarray(y_values, dtype = float)
+    assert(len(x_values) == len(y_values))
+    if len(x_values) < 2:
+        raise Exception('At least two points are required to bootstrap the statistics.')
+    if not(0 < confidence_level < 1):
+        raise Exception('The confidence level should lie between 0 and 1.')
+
+    options = dict(fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar, metrics = metrics)
+    job_sizes = [min(samples_per_job, num_samples - start) for start in range(0, num_samples, samples_per_job)]
+    seeds = numpy.random.RandomState(random_seed).randint(0, 2 ** 31 - 1, size = len(job_sizes))
+    jobs = [(x_values, y_values, int(seed), job_size, max_chunk_size, options) for seed, job_size in zip(seeds, job_sizes)]
+    if num_processes > 1 and len(jobs) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(num_processes, len(jobs)))
+        try:
+            job_statistics = pool.map(_bootstrap_statistics_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        job_statistics = [_bootstrap_statistics_job(job) for job in jobs]
+
+    tail = 100.0 * (1.0 - confidence_level) / 2.0
+    intervals = {}
+    for k in job_statistics[0]:
+        samples = numpy.concatenate([s[k] for s in job_statistics])
+        samples = samples[numpy.isfinite(samples)]
+        if len(samples):
+            intervals[k] = (float(numpy.percentile(samples, tail)), float(numpy.percentile(samples, 100.0 - tail)))
+        else:
+            intervals[k] = (float('nan'), float('nan'))
+    return intervals
+
+
+###
+#  Batched evaluation of several predictors
+###
+
+
+def average_ranks(values):
+    '''
+    Returns the ranks (starting at 1) of the values along the first axis, with tied values given the average of their
+    ranks, as in scipy.stats.rankdata. For a 2D array, each column is ranked separately with one sort of the whole array.
+    :param values: A 1D array or a 2D array (one column per variable).
+    :return: A float array of ranks with the same shape as values.
+    '''
+    import numpy
+    values = numpy.asarray(values, dtype = float)
+    is_vector = values.ndim == 1
+    if is_vector:
+        values = values[:, numpy.newaxis]
+    num_rows = values.shape[0]
+    order = numpy.argsort(values, axis = 0, kind = 'mergesort')
+    columns = numpy.arange(values.shape[1])[numpy.newaxis, :]
+    sorted_values = values[order, columns]
+
+    # For each sorted position, find the first and last positions of its run of equal values
+    positions = numpy.arange(num_rows)[:, numpy.newaxis] * numpy.ones(values.shape[1], dtype = int)
+    is_run_start = numpy.ones(values.shape, dtype = bool)
+    is_run_start[1:] = sorted_values[1:] != sorted_values[:-1]
+    is_run_end = numpy.ones(values.shape, dtype = bool)
+    is_run_end[:-1] = is_run_start[1:]
+    run_starts = numpy.maximum.accumulate(numpy.where(is_run_start, positions, 0), axis = 0)
+    run_ends = numpy.minimum.accumulate(numpy.where(is_run_end, positions, num_rows - 1)[::-1], axis = 0)[::-1]
+
+    ranks = numpy.empty(values.shape)
+    ranks[order, columns] = (run_starts + run_ends) / 2.0 + 1.0
+    if is_vector:
+        return ranks[:, 0]
+    return ranks
+
+
+def pearsonr_array(x_values, y_values):
+    '''
+    Returns the Pearson correlation coefficients of x_values and y_values computed over the last axis.
+    :param x_values: An array of X-axis (experimental) values.
+    :param y_values: An array of Y-axis (predicted) values. The arrays may have any shapes which broadcast together e.g.
+                     (points,) and (predictors, points), or (runs, samples, points) and (samples, points).
+    :return: A float array of the coefficients (NaN where either series is constant).
+    '''
+    import numpy
+    x_values, y_values = numpy.broadcast_arrays(numpy.asarray(x_values, dtype = float), numpy.asarray(y_values, dtype = float))
+    x_deviations = x_values - x_values.mean(axis = -1)[..., numpy.newaxis]
+    y_deviations = y_values - y_values.mean(axis = -1)[..., numpy.newaxis]
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        r = (x_deviations * y_deviations).sum(axis = -1) / numpy.sqrt((x_deviations ** 2).sum(axis = -1) * (y_deviations ** 2).sum(axis = -1))
+    return numpy.clip(r, -1.0, 1.0)
+
+
+def _column_pearsonr(x_values, y_matrix):
+    '''Returns the Pearson correlation coefficient of x_values with each column of y_matrix and the two-tailed p-values.'''
+    import numpy
+    from scipy.stats import t as t_distribution
+    num_points = len(x_values)
+    r = pearsonr_array(x_values, y_matrix.T)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        t = r * numpy.sqrt((num_points - 2) / ((1.0 - r) * (1.0 + r)))
+    p_values = 2 * t_distribution.sf(numpy.abs(t), num_points - 2)
+    p_values[numpy.abs(r) == 1.0] = 0.0
+    return r, p_values
+
+
+def get_multi_predictor_statistics(x_values, y_matrix, y_names = None, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
+    '''
+    Evaluates several predictors against the same experimental values at once. The Pearson and Spearman correlation
+    coefficients are computed for all predictors with matrix operations and the experimental values are ranked once.
+    Predictors with missing (NaN) values are evaluated separately over the points where they are defined.
+    :param x_values: A list or array of values for the X-axis (experimental values).
+    :param y_matrix: A 2D array with one row per point and one column per predictor (or a list of columns if y_names is given and y_matrix is not an array).
+    :param y_names: The names of the predictors. The column indices are used by default.
+    :param fcorrect_x_cutoff: See get_xy_dataset_statistics.
+    :param fcorrect_y_cutoff: See get_xy_dataset_statistics.
+    :param x_fuzzy_range: See get_xy_dataset_statistics.
+    :param y_scalar: See get_xy_dataset_statistics.
+    :return: An OrderedDict mapping the predictor names to tables of statistics with the pearsonr, spearmanr, MAE,
+             fraction_correct, and fraction_correct_fuzzy_linear keys of _get_xy_dataset_statistics (and the number of
+             points used).
+    '''
+    import numpy
+    from collections import OrderedDict
+    x_values = numpy.asarray(x_values, dtype = float)
+    y_matrix = numpy.asarray(y_matrix, dtype = float)
+    if y_matrix.ndim == 1:
+        y_matrix = y_matrix[:, numpy.newaxis]
+    if y_matrix.shape[0] != len(x_values) and y_matrix.shape[1] == len(x_values):
+        y_matrix = y_matrix.T
+    if y_matrix.shape[0] != len(x_values):
+        raise Exception('The predictor matrix should have one row per experimental value.')
+    if y_names is None:
+        y_names = list(range(y_matrix.shape[1]))
+    if len(y_names) != y_matrix.shape[1]:
+        raise Exception('The number of predictor names does not match the number of predictors.')
+
+    table = OrderedDict((y_name, None) for y_name in y_names)
+    complete = ~numpy.isnan(y_matrix).any(axis = 0)
+    for c in numpy.flatnonzero(~complete):
+        mask = ~numpy.isnan(y_matrix[:, c])
+        table[y_names[c]] = list(get_multi_predictor_statistics(x_values[mask], y_matrix[mask, c], y_names = [y_names[c]], fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar).values())[0]
+
+    y_complete = y_matrix[:, complete]
+    num_points = len(x_values)
+    if y_complete.shape[1] and num_points > 2:
+        pearson_r, pearson_p = _column_pearsonr(x_values, y_complete)
+        spearman_r, spearman_p = _column_pearsonr(average_ranks(x_values), average_ranks(y_complete))
+        mean_absolute_errors = numpy.abs(y_complete - x_values[:, numpy.newaxis]).mean(axis = 0)
+        fraction_correct_values = fraction_correct_values_array(numpy.broadcast_to(x_values[:, numpy.newaxis], y_complete.shape), y_complete, x_cutoff = fcorrect_x_cutoff, y_cutoff = fcorrect_y_cutoff).mean(axis = 0)
+        xmat = fraction_correct_fuzzy_linear_create_matrix(x_values, fcorrect_x_cutoff, x_fuzzy_range)
+        ymat = fraction_correct_fuzzy_linear_create_matrix(y_complete.ravel(), fcorrect_x_cutoff * y_scalar, x_fuzzy_range * y_scalar).reshape(y_complete.shape + (3,))
+        fuzzy_fraction_correct_values = (xmat[:, numpy.newaxis, :] * ymat).sum(axis = 2).mean(axis = 0)
+        for x, c in enumerate(numpy.flatnonzero(complete)):
+            table[y_names[c]] = dict(
+                pearsonr = (pearson_r[x], pearson_p[x]),
+                spearmanr = (spearman_r[x], spearman_p[x]),
+                MAE = mean_absolute_errors[x],
+                fraction_correct = fraction_correct_values[x],
+                fraction_correct_fuzzy_linear = fuzzy_fraction_correct_values[x],
+                num_points = num_points,
+            )
+    else:
+        for c in numpy.flatnonzero(complete):
+            table[y_names[c]] = dict(pearsonr = (numpy.nan, numpy.nan), spearmanr = (numpy.nan, numpy.nan), MAE = numpy.nan, fraction_correct = numpy.nan, fraction_correct_fuzzy_linear = numpy.nan, num_points = num_points)
+    return table
+
+
+def get_multi_predictor_statistics_pandas(dataframe, x_series, y_series_list, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0):
+    '''A version of get_multi_predictor_statistics which accepts a pandas dataframe and a list of predictor column names.'''
+    return get_multi_predictor_statistics(dataframe[x_series].values, dataframe[y_series_list].values, y_names = list(y_series_list), fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar)
+
+
+###
+#  Grouped statistics
+###
+
+
+def _grouped_sums(values, starts):
+    '''Returns the sum of the values in each group of a sorted array given the group starts.'''
+    import numpy
+    return numpy.add.reduceat(values, starts) if len(values) else numpy.zeros(0)
+
+
+def _grouped_pearsonr(x_values, y_values, starts, sizes):
+    '''Returns the Pearson correlation coefficient and its two-tailed p-value for each group of rows given the group starts
+       and sizes. The rows must be sorted by group.'''
+    import numpy
+    from scipy.stats import t as t_distribution
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        x_deviations = x_values - numpy.repeat(_grouped_sums(x_values, starts) / sizes, sizes.astype(int))
+        y_deviations = y_values - numpy.repeat(_grouped_sums(y_values, starts) / sizes, sizes.astype(int))
+        r = _grouped_sums(x_deviations * y_deviations, starts) / numpy.sqrt(_grouped_sums(x_deviations ** 2, starts) * _grouped_sums(y_deviations ** 2, starts))
+        r = numpy.clip(r, -1.0, 1.0)
+        t = r * numpy.sqrt((sizes - 2) / ((1.0 - r) * (1.0 + r)))
+        return r, numpy.where(numpy.abs(r) == 1.0, 0.0, 2 * t_distribution.sf(numpy.abs(t), sizes - 2))
+
+
+def _grouped_average_ranks(groups, values):
+    '''Returns the ranks (starting at 1) of the values within each group, with tied values given the average of their
+       ranks, from one sort of all rows by (group, value). groups holds the group index of each row.'''
+    import numpy
+    num_rows = len(values)
+    ranks = numpy.empty(num_rows)
+    if num_rows == 0:
+        return ranks
+    order = numpy.lexsort((values, groups))
+    sorted_groups, sorted_values = groups[order], values[order]
+    positions = numpy.arange(num_rows)
+    is_group_start = numpy.ones(num_rows, dtype = bool)
+    is_group_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    is_run_start = is_group_start.copy()
+    is_run_start[1:] |= sorted_values[1:] != sorted_values[:-1]
+    is_run_end = numpy.ones(num_rows, dtype = bool)
+    is_run_end[:-1] = is_run_start[1:]
+    group_starts = numpy.maximum.accumulate(numpy.where(is_group_start, positions, 0))
+    run_starts = numpy.maximum.accumulate(numpy.where(is_run_start, positions, 0))
+    run_ends = numpy.minimum.accumulate(numpy.where(is_run_end, positions, num_rows - 1)[::-1])[::-1]
+    ranks[order] = (run_starts + run_ends) / 2.0 - group_starts + 1.0
+    return ranks
+
+
+def _grouped_tied_pairs(groups, columns, num_groups):
+    '''Returns the number of pairs of rows within each group which are equal in all of the given columns.'''
+    import numpy
+    if len(groups) == 0:
+        return numpy.zeros(num_groups)
+    order = numpy.lexsort(tuple(columns[::-1]) + (groups,))
+    starts = _group_starts(numpy.column_stack([groups] + list(columns))[order])
+    run_lengths = numpy.diff(numpy.concatenate((starts, [len(groups)]))).astype(float)
+    return numpy.bincount(groups[order][starts], weights = run_lengths * (run_lengths - 1.0) / 2.0, minlength = num_groups)
+
+
+def _grouped_concordance_counts(groups, x_values, y_values, num_groups):
+    '''Returns the concordance counts of concordance_counts for each group as a dict of arrays. The discordant pairs of all
+       groups are counted with one merge count (see _preceding_greater_weights) of the (group, Y-value) keys in
+       (group, X-value, Y-value) order: as the rows are ordered by group first, only pairs within a group are inverted.'''
+    import numpy
+    sizes = numpy.bincount(groups, minlength = num_groups).astype(float)
+    order = numpy.lexsort((y_values, x_values, groups))
+    y_keys = groups[order].astype(numpy.int64) * (len(y_values) + 1) + numpy.unique(y_values, return_inverse = True)[1].ravel()[order]
+    discordant = numpy.bincount(groups[order], weights = _preceding_greater_weights(y_keys, numpy.ones((1, len(y_keys))))[0], minlength = num_groups)
+    tied_x_all = _grouped_tied_pairs(groups, [x_values], num_groups)
+    tied_y_all = _grouped_tied_pairs(groups, [y_values], num_groups)
+    tied_xy = _grouped_tied_pairs(groups, [x_values, y_values], num_groups)
+    return dict(
+        concordant = sizes * (sizes - 1.0) / 2.0 - tied_x_all - tied_y_all + tied_xy - discordant,
+        discordant = discordant,
+        tied_x = tied_x_all - tied_xy,
+        tied_y = tied_y_all - tied_xy,
+        tied_xy = tied_xy,
+    )
+
+
+def _grouped_normaltest(values, starts, sizes):
+    '''Returns the normaltest statistic and p-value (as in scipy.stats.normaltest) of each group of rows given the group
+       starts and sizes. The rows must be sorted by group.'''
+    import numpy
+    from scipy.stats import chi2
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        deviations = values - numpy.repeat(_grouped_sums(values, starts) / sizes, sizes.astype(int))
+        m2, m3, m4 = [_grouped_sums(deviations ** k, starts) / sizes for k in range(2, 5)]
+    statistics = _normaltest_statistic(sizes, m2, m3, m4)
+    return statistics, chi2.sf(statistics, 2)
+
+
+def get_xy_dataset_statistics_grouped(dataframe, by, x_series = 'Experimental', y_series = 'Predicted', fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, min_group_size = 3, min_test_group_size = 8, metrics = None):
+    '''
+    Computes the statistics of _get_xy_dataset_statistics for each group of rows of a pandas dataframe. The rows are sorted
+    by group once and the statistics of all groups are computed together: the Pearson correlation coefficient, MAE,
+    (fuzzy) fraction correct, and normality tests with one reduction per sum, Spearman's R from the within-group ranks of
+    one sort by (group, value), and the gamma correlation coefficient and Kendall's tau-b from one merge count of the
+    discordant pairs of all groups. Only the Kolmogorov-Smirnov tests, whose p-values depend on the size of each sample, are
+    run on the contiguous slice of each group. Rows with a missing group value are omitted.
+    :param dataframe: A pandas dataframe
+    :param by: A column name or a list of column names. The group keys are tuples for a list of columns.
+    :param x_series: The column name of the X-axis series
+    :param y_series: The column name of the Y-axis series
+    :param fcorrect_x_cutoff: See get_xy_dataset_statistics.
+    :param fcorrect_y_cutoff: See get_xy_dataset_statistics.
+    :param x_fuzzy_range: See get_xy_dataset_statistics.
+    :param y_scalar: See get_xy_dataset_statistics.
+    :param min_group_size: The correlation coefficients are only computed for groups with at least this many rows.
+    :param min_test_group_size: The normality and Kolmogorov-Smirnov tests are only computed for groups with at least this many rows.
+    :param metrics: See get_xy_dataset_statistics.
+    :return: An OrderedDict mapping the group keys (in sorted order) to tables of statistics. Every table contains the
+             num_points key and the requested MAE, fraction_correct, and fraction_correct_fuzzy_linear keys; the keys of the
+             other statistics are omitted for groups which are too small. Tables with omitted keys can still be printed with
+             format_stats_for_printing.
+    '''
+    import numpy
+    from collections import OrderedDict
+    from scipy.stats import ks_2samp, kstest
+    metrics = set(metric_order if metrics is None else metrics)
+    get_metric_dependencies(metrics) # check the metric names
+
+    # Sort the rows by group once
+    codes = numpy.asarray(dataframe.groupby(by, sort = True).ngroup().values, dtype = float)
+    rows = numpy.flatnonzero(~numpy.isnan(codes) & (codes >= 0))
+    order = rows[numpy.argsort(codes[rows], kind = 'mergesort')]
+    codes = codes[order]
+    x_values = numpy.asarray(dataframe[x_series].values, dtype = float)[order]
+    y_values = numpy.asarray(dataframe[y_series].values, dtype = float)[order]
+    starts = numpy.flatnonzero(numpy.concatenate(([True], codes[1:] != codes[:-1]))) if len(codes) else numpy.zeros(0, dtype = int)
+    ends = numpy.concatenate((starts[1:], [len(codes)])).astype(int)
+    sizes = (ends - starts).astype(float)
+    key_rows = dataframe[by].values[order[starts]]
+    if isinstance(by, (list, tuple)):
+        keys = [tuple(k) for k in key_rows]
+    else:
+        keys = list(key_rows)
+
+    # The statistics of all groups computed together with one reduction per sum
+    groups = numpy.repeat(numpy.arange(len(starts)), sizes.astype(int))
+    pearson_r, pearson_p = _grouped_pearsonr(x_values, y_values, starts, sizes)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean_absolute_errors = _grouped_sums(numpy.abs(x_values - y_values), starts) / sizes
+        fraction_correct_values = _grouped_sums(fraction_correct_values_array(x_values, y_values, x_cutoff = fcorrect_x_cutoff, y_cutoff = fcorrect_y_cutoff), starts) / sizes
+        fuzzy_correct = (fraction_correct_fuzzy_linear_create_matrix(x_values, fcorrect_x_cutoff, x_fuzzy_range) * fraction_correct_fuzzy_linear_create_matrix(y_values, fcorrect_x_cutoff * y_scalar, x_fuzzy_range * y_scalar)).sum(axis = 1)
+        fuzzy_fraction_correct_values = _grouped_sums(fuzzy_correct, starts) / sizes
+    if 'spearmanr' in metrics:
+        # The within-group ranks of all groups from one sort by (group, value)
+        spearman_r, spearman_p = _grouped_pearsonr(_grouped_average_ranks(groups, x_values), _grouped_average_ranks(groups, y_values), starts, sizes)
+    if metrics.intersection(['gamma_CC', 'kendalltau']):
+        concordance = _grouped_concordance_counts(groups, x_values, y_values, len(starts))
+    normaltests = {}
+    for metric, values in [('normaltestx', x_values), ('normaltesty', y_values)]:
+        if metric in metrics:
+            normaltests[metric] = _grouped_normaltest(values, starts, sizes)
+
+    grouped_stats = OrderedDict()
+    for g, (key, start, end) in enumerate(zip(keys, starts, ends)):
+        group_stats = dict(
+            num_points = int(end - start),
+            MAE = mean_absolute_errors[g],
+            fraction_correct = fraction_correct_values[g],
+            fraction_correct_fuzzy_linear = fuzzy_fraction_correct_values[g],
+        )
+        if end - start >= max(min_group_size, 3):
+            group_stats['pearsonr'] = (pearson_r[g], pearson_p[g])
+            if 'spearmanr' in metrics:
+                group_stats['spearmanr'] = (spearman_r[g], spearman_p[g])
+            if metrics.intersection(['gamma_CC', 'kendalltau']):
+                group_counts = dict((k, v[g]) for k, v in concordance.items())
+                group_stats['gamma_CC'], group_stats['kendalltau'] = gamma_from_counts(group_counts), kendall_tau_b_from_counts(group_counts)
+        if end - start >= max(min_test_group_size, 8):
+            for metric, (statistics, p_values) in normaltests.items():
+                group_stats[metric] = (statistics[g], p_values[g])
+            # The Kolmogorov-Smirnov p-values depend on the size of each sample so these tests are run per group
+            group_x_values, group_y_values = x_values[start:end], y_values[start:end]
+            for metric, test in [('kstestx', lambda: kstest(group_x_values, 'norm')), ('kstesty', lambda: kstest(group_y_values, 'norm')),
+                                 ('ks_2samp', lambda: ks_2samp(group_x_values, group_y_values))]:
+                if metric in metrics:
+                    group_stats[metric] = test()
+        grouped_stats[key] = dict((k, v) for k, v in group_stats.items() if k == 'num_points' or k in metrics)
+    return grouped_stats
+
+
+###
+#  Streaming statistics
+###
+
+
+class StreamingXYStatistics(object):
+    '''
+    Accumulates the statistics of an XY data set which is given in chunks, e.g. from a producer which streams predictions,
+    without keeping all of the values in memory. Accumulators which were filled separately (e.g. in different processes)
+    can be combined with merge.
+
+    The number of points, Pearson's R, the MAE, and the (fuzzy) fraction correct are computed exactly from running sums:
+    the means and the sums of squared deviations and cross-deviations of each chunk are combined with the pairwise update
+    of Chan et al. (1979) which avoids the cancellation of the naive sums of squares.
+
+    The rank-based metrics (Spearman's R, Kendall's tau-b, and the gamma correlation coefficient) cannot be computed from
+    running sums. They are estimated from a uniform random sample of at most sample_size points which is maintained as a
+    bottom-k sketch: each point is given a random key and the points with the sample_size smallest keys are kept. The
+    sketch of two accumulators is merged by keeping the smallest keys of their union, which gives the same sample as if
+    all points had been added to a single accumulator. The estimates are exact while the number of points is at most
+    sample_size; otherwise their standard error is roughly (1 - rho^2) / sqrt(sample_size) for a correlation rho e.g.
+    about 0.01 or less for the default sample size. The p-value of the estimated Spearman's R is that of the sample and so
+    is conservative. Accumulators which are merged must be created with different random
+    seeds (the default seed of None draws a seed from the operating system).
+    '''
+
+    # The metrics estimated from the sample
+    approximate_metrics = ['spearmanr', 'gamma_CC', 'kendalltau']
+
+    # The metrics computed exactly
+    exact_metrics = ['pearsonr', 'MAE', 'fraction_correct', 'fraction_correct_fuzzy_linear']
+
+
+    def __init__(self, fcorrect_x_cutoff = 1.0, fcorrect_y_cutoff = 1.0, x_fuzzy_range = 0.1, y_scalar = 1.0, sample_size = 10000, random_seed = None):
+        import numpy
+        self.options = dict(fcorrect_x_cutoff = fcorrect_x_cutoff, fcorrect_y_cutoff = fcorrect_y_cutoff, x_fuzzy_range = x_fuzzy_range, y_scalar = y_scalar)
+        self.sample_size = sample_size
+        self.random_state = numpy.random.RandomState(random_seed)
+
+        # Running sums
+        self.num_points = 0
+        self.mean_x, self.mean_y = 0.0, 0.0
+        self.sum_xx, self.sum_yy, self.sum_xy = 0.0, 0.0, 0.0 # sums of squared deviations and cross-deviations
+        self.sum_absolute_errors = 0.0
+        self.num_correct = 0
+        self.sum_fuzzy_correct = 0.0
+
+        # The bottom-k sketch
+        self.sample_keys = numpy.zeros(0)
+        self.sample_x, self.sample_y = numpy.zeros(0), numpy.zeros(0)
+
+
+    def _combine(self, num_points, mean_x, mean_y, sum_xx, sum_yy, sum_xy):
+        '''Combines the moments of another set of points with the running moments.'''
+        if num_points == 0:
+            return
+        total = self.num_points + num_points
+        delta_x, delta_y = mean_x - self.mean_x, mean_y - self.mean_y
+        weight = float(self.num_points) * num_points / total
+        self.sum_xx += sum_xx + delta_x * delta_x * weight
+        self.sum_yy += sum_yy + delta_y * delta_y * weight
+        self.sum_xy += sum_xy + delta_x * delta_y * weight
+        self.mean_x += delta_x * num_points / total
+        self.mean_y += delta_y * num_points / total
+        self.num_points = total
+
+
+    def _update_sample(self, keys, x_values, y_values):
+        '''Keeps the points with the sample_size smallest keys of the current sample and the given points.'''
+        import numpy
+        keys = numpy.concatenate((self.sample_keys, keys))
+        x_values = numpy.concatenate((self.sample_x, x_values))
+        y_values = numpy.concatenate((self.sample_y, y_values))
+        if len(keys) > self.sample_size:
+            kept = numpy.argpartition(keys, self.sample_size - 1)[:self.sample_size]
+            keys, x_values, y_values = keys[kept], x_values[kept], y_values[kept]
+        self.sample_keys, self.sample_x, self.sample_y = keys, x_values, y_values
+
+
+    def add(self, x_values, y_values):
+        '''Adds a chunk of X-axis (experimental) and corresponding Y-axis (predicted) values. Returns self.'''
+        import numpy
+        x_values = numpy.asarray(x_values, dtype = float).ravel()
+        y_values = numpy.asarray(y_values, dtype = float).ravel()
+        if x_values.shape != y_values.shape:
+            raise Exception('The chunks of X- and Y-values must have the same length.')
+        if len(x_values) == 0:
+            return self
+        x_deviations, y_deviations = x_values - x_values.mean(), y_values - y_values.mean()
+        self._combine(len(x_values), x_values.mean(), y_values.mean(), x_deviations.dot(x_deviations), y_deviations.dot(y_deviations), x_deviations.dot(y_deviations))
+        self.sum_absolute_errors += numpy.abs(x_values - y_values).sum()
+        self.num_correct += int(fraction_correct_values_array(x_values, y_values, x_cutoff = self.options['fcorrect_x_cutoff'], y_cutoff = self.options['fcorrect_y_cutoff']).sum())
+        self.sum_fuzzy_correct += (fraction_correct_fuzzy_linear_create_matrix(x_values, self.options['fcorrect_x_cutoff'], self.options['x_fuzzy_range']) * fraction_correct_fuzzy_linear_create_matrix(y_values, self.options['fcorrect_x_cutoff'] * self.options['y_scalar'], self.options['x_fuzzy_range'] * self.options['y_scalar'])).sum()
+        self._update_sample(self.random_state.random_sample(len(x_values)), x_values, y_values)
+        return self
+
+
+    def merge(self, other):
+        '''Adds the points of another accumulator, created with the same options, to this accumulator. Returns self.'''
+        if other.options != self.options or other.sample_size != self.sample_size:
+            raise Exception('Only accumulators with the same options and sample size can be merged.')
+        self._combine(other.num_points, other.mean_x, other.mean_y, other.sum_xx, other.sum_yy, other.sum_xy)
+        self.sum_absolute_errors += other.sum_absolute_errors
+        self.num_correct += other.num_correct
+        self.sum_fuzzy_correct += other.sum_fuzzy_correct
+        self._update_sample(other.sample_keys, other.sample_x, other.sample_y)
+        return self
+
+
+    def is_sample_exact(self):
+        '''Returns True if the sample contains every point added so far i.e. the rank-based metrics are exact.'''
+        return self.num_points <= self.sample_size
+
+
+    def get_statistics(self, metrics = None):
+        '''
+        Returns a table of statistics with the keys of _get_xy_dataset_statistics.
+        :param metrics: A list of metrics out of exact_metrics and approximate_metrics or None to compute all of them.
+        :return: A dict mapping the metrics to their values and num_points to the number of points. If any rank-based
+                 metric is estimated from a sample of the points, the approximate_metrics key lists those metrics and the
+                 sample_size key gives the number of sampled points.
+        '''
+        import numpy
+        from scipy.stats import t as t_distribution
+        if metrics is None:
+            metrics = self.exact_metrics + self.approximate_metrics
+        for metric in metrics:
+            if metric not in self.exact_metrics + self.approximate_metrics:
+                raise Exception('The metric "%s" cannot be computed from a stream. The metric should be one of: %s.' % (metric, ', '.join(self.exact_metrics + self.approximate_metrics)))
+        if self.num_points == 0:
+            raise Exception('No values have been added.')
+
+        n = float(self.num_points)
+        stats = dict(num_points = self.num_points)
+        if 'pearsonr' in metrics:
+            with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+                r = max(-1.0, min(1.0, self.sum_xy / numpy.sqrt(self.sum_xx * self.sum_yy)))
+                t = r * numpy.sqrt((n - 2) / ((1.0 - r) * (1.0 + r)))
+                stats['pearsonr'] = (r, 0.0 if abs(r) == 1.0 else 2 * t_distribution.sf(abs(t), n - 2))
+        if 'MAE' in metrics:
+            stats['MAE'] = self.sum_absolute_errors / n
+        if 'fraction_correct' in metrics:
+            stats['fraction_correct'] = self.num_correct / n
+        if 'fraction_correct_fuzzy_linear' in metrics:
+            stats['fraction_correct_fuzzy_linear'] = self.sum_fuzzy_correct / n
+
+        rank_metrics = [m for m in metrics if m in self.approximate_metrics]
+        if rank_metrics:
+            stats.update(_get_xy_dataset_statistics(self.sample_x, self.sample_y, metrics = rank_metrics, **self.options))
+            if not self.is_sample_exact():
+                stats['approximate_metrics'] = rank_metrics
+                stats['sample_size'] = len(self.sample_x)
+        return stats
 
 
 keymap = dict(
     pearsonr = "Pearson's R",
     spearmanr = "Spearman's R",
     gamma_CC = "Gamma correlation coef.",
+    kendalltau = "Kendall's tau-b",
     fraction_correct = "Fraction correct",
     fraction_correct_fuzzy_linear = "Fraction correct (fuzzy)",
     ks_2samp = "Kolmogorov-Smirnov test (XY)",
@@ -379,13 +1636,17 @@ keymap = dict(
     kstesty = "Y-axis Kolmogorov-Smirnov test",
     normaltestx = "X-axis normality test",
     normaltesty = "Y-axis normality test",
+    num_points = "Number of points",
 )
 
 
 def format_stats_for_printing(stats):
     s = []
     newstats = {}
+    confidence_intervals = stats.get('confidence_intervals', {})
     for k, v in list(stats.items()):
+        if k in ['confidence_intervals', 'confidence_level', 'approximate_metrics', 'sample_size']:
+            continue
         key = keymap.get(k, k)
         if k == 'ks_2samp':
             newstats[key] = '%0.3f (2-tailed p-value=%s)' % (v[0], str(v[1]))
@@ -401,13 +1662,26 @@ def format_stats_for_printing(stats):
             newstats[key] = '%0.3f (2-tailed p-value=%s)' % (v[0], str(v[1]))
         elif k == 'spearmanr':
             newstats[key] = '%0.3f (2-tailed p-value=%s)' % (v[0], str(v[1]))
+        elif k == 'num_points':
+            newstats[key] = '%d' % v
+        elif isinstance(v, str):
+            newstats[key] = v # e.g. the 'n/a' value of an undefined gamma correlation coefficient
         else:
             newstats[key] = '%0.3f' % v
+        if k in confidence_intervals:
+            newstats[key] += ' [%d%% CI: %0.3f, %0.3f]' % (round(stats['confidence_level'] * 100), confidence_intervals[k][0], confidence_intervals[k][1])
+        if k in stats.get('approximate_metrics', []):
+            newstats[key] += ' (estimated from a sample of %d points)' % stats['sample_size']
     for k, v in sorted(newstats.items()):
         s.append('%s: %s' % (str(k).ljust(32), str(v)))
     return '\n'.join(s)
 
 
+def _use_density_plot(num_points, RFunction):
+    from . import plotting
+    return plotting.use_density_plot(num_points) and get_density_plot_function(RFunction) is not None
+
+
 def plot(analysis_table, output_filename, RFunction, title = ''):
     filetype = os.path.splitext(output_filename)[1].lower()
     if not(filetype == '.png' or filetype == '.pdf' or filetype == '.eps'):
@@ -417,6 +1691,10 @@ def plot(analysis_table, output_filename, RFunction, title = ''):
         filetype = filetype[1:]
     if len(analysis_table) <= 1:
         raise Exception("The analysis table must have at least two points.")
+    elif plot_backend == 'matplotlib':
+        get_native_plot_function(RFunction)([r['Experimental'] for r in analysis_table], [r['Predicted'] for r in analysis_table], output_filename, filetype, title = title)
+    elif _use_density_plot(len(analysis_table), RFunction):
+        get_density_plot_function(RFunction)([r['Experimental'] for r in analysis_table], [r['Predicted'] for r in analysis_table], output_filename, filetype, title = title)
     else:
         input_filename = create_csv(analysis_table)
         try:
@@ -430,19 +1708,23 @@ def plot(analysis_table, output_filename, RFunction, title = ''):
 
 
 def plot_pandas(dataframe, x_series, y_series, output_filename, RFunction, title = ''):
-    new_dataframe = dataframe[[x_series, y_series]]
-    new_dataframe.columns = ['Experimental', 'Predicted'] # todo: this is hacky - make the inner function more general
-
-    csv_filename = os.path.splitext(output_filename)[0] + '.txt'
     filetype = os.path.splitext(output_filename)[1].lower()
     if not(filetype == '.png' or filetype == '.pdf' or filetype == '.eps'):
         filetype = 'png'
         output_filename += '.png'
     else:
         filetype = filetype[1:]
-    if len(new_dataframe) <= 1:
+    if len(dataframe) <= 1:
         raise Exception("The analysis table must have at least two points.")
+    elif plot_backend == 'matplotlib':
+        # Render straight from the dataframe columns
+        get_native_plot_function(RFunction)(dataframe[x_series].values, dataframe[y_series].values, output_filename, filetype, title = title)
+    elif _use_density_plot(len(dataframe), RFunction):
+        get_density_plot_function(RFunction)(dataframe[x_series].values, dataframe[y_series].values, output_filename, filetype, title = title)
     else:
+        new_dataframe = dataframe[[x_series, y_series]]
+        new_dataframe.columns = ['Experimental', 'Predicted'] # todo: this is hacky - make the inner function more general
+        csv_filename = os.path.splitext(output_filename)[0] + '.txt'
         new_dataframe.to_csv(csv_filename, sep = ',', header = True)
         try:
             R_output = RFunction(csv_filename, output_filename, filetype, title = title)
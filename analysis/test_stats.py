@@ -0,0 +1,203 @@
+#!/usr/bin/env python2
+
+'''
+Regression tests for the fast implementations in stats.py. Each test compares a fast implementation against a direct
+(slow) computation of the same quantity on small, fixed data sets with ties. Run with:
+    python -m unittest analysis.test_stats
+'''
+
+import unittest
+
+import numpy
+
+from . import stats
+
+
+def brute_force_concordance_counts(values_list1, values_list2):
+    '''Counts the concordant, discordant, and tied pairs by comparing every pair of points.'''
+    counts = dict(concordant = 0, discordant = 0, tied_x = 0, tied_y = 0, tied_xy = 0)
+    for i in range(len(values_list1)):
+        for j in range(i + 1, len(values_list1)):
+            dx = numpy.sign(values_list1[i] - values_list1[j])
+            dy = numpy.sign(values_list2[i] - values_list2[j])
+            if dx == 0 and dy == 0:
+                counts['tied_xy'] += 1
+            elif dx == 0:
+                counts['tied_x'] += 1
+            elif dy == 0:
+                counts['tied_y'] += 1
+            elif dx == dy:
+                counts['concordant'] += 1
+            else:
+                counts['discordant'] += 1
+    return counts
+
+
+def tied_data(num_points, random_seed):
+    '''Returns a pair of correlated lists of values, rounded so that there are many ties in each list and in both.'''
+    random_state = numpy.random.RandomState(random_seed)
+    x_values = numpy.round(random_state.randn(num_points) * 2, 0)
+    y_values = numpy.round(0.7 * x_values + random_state.randn(num_points), 0)
+    return list(x_values), list(y_values)
+
+
+class ConcordanceCountsTest(unittest.TestCase):
+
+
+    def test_counts_match_brute_force(self):
+        for num_points in [0, 1, 2, 3, 7, 64, 101]:
+            for random_seed in range(3):
+                x_values, y_values = tied_data(num_points, random_seed)
+                self.assertEqual(stats.concordance_counts(x_values, y_values), brute_force_concordance_counts(x_values, y_values))
+
+
+    def test_counts_without_ties(self):
+        random_state = numpy.random.RandomState(0)
+        x_values, y_values = list(random_state.permutation(50)), list(random_state.permutation(50))
+        counts = stats.concordance_counts(x_values, y_values)
+        self.assertEqual(counts, brute_force_concordance_counts(x_values, y_values))
+        self.assertEqual(counts['concordant'] + counts['discordant'], 50 * 49 // 2)
+
+
+    def test_merge_sort_swaps(self):
+        values = tied_data(80, 1)[1]
+        sorted_values, num_swaps = stats._merge_sort_swaps(values)
+        self.assertEqual(sorted_values, sorted(values))
+        self.assertEqual(num_swaps, sum(1 for i in range(len(values)) for j in range(i + 1, len(values)) if values[i] > values[j]))
+
+
+    def test_gamma_and_kendall_tau_b(self):
+        from scipy.stats import kendalltau
+        x_values, y_values = tied_data(120, 2)
+        counts = brute_force_concordance_counts(x_values, y_values)
+        gamma, tau_b = stats.gamma_and_kendall_tau_b(x_values, y_values)
+        self.assertAlmostEqual(gamma, float(counts['concordant'] - counts['discordant']) / (counts['concordant'] + counts['discordant']))
+        self.assertAlmostEqual(tau_b, kendalltau(x_values, y_values)[0])
+        self.assertAlmostEqual(stats.gamma_CC(x_values, y_values), gamma)
+        self.assertAlmostEqual(stats.kendall_tau_b(x_values, y_values), tau_b)
+
+
+    def test_undefined_gamma(self):
+        self.assertEqual(stats.gamma_CC([1, 1, 1], [1, 2, 3]), 'n/a')
+
+
+def get_statistic(value):
+    '''Returns the statistic of a (statistic, p-value) test result and the value itself for the other metrics.'''
+    if isinstance(value, tuple) or hasattr(value, 'statistic'):
+        return float(value[0])
+    return float(value)
+
+
+def materialized_statistics(x_values, y_values, indices):
+    '''Returns a dict mapping the metrics to arrays of their values over the resamples given by the rows of indices,
+       computed by _get_xy_dataset_statistics on the resampled values.'''
+    x_values, y_values = numpy.asarray(x_values), numpy.asarray(y_values)
+    samples = {}
+    for sample_indices in indices:
+        for k, v in stats._get_xy_dataset_statistics(x_values[sample_indices], y_values[sample_indices]).items():
+            samples.setdefault(k, []).append(get_statistic(v))
+    return dict((k, numpy.array(v)) for k, v in samples.items())
+
+
+class BootstrapTest(unittest.TestCase):
+
+
+    def test_counts_match_indices(self):
+        num_samples, num_points = 20, 30
+        counts = stats.bootstrap_counts(num_samples, num_points, numpy.random.RandomState(5))
+        indices = numpy.random.RandomState(5).randint(0, num_points, size = (num_samples, num_points))
+        for s in range(num_samples):
+            self.assertEqual(list(counts[s]), list(numpy.bincount(indices[s], minlength = num_points)))
+
+
+    def test_statistics_from_counts_match_materialized_resamples(self):
+        x_values, y_values = map(numpy.array, tied_data(60, 3))
+        num_samples = 8
+        counts = stats.bootstrap_counts(num_samples, len(x_values), numpy.random.RandomState(7))
+        indices = numpy.random.RandomState(7).randint(0, len(x_values), size = (num_samples, len(x_values)))
+        from_counts = stats.xy_dataset_statistics_from_counts(x_values, y_values, counts)
+        materialized = materialized_statistics(x_values, y_values, indices)
+        self.assertEqual(sorted(from_counts.keys()), sorted(materialized.keys()))
+        for k in materialized:
+            self.assertTrue(numpy.allclose(from_counts[k], materialized[k], rtol = 1e-9, atol = 1e-9), k)
+
+
+    def test_weighted_discordant_pairs(self):
+        x_values, y_values = map(numpy.array, tied_data(45, 4))
+        counts = stats.bootstrap_counts(6, len(x_values), numpy.random.RandomState(8))
+        discordant_pairs = stats._weighted_discordant_pairs(x_values, y_values, counts)
+        for s in range(len(counts)):
+            expected = sum(counts[s, i] * counts[s, j] for i in range(len(x_values)) for j in range(len(x_values)) if x_values[i] < x_values[j] and y_values[i] > y_values[j])
+            self.assertEqual(discordant_pairs[s], expected)
+
+
+    def test_intervals_match_materialized_resamples(self):
+        x_values, y_values = map(numpy.array, tied_data(40, 5))
+        num_samples, samples_per_job, random_seed = 100, 40, 11
+        intervals = stats.bootstrap_xy_dataset_statistics(x_values, y_values, num_samples = num_samples, random_seed = random_seed, samples_per_job = samples_per_job)
+
+        # Each job draws its resamples from its own seed
+        job_sizes = [min(samples_per_job, num_samples - start) for start in range(0, num_samples, samples_per_job)]
+        seeds = numpy.random.RandomState(random_seed).randint(0, 2 ** 31 - 1, size = len(job_sizes))
+        indices = numpy.concatenate([numpy.random.RandomState(int(seed)).randint(0, len(x_values), size = (job_size, len(x_values))) for seed, job_size in zip(seeds, job_sizes)])
+        materialized = materialized_statistics(x_values, y_values, indices)
+        for k, samples in materialized.items():
+            samples = samples[numpy.isfinite(samples)]
+            self.assertTrue(numpy.allclose(intervals[k], (numpy.percentile(samples, 2.5), numpy.percentile(samples, 97.5))), k)
+
+
+class StreamingXYStatisticsTest(unittest.TestCase):
+
+
+    def get_accumulator(self, x_values, y_values, chunk_size, random_seed, sample_size = 10000):
+        accumulator = stats.StreamingXYStatistics(random_seed = random_seed, sample_size = sample_size)
+        for start in range(0, len(x_values), chunk_size):
+            accumulator.add(x_values[start:start + chunk_size], y_values[start:start + chunk_size])
+        return accumulator
+
+
+    def assertStatisticsEqual(self, streamed, expected, metrics):
+        for k in metrics:
+            self.assertTrue(numpy.allclose(get_statistic(streamed[k]), get_statistic(expected[k]), rtol = 1e-9, atol = 1e-12), k)
+            if isinstance(expected[k], tuple) or hasattr(expected[k], 'pvalue'):
+                self.assertTrue(numpy.allclose(streamed[k][1], expected[k][1], rtol = 1e-6, atol = 1e-12), k)
+
+
+    def test_merged_accumulators_match_one_shot_statistics(self):
+        x_values, y_values = map(numpy.array, tied_data(500, 6))
+        # Offset the values so that the running sums would lose precision without the pairwise update
+        x_values, y_values = x_values + 1e4, y_values + 1e4
+        metrics = stats.StreamingXYStatistics.exact_metrics + stats.StreamingXYStatistics.approximate_metrics
+        expected = stats._get_xy_dataset_statistics(x_values, y_values, metrics = metrics)
+
+        single = self.get_accumulator(x_values, y_values, 37, 1)
+        merged = self.get_accumulator(x_values[:180], y_values[:180], 50, 2).merge(self.get_accumulator(x_values[180:], y_values[180:], 64, 3))
+        merged.merge(stats.StreamingXYStatistics(random_seed = 4))
+        for accumulator in [single, merged]:
+            self.assertTrue(accumulator.is_sample_exact())
+            streamed = accumulator.get_statistics()
+            self.assertEqual(streamed['num_points'], len(x_values))
+            self.assertFalse('approximate_metrics' in streamed)
+            self.assertStatisticsEqual(streamed, expected, metrics)
+
+
+    def test_sampled_rank_metrics(self):
+        x_values, y_values = map(numpy.array, tied_data(300, 7))
+        sample_size = 100
+        merged = self.get_accumulator(x_values[:150], y_values[:150], 40, 5, sample_size = sample_size).merge(self.get_accumulator(x_values[150:], y_values[150:], 40, 6, sample_size = sample_size))
+        self.assertFalse(merged.is_sample_exact())
+        streamed = merged.get_statistics()
+
+        # The exact metrics do not depend on the sample
+        self.assertStatisticsEqual(streamed, stats._get_xy_dataset_statistics(x_values, y_values, metrics = stats.StreamingXYStatistics.exact_metrics), stats.StreamingXYStatistics.exact_metrics)
+
+        # The rank-based metrics are those of the sampled points, which are a subset of the points
+        self.assertEqual(streamed['sample_size'], sample_size)
+        self.assertEqual(sorted(streamed['approximate_metrics']), sorted(stats.StreamingXYStatistics.approximate_metrics))
+        points = set(zip(x_values, y_values))
+        self.assertTrue(set(zip(merged.sample_x, merged.sample_y)).issubset(points))
+        self.assertStatisticsEqual(streamed, stats._get_xy_dataset_statistics(merged.sample_x, merged.sample_y, metrics = stats.StreamingXYStatistics.approximate_metrics), stats.StreamingXYStatistics.approximate_metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -217,3 +217,22 @@ if __name__ == '__main__':
             #     all_data_points[i],
             #     all_data_points[j]
             # )
+
+        # Summarize all score functions against the first (experimental) results at once
+        interface_data_points = [compress(data_points, data_id_in_interface) for data_points in all_data_points]
+        summary_stats = stats.get_multi_predictor_statistics(
+            interface_data_points[i],
+            list(zip(*[interface_data_points[j] for j in range(len(score_fxns)) if j != i])),
+            y_names = [score_fxn for j, score_fxn in enumerate(score_fxns) if j != i]
+        )
+        summary_lines = ['%s %s %s %s %s' % ('Score function'.ljust(32), "Pearson's R".rjust(12), "Spearman's R".rjust(12), 'MAE'.rjust(8), 'Fraction correct'.rjust(16))]
+        for score_fxn, score_fxn_stats in summary_stats.items():
+            summary_lines.append('%s %12.3f %12.3f %8.3f %16.3f' % (
+                score_fxn.ljust(32), score_fxn_stats['pearsonr'][0], score_fxn_stats['spearmanr'][0],
+                score_fxn_stats['MAE'], score_fxn_stats['fraction_correct']
+            ))
+        with open(os.path.join(analysis_output_dir, '%s-stats.txt' % os.path.basename(output_dir)), 'a') as f:
+            f.write('interface_pts - %s vs all score functions\n' % i_score_fxn)
+            f.write('\n'.join(summary_lines))
+            f.write('\n\n')
+        print('\n'.join(summary_lines))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python2
+
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""\
+Statistical comparison of several benchmark runs over the same dataset.
+
+The predictions of all runs are aligned on the dataset record IDs once, giving a matrix with one row per run and one
+column per case. The metrics of every run, the paired bootstrap distributions of the metric differences, the paired
+permutation tests, the dependent correlation tests, and the per-case win/loss counts are all computed from this matrix
+with array operations over all runs or run pairs at once.
+"""
+
+import numpy
+
+from analysis.stats import fraction_correct_values_array, pearsonr_array
+
+
+# The metrics used to compare the runs. Larger values are better for all metrics except the MAE.
+metric_names = ['Pearson', 'MAE', 'FractionCorrect']
+lower_is_better = set(['MAE'])
+
+
+def prediction_metrics(predictions, experimental, x_cutoff = 1.0, y_cutoff = 1.0):
+    '''Returns a dict mapping the metric names to arrays of the metric values computed over the last axis. predictions and
+       experimental may have any shapes which broadcast together e.g. (runs, cases) and (cases,), or (runs, samples, cases)
+       and (samples, cases) for bootstrap samples. The Pearson correlation coefficient and the fraction correct are those of
+       analysis.stats (pearsonr_array and fraction_correct_values_array).'''
+    predictions, experimental = numpy.broadcast_arrays(predictions, experimental)
+    return dict(
+        Pearson = pearsonr_array(experimental, predictions),
+        MAE = numpy.abs(predictions - experimental).mean(axis = -1),
+        FractionCorrect = fraction_correct_values_array(experimental, predictions, x_cutoff = x_cutoff, y_cutoff = y_cutoff).mean(axis = -1),
+    )
+
+
+class RunComparison(object):
+    '''Compares the predictions of several runs over the cases which all of the runs predicted.'''
+
+
+    def __init__(self, run_predictions, experimental_values, x_cutoff = 1.0, y_cutoff = 1.0, max_chunk_size = 1 << 22):
+        '''run_predictions maps run names to dicts (or pandas Series) mapping record IDs to predicted values and
+           experimental_values maps record IDs to experimental values. Cases with a missing value in any run are omitted.
+           max_chunk_size bounds the number of matrix entries created at once by the resampling methods.'''
+        self.run_names = sorted(run_predictions.keys())
+        record_ids = set(experimental_values.keys())
+        for run_name in self.run_names:
+            record_ids = record_ids.intersection(run_predictions[run_name].keys())
+        self.record_ids = sorted(record_ids)
+        self.predictions = numpy.array([[run_predictions[run_name][record_id] for record_id in self.record_ids] for run_name in self.run_names], dtype = numpy.float64).reshape((len(self.run_names), len(self.record_ids)))
+        self.experimental = numpy.array([experimental_values[record_id] for record_id in self.record_ids], dtype = numpy.float64)
+
+        complete_cases = ~(numpy.isnan(self.predictions).any(axis = 0) | numpy.isnan(self.experimental))
+        self.record_ids = [record_id for record_id, complete in zip(self.record_ids, complete_cases) if complete]
+        self.predictions, self.experimental = self.predictions[:, complete_cases], self.experimental[complete_cases]
+
+        self.x_cutoff, self.y_cutoff = x_cutoff, y_cutoff
+        self.max_chunk_size = max_chunk_size
+
+        # The run pairs (a, b) with a < b
+        self.pairs = [(a, b) for a in range(len(self.run_names)) for b in range(a + 1, len(self.run_names))]
+        self.pair_a = numpy.array([a for a, b in self.pairs], dtype = numpy.int64)
+        self.pair_b = numpy.array([b for a, b in self.pairs], dtype = numpy.int64)
+
+
+    def get_metrics(self, predictions = None, experimental = None):
+        if predictions is None:
+            predictions, experimental = self.predictions, self.experimental
+        return prediction_metrics(predictions, experimental, x_cutoff = self.x_cutoff, y_cutoff = self.y_cutoff)
+
+
+    def get_chunk_size(self, rows):
+        return max(1, self.max_chunk_size // max(1, rows * len(self.record_ids)))
+
+
+    def bootstrap(self, num_samples, random_state):
+        '''Returns a dict mapping the metric names to arrays of shape (runs, num_samples) of the metrics computed over
+           paired bootstrap samples of the cases i.e. the same resampled cases are used for all runs in each sample.'''
+        num_cases = len(self.record_ids)
+        samples = dict((metric_name, numpy.empty((len(self.run_names), num_samples), dtype = numpy.float64)) for metric_name in metric_names)
+        chunk_size = self.get_chunk_size(len(self.run_names))
+        for start in range(0, num_samples, chunk_size):
+            stop = min(num_samples, start + chunk_size)
+            indices = random_state.randint(0, num_cases, size = (stop - start, num_cases))
+            metrics = self.get_metrics(self.predictions[:, indices], self.experimental[indices])
+            for metric_name in metric_names:
+                samples[metric_name][:, start:stop] = metrics[metric_name]
+        return samples
+
+
+    def permutation_test(self, num_permutations, random_state):
+        '''Returns a dict mapping the metric names to arrays of the two-sided p-values of a paired permutation test for
+           each run pair. Under the null hypothesis that the two runs are exchangeable, the predictions of the two runs are
+           swapped for a random subset of the cases in each permutation. The same permutations are used for all pairs.'''
+        observed = self.get_metrics()
+        observed_deltas = dict((metric_name, numpy.abs(observed[metric_name][self.pair_a] - observed[metric_name][self.pair_b])) for metric_name in metric_names)
+        exceedances = dict((metric_name, numpy.zeros(len(self.pairs), dtype = numpy.int64)) for metric_name in metric_names)
+        predictions_a, predictions_b = self.predictions[self.pair_a][:, numpy.newaxis, :], self.predictions[self.pair_b][:, numpy.newaxis, :]
+        chunk_size = self.get_chunk_size(2 * len(self.pairs))
+        for start in range(0, num_permutations, chunk_size):
+            stop = min(num_permutations, start + chunk_size)
+            swaps = random_state.randint(0, 2, size = (stop - start, len(self.record_ids))).astype(bool)
+            metrics_a = self.get_metrics(numpy.where(swaps, predictions_b, predictions_a), self.experimental)
+            metrics_b = self.get_metrics(numpy.where(swaps, predictions_a, predictions_b), self.experimental)
+            for metric_name in metric_names:
+                permuted_deltas = numpy.abs(metrics_a[metric_name] - metrics_b[metric_name])
+                exceedances[metric_name] += (permuted_deltas >= observed_deltas[metric_name][:, numpy.newaxis] - 1e-12).sum(axis = 1)
+        return dict((metric_name, (exceedances[metric_name] + 1.0) / (num_permutations + 1.0)) for metric_name in metric_names)
+
+
+    def dependent_correlation_test(self):
+        '''Returns the pair (t, p) of arrays of Williams' t statistic and two-sided p-value for each run pair, testing whether
+           the correlations of the two runs with the experimental values differ given the correlation between the two runs
+           (Steiger, 1980, Psychological Bulletin 87(2):245-251, equation 7).'''
+        from scipy.stats import t as t_distribution
+        n = float(len(self.record_ids))
+        r_y = self.get_metrics()['Pearson']
+        r_ab = numpy.corrcoef(self.predictions)[self.pair_a, self.pair_b] if len(self.run_names) > 1 else numpy.zeros(0)
+        r_a, r_b = r_y[self.pair_a], r_y[self.pair_b]
+        determinant = 1.0 - r_a ** 2 - r_b ** 2 - r_ab ** 2 + 2.0 * r_a * r_b * r_ab
+        r_mean = (r_a + r_b) / 2.0
+        with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+            t = (r_a - r_b) * numpy.sqrt(((n - 1.0) * (1.0 + r_ab)) / (2.0 * ((n - 1.0) / (n - 3.0)) * determinant + (r_mean ** 2) * ((1.0 - r_ab) ** 3)))
+        return t, 2.0 * t_distribution.sf(numpy.abs(t), n - 3.0)
+
+
+    def win_loss(self):
+        '''Returns a pair (wins, ties) of (runs, runs) matrices where wins[a, b] is the number of cases for which run a has a
+           lower absolute error than run b and ties[a, b] is the number of cases for which the absolute errors are equal.'''
+        errors = numpy.abs(self.predictions - self.experimental)
+        wins = (errors[:, numpy.newaxis, :] < errors[numpy.newaxis, :, :]).sum(axis = -1)
+        ties = (errors[:, numpy.newaxis, :] == errors[numpy.newaxis, :, :]).sum(axis = -1)
+        return wins, ties
+
+
+    def best_runs(self):
+        '''Returns an array with the index of the run with the lowest absolute error for each case.'''
+        return numpy.abs(self.predictions - self.experimental).argmin(axis = 0)
+
+
+    def pairwise_table(self, num_bootstrap_samples, num_permutations, random_state):
+        '''Returns a list of dicts, one per run pair and metric, with the metric difference (run A - run B), its 95% paired
+           bootstrap confidence interval and p-value, the permutation test p-value and, for the Pearson correlation
+           coefficient, the p-value of the dependent correlation test.'''
+        observed = self.get_metrics()
+        bootstrap_samples = self.bootstrap(num_bootstrap_samples, random_state)
+        permutation_p_values = self.permutation_test(num_permutations, random_state)
+        dependent_t, dependent_p_values = self.dependent_correlation_test()
+        table = []
+        for metric_name in metric_names:
+            deltas = bootstrap_samples[metric_name][self.pair_a] - bootstrap_samples[metric_name][self.pair_b]
+            lower, upper = numpy.nanpercentile(deltas, 2.5, axis = 1), numpy.nanpercentile(deltas, 97.5, axis = 1)
+            bootstrap_p_values = numpy.minimum(1.0, 2.0 * numpy.minimum((deltas <= 0).mean(axis = 1), (deltas >= 0).mean(axis = 1)))
+            for x, (a, b) in enumerate(self.pairs):
+                table.append(dict(
+                    RunA = self.run_names[a],
+                    RunB = self.run_names[b],
+                    Metric = metric_name,
+                    ValueA = observed[metric_name][a],
+                    ValueB = observed[metric_name][b],
+                    Delta = observed[metric_name][a] - observed[metric_name][b],
+                    Delta_2_5 = lower[x],
+                    Delta_97_5 = upper[x],
+                    BootstrapP = bootstrap_p_values[x],
+                    PermutationP = permutation_p_values[metric_name][x],
+                    DependentCorrelationP = dependent_p_values[x] if metric_name == 'Pearson' else numpy.nan,
+                ))
+        return table
@@ -0,0 +1,217 @@
+#!/usr/bin/env python2
+
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""\
+Score-term reweighting for ddg_monomer benchmark runs.
+
+The predicted DDG of a case is the difference between the (averaged) total scores of the mutant and wildtype structures
+and the total score is a sum of weighted score terms. Given the per-case differences of each score term, a reweighted
+score function therefore gives the predictions X.w where X is the matrix with one row per case and one column per score
+term. This module assembles X once from the stored per-structure scores (see structure_scores.py) or from the summary
+components reported in ddg_predictions.out and fits the term weights against the experimental DDG values, either by
+regularized (ridge) least squares or by a regularized pairwise ranking objective. Out-of-fold predictions from k-fold
+cross-validation are used to report the metrics of the candidate weights so that the effect of a reweighted score
+function can be estimated without rerunning the benchmark.
+"""
+
+import numpy
+
+import comparison
+
+
+# The objectives which can be used to fit the weights
+objectives = ['least_squares', 'rank']
+
+
+###
+#  Component matrices
+###
+
+
+def component_difference_matrix(store, take_lowest, record_ids = None, score_terms = None):
+    '''Returns a pair (matrix, score_terms) where the matrix has one row per case (in the order of record_ids, or the store
+       order if record_ids is None) and one column per score term. Each entry is the average value of the term over the
+       take_lowest lowest-scoring (by total score) mutant structures minus the average over the take_lowest lowest-scoring
+       wildtype structures. With unit weights, the sum over the terms reproduces the DDG_Top<take_lowest> prediction.'''
+    if score_terms is None:
+        score_terms = [t for t in store.score_terms if t != 'total']
+    rows = None
+    if record_ids is not None:
+        rows = numpy.array([store.case_index[record_id] for record_id in record_ids], dtype = numpy.int64)
+
+    counts = {}
+    for state in ['Mutant', 'WildType']:
+        counts[state] = store.get_sorted_scores(state)[1]
+        if rows is not None:
+            counts[state] = counts[state][rows]
+    fair_top = numpy.minimum(take_lowest, numpy.minimum(counts['Mutant'], counts['WildType']))
+    columns = numpy.maximum(fair_top - 1, 0)
+
+    matrix = numpy.zeros((len(fair_top), len(score_terms)), dtype = numpy.float64)
+    for state, sign in [('Mutant', 1.0), ('WildType', -1.0)]:
+        for x, score_term in enumerate(score_terms):
+            term_scores = store.get_sorted_scores(state, score_term, sort_term = 'total')[0]
+            if rows is not None:
+                term_scores = term_scores[rows]
+            sums = numpy.nancumsum(term_scores, axis = 1)[numpy.arange(len(fair_top)), columns]
+            with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+                matrix[:, x] += sign * sums / fair_top
+    matrix[fair_top == 0] = numpy.nan
+    return matrix, score_terms
+
+
+def summary_component_matrix(analysis_data, record_ids, score_terms = None):
+    '''Returns a pair (matrix, score_terms) built from the DDG_components reported by ddg_monomer in ddg_predictions.out.
+       Terms missing from a case are taken to be zero.'''
+    if score_terms is None:
+        score_terms = set()
+        for record_id in record_ids:
+            for k, v in analysis_data[record_id].get('DDG_components', {}).items():
+                if k != 'total' and isinstance(v, float):
+                    score_terms.add(k)
+        score_terms = sorted(score_terms)
+    matrix = numpy.array([[analysis_data[record_id].get('DDG_components', {}).get(t, 0.0) for t in score_terms] for record_id in record_ids], dtype = numpy.float64)
+    return matrix.reshape((len(record_ids), len(score_terms))), score_terms
+
+
+###
+#  Fitting
+###
+
+
+def _standardize(X):
+    '''Returns the column means and standard deviations of X. Constant columns are given a unit standard deviation.'''
+    means = X.mean(axis = 0)
+    stds = X.std(axis = 0)
+    stds[stds == 0] = 1.0
+    return means, stds
+
+
+def fit_least_squares(X, y, alphas):
+    '''Fits y ~ X.w + b by ridge regression for each regularization strength in alphas at once. The penalty alpha * |w|^2
+       is applied to the weights of the standardized columns so that it does not depend on the scale of the score terms.
+       Returns a pair (weights, intercepts) of shapes (len(alphas), number of terms) and (len(alphas),).'''
+    alphas = numpy.asarray(alphas, dtype = numpy.float64)
+    means, stds = _standardize(X)
+    Xs = (X - means) / stds
+    y_mean = y.mean()
+    U, S, Vt = numpy.linalg.svd(Xs, full_matrices = False)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        shrinkage = S[numpy.newaxis, :] / (S[numpy.newaxis, :] ** 2 + alphas[:, numpy.newaxis])
+    shrinkage[~numpy.isfinite(shrinkage)] = 0.0 # singular directions of the unregularized fit
+    standardized_weights = (shrinkage * U.T.dot(y - y_mean)[numpy.newaxis, :]).dot(Vt)
+    weights = standardized_weights / stds[numpy.newaxis, :]
+    return weights, y_mean - weights.dot(means)
+
+
+def sample_pairs(y, max_pairs, random_state):
+    '''Returns a pair (first, second) of arrays of case indices for the pairs of cases with different experimental values.
+       All such pairs are returned if there are at most max_pairs pairs of cases; otherwise max_pairs pairs are drawn
+       uniformly at random (with replacement) so that the cost of the ranking objective does not grow with the square of
+       the number of cases.'''
+    num_cases = len(y)
+    if num_cases * (num_cases - 1) // 2 <= max_pairs:
+        first, second = numpy.triu_indices(num_cases, 1)
+    else:
+        first, second = random_state.randint(0, num_cases, size = (2, max_pairs))
+    different = y[first] != y[second]
+    return first[different], second[different]
+
+
+def fit_rank(X, y, alphas, max_pairs = 100000, random_seed = 0, tolerance = 1e-8):
+    '''Fits the weights by minimizing a regularized pairwise logistic loss over the pairs of cases with different
+       experimental values: a pair contributes log(1 + exp(-sign(y_i - y_j) * (s_i - s_j))) where s = X.w. The mean loss
+       over the pairs (or over a random sample of max_pairs pairs, see sample_pairs) is penalized by
+       (alpha / number of cases) * |w|^2 on the weights of the standardized columns. This rewards predictions which order
+       the cases correctly regardless of their scale. The loss is minimized with L-BFGS-B using its analytic gradient until
+       the relative decrease falls below tolerance, and the fit for each alpha starts from the weights of the previous one.
+       The scores are then mapped onto the experimental scale with a least-squares fit of y ~ a * s + b. Returns a pair
+       (weights, intercepts) as in fit_least_squares.'''
+    from scipy.optimize import minimize
+    from scipy.special import expit
+    alphas = numpy.asarray(alphas, dtype = numpy.float64)
+    means, stds = _standardize(X)
+    Xs = (X - means) / stds
+    first, second = sample_pairs(y, max_pairs, numpy.random.RandomState(random_seed))
+    # Each row is the difference of the standardized components of a pair, oriented so that a positive margin is correct
+    pair_differences = numpy.sign(y[first] - y[second])[:, numpy.newaxis] * (Xs[first] - Xs[second])
+    num_pairs = max(1, len(first))
+
+    def loss_and_gradient(w, alpha):
+        margins = pair_differences.dot(w)
+        loss = numpy.logaddexp(0.0, -margins).sum() / num_pairs + alpha * w.dot(w) / len(y)
+        gradient = -pair_differences.T.dot(expit(-margins)) / num_pairs + 2.0 * alpha * w / len(y)
+        return loss, gradient
+
+    weights = numpy.zeros((len(alphas), X.shape[1]), dtype = numpy.float64)
+    intercepts = numpy.zeros(len(alphas), dtype = numpy.float64)
+    w = numpy.zeros(X.shape[1], dtype = numpy.float64)
+    for x, alpha in enumerate(alphas):
+        if len(first):
+            w = minimize(loss_and_gradient, w, args = (alpha,), jac = True, method = 'L-BFGS-B', options = dict(ftol = tolerance)).x
+
+        # Calibrate the scale and offset of the scores against the experimental values
+        s = Xs.dot(w)
+        s_variance = s.var()
+        scale = ((s - s.mean()) * (y - y.mean())).mean() / s_variance if s_variance > 0 else 0.0
+        weights[x] = scale * w / stds
+        intercepts[x] = y.mean() - weights[x].dot(means)
+    return weights, intercepts
+
+
+def fit(X, y, alphas, objective = 'least_squares'):
+    '''Fits the weights with the objective ("least_squares" or "rank") for each regularization strength in alphas.'''
+    if objective == 'least_squares':
+        return fit_least_squares(X, y, alphas)
+    elif objective == 'rank':
+        return fit_rank(X, y, alphas)
+    raise Exception('Unknown objective "{0}". The objective should be one of: {1}.'.format(objective, ', '.join(objectives)))
+
+
+def fold_indices(num_cases, num_folds, random_state):
+    '''Returns an array assigning each case to one of num_folds folds of (almost) equal size at random.'''
+    return random_state.permutation(numpy.arange(num_cases) % num_folds)
+
+
+def cross_validated_predictions(X, y, alphas, num_folds, random_state, objective = 'least_squares'):
+    '''Returns an array of shape (len(alphas), number of cases) containing the out-of-fold predictions of k-fold
+       cross-validation i.e. the prediction for each case uses weights fitted to the cases in the other folds.'''
+    folds = fold_indices(len(y), num_folds, random_state)
+    predictions = numpy.empty((len(alphas), len(y)), dtype = numpy.float64)
+    for fold in range(num_folds):
+        test = folds == fold
+        if not test.any():
+            continue
+        weights, intercepts = fit(X[~test], y[~test], alphas, objective = objective)
+        predictions[:, test] = weights.dot(X[test].T) + intercepts[:, numpy.newaxis]
+    return predictions
+
+
+###
+#  Metrics
+###
+
+
+def prediction_metrics(predictions, y, x_cutoff = 1.0, y_cutoff = 1.0):
+    '''Returns a dict mapping metric names to arrays with one value per row of predictions (an array of shape
+       (number of candidates, number of cases)).'''
+    return comparison.prediction_metrics(numpy.atleast_2d(predictions), y, x_cutoff = x_cutoff, y_cutoff = y_cutoff)
@@ -52,8 +52,11 @@ Options:
         as a benchmark run. This allows users to compare results with the original publication.
 
     --use_existing_benchmark_data
-        When this option is set, the benchmark_data.json and the pandas HDF5 file is not regenerated. This saves time on
-        subsequent calls to this analysis script but is disabled by default.
+        By default, the extracted data in benchmark_data.json is checked against the size, modification time and hash of
+        the output files of each case (and the extraction parameters) and only new or changed cases are re-extracted. When
+        this option is set, an existing benchmark_data.json file is used without these checks. This saves time on subsequent
+        calls to this analysis script but is disabled by default. The analysis input (analysis_input.pandas) is stored per
+        set of analysis parameters and input data so it is reused whenever these match, regardless of this option.
 
     --force
         When this option is set, the most recent directory in job_output, if it exists, will be used without prompting the user.
@@ -65,6 +68,17 @@ Options:
     -G --do_not_generate_plots
         When this option is set, the graphical plots are not generated.
 
+    --no_r_server
+        By default, the plots are rendered by a persistent R process which keeps the plotting libraries loaded. When this
+        option is set, a separate R CMD BATCH process is run for each plot instead.
+
+    --plot_workers N
+        The maximum number of plots rendered concurrently. By default, one worker is used per processor.
+
+    --plot_backend BACKEND
+        The backend used to render the plots. This should be "R" (ggplot2) or "matplotlib". The matplotlib backend renders
+        the plots in-process and does not require R to be installed. [default: R]
+
     -R --do_not_report_analysis
         When this option is set, the analyses are not printed to screen.
 
@@ -87,15 +101,83 @@ Options:
         of extreme outliers as all predicted values (before scaling) will lie between -CAP and +CAP. This option is not used
         by default.
 
+    -p --parallel NUM_PROCESSORS
+        If this argument is set then the extraction of the benchmark data (benchmark_data.json) from the Rosetta output will
+        use NUM_PROCESSORS which will speed this step up. Otherwise, a single processor will be used.
+
+    --maxp
+        This is a special case of --parallel. If this argument is set then the data extraction will use as many processors
+        as are available on the machine.
+
     --take_lowest N
         When this option is set, the average of the N lowest-scoring (most stable) mutant and wildtypes structures are used to calculate the DDG value. [default: 3]
 
+    --sweep_take_lowest
+        When this option is set, the analysis reports the main metrics for the DDG values computed using the N lowest-scoring
+        mutant and wildtype structures for each N from 1 to the number of structures per case, together with the metrics
+        for the mean and Boltzmann-weighted average scores. The values are computed from the stored per-structure scores
+        (benchmark_structure_scores.npz) so no Rosetta output is re-extracted. The full analysis is not run in this mode.
+
+    --structure_count_convergence
+        When this option is set, the analysis reports how the main metrics converge with the number of structures generated
+        per case. For each k from 1 to the number of structures per case, k wildtype and k mutant structures are randomly
+        drawn from the stored structures of each case (repeated --convergence_repeats times) and the DDG values are computed
+        as in the --take_lowest option. The smallest k whose average metrics are within --convergence_tolerance of the
+        metrics using all structures is reported as a suggested value for the --num_struct option of run_ddg.py. The full
+        analysis is not run in this mode.
+
+    --convergence_repeats N
+        The number of random subsamples drawn for each structure count in the convergence analysis. [default: 100]
+
+    --convergence_tolerance TOL
+        The maximum difference from the Pearson correlation coefficient, the fraction correct, and the MAE using all
+        structures which is considered converged. [default: 0.01]
+
+    --reweight_score_terms
+        When this option is set, the analysis fits new weights for the Rosetta score terms against the experimental DDG
+        values using the per-case differences of each score term between the mutant and wildtype structures, and reports
+        the cross-validated metrics of the reweighted score function for a range of regularization strengths. The weights
+        are written to a CSV file in the analysis directory. The full analysis is not run in this mode.
+
+    --reweighting_objective OBJECTIVE
+        The objective used to fit the score term weights. This should be "least_squares" (ridge regression) or "rank" (a
+        pairwise ranking objective). [default: least_squares]
+
+    --reweighting_source SOURCE
+        The score term differences used to fit the weights. This should be "structures", where the differences are
+        averaged over the --take_lowest lowest-scoring structures, or "summary", where the components reported by ddg_monomer
+        in ddg_predictions.out are used. [default: structures]
+
+    --reweighting_folds K
+        The number of folds used to cross-validate the score term weights. [default: 5]
+
+    --comparison_bootstrap_samples N
+        When more than one benchmark run is analyzed, the runs are compared over the cases which they all predicted. The
+        metric differences between each pair of runs are reported with confidence intervals and p-values from this number
+        of paired bootstrap samples of the cases. [default: 1000]
+
+    --comparison_permutations N
+        The number of random permutations used for the paired permutation test of the metric differences between each
+        pair of benchmark runs. [default: 1000]
+
+    --random_seed SEED
+        The seed used for the random sampling in the analysis so that the results are reproducible. [default: 0]
+
     --use_single_reported_value
         By default, the analysis takes the three lowest-scoring mutant structures and the three lowest-scoring wildtype structures to calculate the DDG value. This approach was taken by Kellogg et al. and should reduce stochastic noise. If this option is set, the single value reported by ddg_monomer is used instead. We do not recommend using this option.
 
     --include_derived_mutations
         Some datasets contain duplicated datapoints in the form of derived mutations e.g. the mutation 107L ->1L63 in the Kellogg set is the reverse of the 1L63 -> 107L mutation and measurement. Including derived mutations creates bias in the analysis so we remove them by default. To include these derived values in the analysis, use this flag.
 
+    --feature_cache_directory DIRECTORY
+        The per-mutation features used in the analysis (exposure, volume change, charge class, DSSP and SCOPe
+        classifications, PDB resolution and chain length) depend only on the dataset, the PDB data in input/json/pdbs.json,
+        and the burial cutoff. These features are computed once and stored in this directory, keyed by a hash of those
+        inputs, so that analyses of other runs against the same dataset reuse them. [default: feature_cache]
+
+    --no_feature_cache
+        When this option is set, the per-mutation features are recomputed and are not stored on disk.
+
 Authors:
     Shane O'Connor
     Kyle Barlow
@@ -105,6 +187,7 @@ import sys
 import os
 import shutil
 import time
+import math
 import datetime
 import inspect
 import multiprocessing
@@ -113,28 +196,41 @@ import glob
 import pprint
 import getpass
 import gzip
-import numpy
+import hashlib
 import pprint
 import subprocess
 import traceback
 import shlex
 import copy
-import pandas
-import io
+from multiprocessing.pool import ThreadPool
 from rosetta.write_run_file import process as write_run_file
 from analysis.libraries import docopt
 from analysis.libraries import colortext
-from analysis.stats import read_file, read_file_lines, write_file, prompt_yn, fraction_correct, fraction_correct_pandas, add_fraction_correct_values_to_dataframe, get_xy_dataset_statistics_pandas, format_stats_for_printing, RInterface, plot_pandas
+from analysis.stats import read_file, read_file_lines, write_file, write_temp_file, delete_file, prompt_yn, fraction_correct_pandas, fraction_correct_values_array, add_fraction_correct_values_to_dataframe, get_xy_dataset_statistics_pandas, format_stats_for_printing, RInterface, plot_pandas
+from analysis.stats import fraction_correct_cutoff_surface, optimum_fraction_correct_cutoff, set_plot_backend, get_multi_predictor_statistics, get_xy_dataset_statistics_grouped
+from analysis import plotting
 
 from run_ddg import task_subfolder as ddg_task_subfolder
+
+# numpy, pandas, and the numerical modules which depend on them (structure_scores, reweighting, and comparison) are
+# imported in the functions which use them so that e.g. --help and argument errors do not pay for their import time
+
 try:
     import json
 except:
     import simplejson as json
 
 
-# Regex used to extract data from Rosetta output
+# Regexes used to extract data from Rosetta output
+ddGMover_prefix = 'protocols.moves.ddGMover: mutate'
 ddGMover_regex = re.compile("^protocols.moves.ddGMover:\s*mutate\s*.*?\s*wildtype_dG\s*is:\s*.*?and\s*mutant_dG\s*is:\s*.*?\s*ddG\s*is:\s*(.*)$")
+wildtype_score_regex = re.compile('(\d+) score before mutation: residue')
+mutant_score_regex = re.compile('(\d+) score after mutation: residue')
+derivative_error_regex = re.compile('inaccurate g', re.IGNORECASE)
+
+
+# The PDB data used to determine the resolution and chain length of the dataset structures
+pdb_data_filepath = '../../input/json/pdbs.json'
 
 
 # Colors used in the plots
@@ -147,6 +243,16 @@ plot_colors = dict(
 )
 
 
+# The colors used for the residue types in the plots
+amino_acid_color_scale = dict(
+    name = "Residue",
+    values = [
+        ("None", '#808080'), ("A", '#FF0000'), ("C", '#BFBF00'), ("D", '#008000'), ("E", "#80FFFF"), ("F", "#8080FF"), ("G", "#BF40BF"), ("H", "#A0A424"), ("I", "#411BEA"), ("K", "#1EAC41"),
+        ("L", "#F0C80E"), ("M", "#B430E5"), ("N", "#ED7651"), ("P", "#19CB97"), ("Q", "#362698"), ("R", "#7E7EB8"), ("S", "#603000"), ("T", "#A71818"), ("V", "#DF8020"), ("W", "#E75858"), ("Y", "#082008")],
+    labels = [("None", "N/A")] + [(aa, aa) for aa in 'ACDEFGHIKLMNPQRSTVWY'],
+)
+
+
 # Human-readable descriptions for the volume breakdown
 by_volume_descriptions = dict(
     SL = 'small-to-large mutations',
@@ -155,6 +261,11 @@ by_volume_descriptions = dict(
 )
 
 
+# The plot dataframe columns over which the metrics are broken down (see BenchmarkRun.calculate_group_metrics)
+metric_group_columns = ['VolumeChange', 'GP', 'ResidueCharges', 'Exposure', 'WTSecondaryStructure', 'WildTypeSCOPClass', 'WildTypeSCOPFold',
+                        'WildTypeSCOPClassification', 'WildTypeAA', 'MutantAA', 'PDBResolutionBin', 'PDBFileID']
+
+
 class ReportingObject(object):
     '''A simple class to allow stdout suppression.'''
 
@@ -191,6 +302,14 @@ class BenchmarkManager(ReportingObject):
         self.burial_cutoff = None
         self.include_derived_mutations = None
         self.stability_classication_x_cutoff, self.stability_classication_y_cutoff = None, None
+        self.num_processors = 1
+        self.feature_cache_directory = None
+        self.sweep_take_lowest = False
+        self.structure_count_convergence = False
+        self.reweight_score_terms = False
+        self.random_seed = 0
+        self.comparison_bootstrap_samples = 1000
+        self.comparison_permutations = 1000
 
         # Parse command-line arguments and extract/load the benchmark input data
         self.parse_arguments(arguments)
@@ -213,12 +332,77 @@ class BenchmarkManager(ReportingObject):
 
         # Plot-generation option
         self.generate_plots = not(arguments['--do_not_generate_plots'])
+        RInterface.use_server = not(arguments['--no_r_server'])
+        self.plot_backend = arguments['--plot_backend']
+        self.plot_workers = multiprocessing.cpu_count()
+        if arguments['--plot_workers']:
+            try:
+                self.plot_workers = int(arguments['--plot_workers'])
+                assert(self.plot_workers > 0)
+            except:
+                raise colortext.Exception('The --plot_workers argument must be a positive integer.')
+        try:
+            set_plot_backend(self.plot_backend)
+        except Exception as e:
+            raise colortext.Exception(str(e))
         self.report_analysis = not(arguments['--do_not_report_analysis'])
         self.silent = arguments['--silent']
 
         # Whether or not we include records marked as derived in the analysis
         self.include_derived_mutations = arguments['--include_derived_mutations']
 
+        # Whether we report the metrics over the DDG estimators rather than running the full analysis
+        self.sweep_take_lowest = arguments.get('--sweep_take_lowest')
+
+        # Structure-count convergence options
+        self.structure_count_convergence = arguments.get('--structure_count_convergence')
+        try:
+            self.convergence_repeats = int(arguments.get('--convergence_repeats') or 100)
+            self.convergence_tolerance = abs(float(arguments.get('--convergence_tolerance') or 0.01))
+            assert(self.convergence_repeats > 0)
+        except:
+            raise colortext.Exception('The --convergence_repeats argument must be a positive integer and the --convergence_tolerance argument must be a float value.')
+        try:
+            self.random_seed = int(arguments.get('--random_seed') or 0)
+        except:
+            raise colortext.Exception('The --random_seed argument must be an integer.')
+
+        # Score-term reweighting options
+        self.reweight_score_terms = arguments.get('--reweight_score_terms')
+        self.reweighting_objective = arguments.get('--reweighting_objective') or 'least_squares'
+        self.reweighting_source = arguments.get('--reweighting_source') or 'structures'
+        if self.reweighting_source not in ['structures', 'summary']:
+            raise colortext.Exception('The --reweighting_source argument must be "structures" or "summary".')
+        try:
+            self.reweighting_folds = int(arguments.get('--reweighting_folds') or 5)
+            assert(self.reweighting_folds > 1)
+        except:
+            raise colortext.Exception('The --reweighting_folds argument must be an integer greater than one.')
+
+        # Cross-run comparison options
+        try:
+            self.comparison_bootstrap_samples = int(arguments.get('--comparison_bootstrap_samples') or 1000)
+            self.comparison_permutations = int(arguments.get('--comparison_permutations') or 1000)
+            assert(self.comparison_bootstrap_samples > 0 and self.comparison_permutations > 0)
+        except:
+            raise colortext.Exception('The --comparison_bootstrap_samples and --comparison_permutations arguments must be positive integers.')
+
+        # The directory used to cache the per-mutation features of the dataset records
+        self.feature_cache_directory = None
+        if not arguments.get('--no_feature_cache'):
+            self.feature_cache_directory = os.path.abspath(arguments.get('--feature_cache_directory') or 'feature_cache')
+
+        # Parallel processing options for the data extraction
+        num_system_processors = multiprocessing.cpu_count()
+        if arguments.get('--maxp'):
+            self.num_processors = num_system_processors
+        elif arguments.get('--parallel'):
+            if not str(arguments['--parallel']).isdigit():
+                raise colortext.Exception('The argument to --parallel must be an integer between 1 and the number of processors (%d).' % num_system_processors)
+            self.num_processors = int(arguments['--parallel'])
+        if 1 > self.num_processors or self.num_processors > num_system_processors:
+            raise colortext.Exception('The number of processors must be an integer between 1 and %d.' % num_system_processors)
+
         # take-lowest option
         try:
             assert(arguments['--take_lowest'].isdigit())
@@ -251,6 +435,13 @@ class BenchmarkManager(ReportingObject):
         except ValueError as e:
             raise colortext.Exception('The stability classification cutoffs (--scx_cutoff, --scy_cutoff) must be float values.')
 
+        # The reweighting objective is checked against reweighting.objectives last, and only when the score terms are to be
+        # reweighted, so that the other argument errors are raised before numpy is imported
+        if self.reweight_score_terms:
+            import reweighting
+            if self.reweighting_objective not in reweighting.objectives:
+                raise colortext.Exception('The --reweighting_objective argument must be one of: {0}.'.format(', '.join(reweighting.objectives)))
+
 
     def setup(self):
         '''Load in the data for all of the specified benchmark_run_directories. This code works on a number of assumptions.
@@ -261,6 +452,7 @@ class BenchmarkManager(ReportingObject):
              - the extracted benchmark data (analysis_data) is:
                 - stored in a file called benchmark_data.json in the benchmark run root directory; or
                 - created in that location by this script.
+             - the per-structure scores are stored in benchmark_structure_scores.npz (see structure_scores.py) in the same directory.
            The loaded data is stored inside BenchmarkRun objects for analysis and cross-analysis. For convenience, the
            analyze method of this class performs all possible single and pair-wise analysis.
         '''
@@ -388,35 +580,10 @@ class BenchmarkManager(ReportingObject):
             except Exception as e:
                 raise colortext.Exception('An error occurred parsing the JSON file: %s..' % str(e))
 
-            # Read the previously extracted benchmark data and structural scores (benchmark_data.json) from file or create that file if it does not exist
-            benchmark_data_filepath = os.path.join(benchmark_run_directory, 'benchmark_data.json')
-            analysis_data = {}
-            if not(os.path.exists(benchmark_data_filepath)) or arguments.get('--use_existing_benchmark_data') == 0:
-                self.log('Creating %s which contains component and summary scores for each case and generated structure.' % benchmark_data_filepath, fn = colortext.warning)
-
-                job_dirs = sorted([jd for jd in glob.glob(os.path.join(ddg_data_dir, '*')) if os.path.isdir(jd) and os.path.split(jd)[1].isdigit()])
-                c, num_dirs = 0.0, float(len(job_dirs)) / 100.0
-                for jd in job_dirs:
-                    jdirname = os.path.split(jd)[1]
-                    record_id = int(jdirname)
-                    c += 1.0
-                    self.log('\rProgress: {0:d}%'.format(int(c/num_dirs)), colortext.wcyan)
-                    if not self.silent: sys.stdout.flush()
-                    analysis_data[record_id] = BenchmarkManager.extract_data(jd, self.take_lowest, prediction_cap = self.prediction_cap)
-                self.log('\rWriting to file...', colortext.wlightpurple)
-                if not self.silent: sys.stdout.flush()
-                write_file(benchmark_data_filepath, json.dumps(analysis_data, indent = 4, sort_keys=True))
-                self.log('\r', colortext.wgrey)
-                if not self.silent: sys.stdout.flush()
-            else:
-                self.log('Found an existing benchmark_data.json file containing component and summary scores for each case and generated structure:', colortext.warning)
-                self.log('\r...loading', colortext.wyellow)
-                if not self.silent: sys.stdout.flush()
-                analysis_data_ = json.loads(read_file(benchmark_data_filepath))
-                for k, v in analysis_data_.items():
-                    analysis_data[int(k)] = v
-                self.log('\r', colortext.wgrey)
-                if not self.silent: sys.stdout.flush()
+            # Read the previously extracted benchmark data and structural scores (benchmark_data.json) from file, updating or
+            # creating that file as necessary
+            analysis_data, structure_scores = self.load_benchmark_data(benchmark_run_directory, ddg_data_dir, trust_existing_data = arguments.get('--use_existing_benchmark_data'))
+            self.add_top_n_predictions(analysis_data, structure_scores)
 
             self.benchmark_run_data[benchmark_run_name] = BenchmarkRun(
                 benchmark_run_name,
@@ -425,15 +592,19 @@ class BenchmarkManager(ReportingObject):
                 dataset_cases,
                 analysis_data,
                 arguments['--use_single_reported_value'],
+                structure_scores = structure_scores,
                 description = benchmark_run_description,
                 dataset_description = dataset_description,
                 credit = benchmark_run_credit,
                 include_derived_mutations = self.include_derived_mutations,
                 take_lowest = self.take_lowest,
                 generate_plots = self.generate_plots,
+                plot_backend = self.plot_backend,
+                plot_workers = self.plot_workers,
                 report_analysis = self.report_analysis,
                 silent = self.silent,
                 burial_cutoff = self.burial_cutoff,
+                feature_cache_directory = self.feature_cache_directory,
                 stability_classication_x_cutoff = self.stability_classication_x_cutoff,
                 stability_classication_y_cutoff = self.stability_classication_y_cutoff,
                 use_existing_benchmark_data = arguments['--use_existing_benchmark_data'],
@@ -453,35 +624,313 @@ class BenchmarkManager(ReportingObject):
             self.log('\nExtracting the run-data the analysis for {0}.'.format(benchmark_run_name), colortext.message)
             br.create_dataframe()
 
+        if self.sweep_take_lowest or self.structure_count_convergence or self.reweight_score_terms:
+            for benchmark_run_name, br in sorted(self.benchmark_run_data.items()):
+                if self.sweep_take_lowest:
+                    self.log('\nReporting the metrics over the DDG estimators for {0}.'.format(benchmark_run_name), colortext.message)
+                    br.sweep_ddg_estimators()
+                if self.structure_count_convergence:
+                    self.log('\nRunning the structure-count convergence analysis for {0}.'.format(benchmark_run_name), colortext.message)
+                    br.analyze_structure_count_convergence(self.convergence_repeats, self.convergence_tolerance, random_seed = self.random_seed)
+                if self.reweight_score_terms:
+                    self.log('\nFitting the score term weights for {0}.'.format(benchmark_run_name), colortext.message)
+                    br.reweight_score_terms(self.reweighting_objective, self.reweighting_folds, source = self.reweighting_source, random_seed = self.random_seed)
+            return
+
         # Run the individual analysis
         for benchmark_run_name, br in sorted(self.benchmark_run_data.items()):
             self.log('\nRunning the analysis for {0}.'.format(benchmark_run_name), colortext.message)
             br.analyze()
 
         # Compare the benchmark runs against each other
-        for x in range(len(benchmark_runs)):
-            for y in range(x + 1, len(benchmark_runs)):
-                pass
-                # todo: run comparative analysis
+        if len(benchmark_runs) > 1:
+            self.log('\nComparing the benchmark runs.', colortext.message)
+            self.compare_runs()
+
+
+    def compare_runs(self):
+        '''Compares the predictions of all benchmark runs over the cases which they all predicted. The predictions are
+           aligned once into a single matrix and the metrics, paired bootstrap and permutation tests, dependent correlation
+           tests, and win/loss counts are computed over all run pairs at once. The results are written to CSV files in the
+           analysis directory.'''
+        import numpy
+        import pandas
+        import comparison
+        run_predictions = dict((benchmark_run_name, br.dataframe['Predicted'].to_dict()) for benchmark_run_name, br in self.benchmark_run_data.items())
+        experimental_values = {}
+        for benchmark_run_name, br in sorted(self.benchmark_run_data.items()):
+            experimental_values.update(br.dataframe['Experimental'].to_dict())
+        run_comparison = comparison.RunComparison(run_predictions, experimental_values, x_cutoff = self.stability_classication_x_cutoff, y_cutoff = self.stability_classication_y_cutoff)
+        run_names = run_comparison.run_names
+        if len(run_comparison.record_ids) < 4:
+            self.log('The benchmark runs have {0} cases in common which is too few to compare them.'.format(len(run_comparison.record_ids)), colortext.warning)
+            return
+
+        random_state = numpy.random.RandomState(self.random_seed)
+        metrics = run_comparison.get_metrics()
+        metrics_dataframe = pandas.DataFrame(dict((metric_name, metrics[metric_name]) for metric_name in comparison.metric_names), index = run_names, columns = comparison.metric_names)
+        metrics_dataframe.index.name = 'BenchmarkRun'
+        metrics_dataframe['BestCases'] = numpy.bincount(run_comparison.best_runs(), minlength = len(run_names))
+        pairwise_dataframe = pandas.DataFrame(run_comparison.pairwise_table(self.comparison_bootstrap_samples, self.comparison_permutations, random_state), columns = ['RunA', 'RunB', 'Metric', 'ValueA', 'ValueB', 'Delta', 'Delta_2_5', 'Delta_97_5', 'BootstrapP', 'PermutationP', 'DependentCorrelationP'])
+        wins, ties = run_comparison.win_loss()
+        wins_dataframe = pandas.DataFrame(wins, index = run_names, columns = run_names)
+        wins_dataframe.index.name = 'BenchmarkRun'
+
+        # The per-case table lists the prediction and absolute error of each run and the run with the lowest error
+        per_case_dataframe = pandas.DataFrame(run_comparison.predictions.T, index = run_comparison.record_ids, columns = run_names)
+        per_case_dataframe.index.name = 'DatasetID'
+        per_case_dataframe.insert(0, 'Experimental', run_comparison.experimental)
+        for x, benchmark_run_name in enumerate(run_names):
+            per_case_dataframe['{0}_AbsoluteError'.format(benchmark_run_name)] = numpy.abs(run_comparison.predictions[x] - run_comparison.experimental)
+        per_case_dataframe['BestRun'] = [run_names[x] for x in run_comparison.best_runs()]
+
+        metrics_dataframe.to_csv(os.path.join(self.analysis_directory, 'comparison_metrics.csv'), sep = ',', header = True)
+        pairwise_dataframe.to_csv(os.path.join(self.analysis_directory, 'comparison_pairwise.csv'), sep = ',', header = True, index = False)
+        wins_dataframe.to_csv(os.path.join(self.analysis_directory, 'comparison_wins.csv'), sep = ',', header = True)
+        per_case_dataframe.to_csv(os.path.join(self.analysis_directory, 'comparison_per_case.csv'), sep = ',', header = True)
+
+        self.log('*' * 10 + ' Benchmark run comparison ' + '*' * 10, colortext.message)
+        self.log('The {0} benchmark runs were compared over {1} common cases using {2} bootstrap samples and {3} permutations.'.format(len(run_names), len(run_comparison.record_ids), self.comparison_bootstrap_samples, self.comparison_permutations))
+        self.log(metrics_dataframe.to_string())
+        for metric_name in comparison.metric_names:
+            significant = pairwise_dataframe[(pairwise_dataframe['Metric'] == metric_name) & (pairwise_dataframe['PermutationP'] < 0.05)]
+            for idx, r in significant.iterrows():
+                better, worse = r['RunA'], r['RunB']
+                if (r['Delta'] < 0) != (metric_name in comparison.lower_is_better):
+                    better, worse = worse, better
+                self.log('{0}: {1} is better than {2} (difference {3:.3f}, 95% CI [{4:.3f}, {5:.3f}], permutation p={6:.3g}).'.format(metric_name, better, worse, r['Delta'], r['Delta_2_5'], r['Delta_97_5'], r['PermutationP']), colortext.sprint)
+        self.log('Per-case wins (row run has a lower absolute error than column run):')
+        self.log(wins_dataframe.to_string())
 
 
     ###
     #  Data-extraction methods
     ###
 
+
+    def load_benchmark_data(self, benchmark_run_directory, ddg_data_dir, trust_existing_data = False):
+        '''Returns the extracted data for each case of the benchmark run and a StructureScoreStore containing the per-structure
+           scores. The summary data is cached in benchmark_data.json, the per-structure scores are cached in
+           benchmark_structure_scores.npz, and the fingerprints of the case output files used to create them are stored in
+           benchmark_data_fingerprints.json. Only cases which are new or whose output files have changed are re-extracted.
+           If trust_existing_data is set then existing files are used as-is.'''
+        from structure_scores import StructureScoreStore, states as structure_score_states, write_store as write_structure_score_store
+
+        benchmark_data_filepath = os.path.join(benchmark_run_directory, 'benchmark_data.json')
+        fingerprints_filepath = os.path.join(benchmark_run_directory, 'benchmark_data_fingerprints.json')
+        structure_scores_filepath = os.path.join(benchmark_run_directory, 'benchmark_structure_scores.npz')
+
+        analysis_data, fingerprints, structure_scores = {}, {}, None
+        case_tables = {} # per-structure scores which are not yet in the store
+        if os.path.exists(benchmark_data_filepath):
+            self.log('Found an existing benchmark_data.json file containing component and summary scores for each case and generated structure:', colortext.warning)
+            self.log('\r...loading', colortext.wyellow)
+            if not self.silent: sys.stdout.flush()
+            for k, v in json.loads(read_file(benchmark_data_filepath)).items():
+                analysis_data[int(k)] = v
+            if os.path.exists(fingerprints_filepath):
+                for k, v in json.loads(read_file(fingerprints_filepath)).items():
+                    fingerprints[int(k)] = v
+            if os.path.exists(structure_scores_filepath):
+                structure_scores = StructureScoreStore(structure_scores_filepath)
+
+            # Files created by older versions of this script contain the per-structure scores as nested dicts. Move them into the store.
+            case_tables = BenchmarkManager.pop_structure_score_tables(analysis_data)
+
+            self.log('\r', colortext.wgrey)
+            if not self.silent: sys.stdout.flush()
+            if trust_existing_data and not case_tables and structure_scores and len(structure_scores) == len(analysis_data):
+                return analysis_data, structure_scores
+        else:
+            self.log('Creating %s which contains component and summary scores for each case and generated structure.' % benchmark_data_filepath, fn = colortext.warning)
+
+        # Determine which cases need to be extracted
+        job_dirs = sorted([jd for jd in glob.glob(os.path.join(ddg_data_dir, '*')) if os.path.isdir(jd) and os.path.split(jd)[1].isdigit()])
+        record_ids = set()
+        stale_job_dirs = []
+        fingerprints_changed = False
+        for jd in job_dirs:
+            record_id = int(os.path.split(jd)[1])
+            record_ids.add(record_id)
+            previous_fingerprint = fingerprints.get(record_id)
+            fingerprint = self.get_case_fingerprint(jd, previous_fingerprint)
+            has_structure_scores = (record_id in case_tables) or (structure_scores and record_id in structure_scores)
+            if record_id not in analysis_data or not(has_structure_scores) or BenchmarkManager.get_comparable_fingerprint(fingerprint) != BenchmarkManager.get_comparable_fingerprint(previous_fingerprint):
+                stale_job_dirs.append(jd)
+            if fingerprint != previous_fingerprint:
+                fingerprints[record_id] = fingerprint
+                fingerprints_changed = True
+        removed_record_ids = sorted(set(analysis_data.keys()).union(fingerprints.keys()).difference(record_ids))
+
+        if not(stale_job_dirs or removed_record_ids or fingerprints_changed or case_tables):
+            return analysis_data, structure_scores
+
+        # Extract the new and changed cases and remove the cases whose output no longer exists
+        if removed_record_ids:
+            self.log('Removing {0} cases whose output directories no longer exist.'.format(len(removed_record_ids)), colortext.warning)
+        for record_id in removed_record_ids:
+            analysis_data.pop(record_id, None)
+            fingerprints.pop(record_id, None)
+            case_tables.pop(record_id, None)
+        if stale_job_dirs:
+            self.log('Extracting the data for {0} new or changed cases out of {1}.'.format(len(stale_job_dirs), len(job_dirs)), colortext.message)
+            extracted_data = self.extract_run_data(stale_job_dirs)
+            case_tables.update(BenchmarkManager.pop_structure_score_tables(extracted_data))
+            analysis_data.update(extracted_data)
+
+        self.log('\rWriting to file...', colortext.wlightpurple)
+        if not self.silent: sys.stdout.flush()
+        if case_tables or removed_record_ids:
+            # Cases which were not re-extracted are copied from the existing store
+            for record_id in analysis_data.keys():
+                if record_id not in case_tables:
+                    case_tables[record_id] = dict((state, structure_scores.get_case_table(state, record_id)) for state in structure_score_states)
+            if structure_scores:
+                structure_scores.close()
+            write_structure_score_store(structure_scores_filepath, case_tables)
+            structure_scores = StructureScoreStore(structure_scores_filepath)
+        write_file(benchmark_data_filepath, json.dumps(analysis_data, indent = 4, sort_keys=True))
+        write_file(fingerprints_filepath, json.dumps(fingerprints, indent = 4, sort_keys=True))
+        self.log('\r', colortext.wgrey)
+        if not self.silent: sys.stdout.flush()
+        return analysis_data, structure_scores
+
+
+    def add_top_n_predictions(self, analysis_data, structure_scores):
+        '''Sets the DDG_Top3 and DDG_Top<take_lowest> values of each case, capped if a prediction cap was specified, from the
+           per-structure scores. The values are computed for all cases at once so changing take_lowest or the prediction cap
+           does not require the Rosetta output to be re-extracted.'''
+        from structure_scores import ddg_top_n
+        if not structure_scores:
+            return
+        record_ids = sorted([record_id for record_id in analysis_data if record_id in structure_scores])
+        for n in sorted(set([3, self.take_lowest])):
+            values = ddg_top_n(structure_scores, n, record_ids = record_ids, prediction_cap = self.prediction_cap)
+            for record_id, value in zip(record_ids, values.tolist()):
+                analysis_data[record_id]['DDG_Top%d' % n] = None if math.isnan(value) else value
+
+
+    @staticmethod
+    def pop_structure_score_tables(analysis_data):
+        '''Removes the per-structure score dicts from the extracted data and returns them as tables for the StructureScoreStore.'''
+        from structure_scores import table_from_score_dicts, states as structure_score_states
+        case_tables = {}
+        for record_id, scores in analysis_data.items():
+            if 'WildType_scores' in scores:
+                case_tables[record_id] = dict((state, table_from_score_dicts(scores.pop('{0}_scores'.format(state)))) for state in structure_score_states)
+        return case_tables
+
+
+    # The case output files used to create the extracted data
+    case_output_files = ['rosetta.out.gz', 'ddg_predictions.out']
+
+
+    def get_case_fingerprint(self, job_dir, previous_fingerprint = None):
+        '''Returns a fingerprint of the case output files (size, modification time, and SHA-1 hash). The extracted data does not
+           depend on take_lowest or the prediction cap as the DDG_TopN values are recomputed by add_top_n_predictions.
+           The hash of a file is only recomputed if its size or modification time differs from the previous fingerprint.'''
+        previous_files = (previous_fingerprint or {}).get('files', {})
+        files = {}
+        for filename in BenchmarkManager.case_output_files:
+            filepath = os.path.join(job_dir, filename)
+            if not os.path.exists(filepath):
+                files[filename] = None
+                continue
+            file_stat = os.stat(filepath)
+            previous_file = previous_files.get(filename)
+            if previous_file and previous_file['size'] == file_stat.st_size and previous_file['mtime'] == file_stat.st_mtime:
+                sha1 = previous_file['sha1']
+            else:
+                sha1 = BenchmarkManager.get_file_hash(filepath)
+            files[filename] = dict(size = file_stat.st_size, mtime = file_stat.st_mtime, sha1 = sha1)
+        return dict(files = files)
+
+
+    @staticmethod
+    def get_comparable_fingerprint(fingerprint):
+        '''Returns a copy of the fingerprint without the modification times. A file which was touched or copied but not
+           changed has the same size and hash so its extracted data can be reused.'''
+        if not fingerprint:
+            return None
+        files = {}
+        for filename, file_fingerprint in fingerprint.get('files', {}).items():
+            if file_fingerprint:
+                file_fingerprint = dict(size = file_fingerprint['size'], sha1 = file_fingerprint['sha1'])
+            files[filename] = file_fingerprint
+        return dict(files = files)
+
+
+    @staticmethod
+    def get_file_hash(filepath, block_size = 1 << 20):
+        h = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            block = f.read(block_size)
+            while block:
+                h.update(block)
+                block = f.read(block_size)
+        return h.hexdigest()
+
+
+    def extract_run_data(self, job_dirs):
+        '''Extracts the data for each job directory, using a pool of self.num_processors processes if more than one processor
+           is to be used. The job directories are split into chunks so that each work unit amortizes the inter-process
+           communication over several cases. Returns a dict mapping record IDs to the extracted data.'''
+        num_jobs = len(job_dirs)
+        if not num_jobs:
+            return {}
+        num_processors = min(self.num_processors, num_jobs)
+
+        # Use several chunks per processor so that the load is balanced and the progress display updates regularly
+        chunk_size = max(1, int(math.ceil(num_jobs / float(num_processors * 8))))
+        work_units = [(job_dirs[x:x + chunk_size], self.take_lowest, self.prediction_cap) for x in range(0, num_jobs, chunk_size)]
+
+        pool = None
+        if num_processors > 1:
+            self.log('Extracting the data from {0} cases using {1} processors.'.format(num_jobs, num_processors))
+            pool = multiprocessing.Pool(processes = num_processors)
+            results = pool.imap_unordered(extract_data_work_unit, work_units)
+        else:
+            results = (extract_data_work_unit(wu) for wu in work_units)
+
+        extracted_data = {}
+        start_time = time.time()
+        try:
+            for work_unit_results in results:
+                for record_id, scores, error in work_unit_results:
+                    if error:
+                        raise colortext.Exception(error)
+                    extracted_data[record_id] = scores
+                self.log_progress(len(extracted_data), num_jobs, start_time)
+            if pool:
+                pool.close()
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+        # Merge the results in record ID order so that the output does not depend on the order in which the work units completed
+        return dict((record_id, extracted_data[record_id]) for record_id in sorted(extracted_data))
+
+
+    def log_progress(self, num_completed, num_jobs, start_time):
+        '''Prints a progress line with an estimate of the time remaining.'''
+        if self.silent:
+            return
+        elapsed = time.time() - start_time
+        eta = ''
+        if num_completed < num_jobs and num_completed > 0:
+            eta = ', ETA {0}'.format(datetime.timedelta(seconds = int(elapsed * (num_jobs - num_completed) / float(num_completed))))
+        self.log('\rProgress: {0}/{1} ({2:d}%), elapsed {3}{4}    '.format(num_completed, num_jobs, int(100 * num_completed / float(num_jobs)), datetime.timedelta(seconds = int(elapsed)), eta), colortext.wcyan)
+        sys.stdout.flush()
+
+
     @staticmethod
     def extract_data(ddg_output_path, take_lowest, prediction_cap = None):
         '''Extract the data for one dataset case.
            Note: This function is written to handle data from Rosetta at the time of writing. This will need to be altered to
            work with certain older revisions and may need to be adapted to work with future revisions.'''
-        scores = {}
-        rosetta_output_lines = BenchmarkManager.read_stdout(ddg_output_path)
-        scores['Errors'] = BenchmarkManager.extract_errors(rosetta_output_lines)
-        scores['DDG'] = BenchmarkManager.extract_predicted_ddg(rosetta_output_lines)
+        scores = BenchmarkManager.read_stdout(ddg_output_path)
         scores['DDG_components'] = BenchmarkManager.extract_summary_data(ddg_output_path)
-        for k, v in BenchmarkManager.get_ddg_monomer_scores_per_structure(rosetta_output_lines).items():
-            assert(k not in scores)
-            scores[k] = v
 
         top_values = set([3, take_lowest])
         for x in top_values:
@@ -503,36 +952,75 @@ class BenchmarkManager(ReportingObject):
 
     @staticmethod
     def read_stdout(ddg_output_path):
+        '''Parses the gzipped ddg_monomer output for one case in a single streaming pass. The file is never held in memory.'''
+        output_file = os.path.join(ddg_output_path, 'rosetta.out.gz')
         try:
-            output_file = os.path.join(ddg_output_path, 'rosetta.out.gz')
-            rosetta_output = read_file_lines(output_file)
+            if sys.version_info[0] >= 3:
+                output_stream = gzip.open(output_file, 'rt')
+            else:
+                output_stream = gzip.open(output_file, 'r')
         except:
             raise colortext.Exception('An error occurred reading the output file %s.' % output_file)
-        return rosetta_output
+        try:
+            return BenchmarkManager.parse_stdout(output_stream)
+        except IOError:
+            raise colortext.Exception('An error occurred reading the output file %s.' % output_file)
+        finally:
+            output_stream.close()
 
 
     @staticmethod
-    def extract_errors(rosetta_output_lines):
-        '''Reads in errors from the predictions which can be useful to report to the user.'''
-        errors = {
-            'Derivative error count' : 0,
-        }
+    def parse_stdout(rosetta_output_lines):
+        '''Parses an iterable of ddg_monomer output lines and returns a dict containing the errors, the DDG value reported by
+           ddg_monomer, and the per-structure scores (see get_ddg_monomer_scores_per_structure). Each line is examined once
+           and the more expensive regexes are only run on lines which contain the relevant marker text.'''
+        wildtype_scores = {}
+        mutant_scores = {}
         derivative_error_count = 0
-        for l in rosetta_output_lines:
-            if l.lower().find('inaccurate g') != -1:
+        ddGMover_lines = []
+        for line in rosetta_output_lines:
+            # Every line is checked for derivative errors, including the DDG and score lines below
+            if derivative_error_regex.search(line):
                 derivative_error_count += 1
-        errors['Derivative error count'] = derivative_error_count
-        return errors
-
 
-    @staticmethod
-    def extract_predicted_ddg(rosetta_output_lines):
-        ddGMover_lines = [l for l in rosetta_output_lines if l.strip() and l.startswith("protocols.moves.ddGMover: mutate")]
+            if line.startswith(ddGMover_prefix):
+                ddGMover_lines.append(line.strip())
+            elif 'mutation: residue' in line:
+                mtchs = wildtype_score_regex.search(line)
+                if mtchs:
+                    # e.g. "... 7 score before mutation: residue -261.2 fa_atr: -552.1 ..."
+                    structure_id = int(mtchs.group(1))
+                    assert(structure_id not in wildtype_scores)
+                    tokens = line[mtchs.end():].split()
+                    d = {'total' : float(tokens[0])}
+                    for x in range(1, len(tokens), 2):
+                        d[tokens[x].replace(':', '')] = float(tokens[x + 1])
+                    wildtype_scores[structure_id] = d
+                else:
+                    mtchs = mutant_score_regex.search(line)
+                    if mtchs:
+                        # e.g. "... 7 score after mutation: residue 10 -259.8 fa_atr: -551.0 ..."
+                        structure_id = int(mtchs.group(1))
+                        assert(structure_id not in mutant_scores)
+                        tokens = line[mtchs.end():].split()
+                        d = {'total' : float(tokens[1])}
+                        for x in range(2, len(tokens), 2):
+                            d[tokens[x].replace(':', '')] = float(tokens[x + 1])
+                        mutant_scores[structure_id] = d
+
+        # Reads in errors from the predictions which can be useful to report to the user
+        scores = dict(Errors = {'Derivative error count' : derivative_error_count})
+
+        # The DDG value reported by ddg_monomer
         assert(len(ddGMover_lines) == 1)
-        ddGMover_line = ddGMover_lines[0].strip()
-        mtchs = ddGMover_regex.match(ddGMover_line)
+        mtchs = ddGMover_regex.match(ddGMover_lines[0])
         assert(mtchs)
-        return float(mtchs.group(1))
+        scores['DDG'] = float(mtchs.group(1))
+
+        for k, v in BenchmarkManager.get_ddg_monomer_scores_per_structure(wildtype_scores, mutant_scores).items():
+            assert(k not in scores)
+            scores[k] = v
+        return scores
 
 
     @staticmethod
@@ -555,45 +1043,9 @@ class BenchmarkManager(ReportingObject):
 
 
     @staticmethod
-    def get_ddg_monomer_scores_per_structure(rosetta_output_lines):
-        '''Returns a dict mapping the DDG scores from a ddg_monomer run to a list of structure numbers.'''
-
-        # Parse the stdout into two mappings (one for wildtype structures, one for mutant structures) mapping
-        # structure IDs to a dict containing the score components
-        wildtype_scores = {}
-        mutant_scores = {}
-        s1 = 'score before mutation: residue'
-        s1_len = len(s1)
-        s2 = 'score after mutation: residue'
-        s2_len = len(s2)
-        for line in rosetta_output_lines:
-            idx = line.find(s1)
-            if idx != -1:
-                idx += s1_len
-                mtchs = re.match('.*?(\d+) %s' % s1, line)
-                structure_id = int(mtchs.group(1))
-                assert(structure_id not in wildtype_scores)
-                tokens = line[idx:].split()
-                d = {'total' : float(tokens[0])}
-                for x in range(1, len(tokens), 2):
-                    component_name = tokens[x].replace(':', '')
-                    component_value = float(tokens[x + 1])
-                    d[component_name] = component_value
-                wildtype_scores[structure_id] = d
-            else:
-                idx = line.find(s2)
-                if idx != -1:
-                    idx += s2_len
-                    mtchs = re.match('.*?(\d+) %s' % s2, line)
-                    structure_id = int(mtchs.group(1))
-                    assert(structure_id not in mutant_scores)
-                    tokens = line[idx:].split()
-                    d = {'total' : float(tokens[1])}
-                    for x in range(2, len(tokens), 2):
-                        component_name = tokens[x].replace(':', '')
-                        component_value = float(tokens[x + 1])
-                        d[component_name] = component_value
-                    mutant_scores[structure_id] = d
+    def get_ddg_monomer_scores_per_structure(wildtype_scores, mutant_scores):
+        '''Takes two mappings (one for wildtype structures, one for mutant structures) from structure IDs to a dict containing
+           the score components and returns a dict mapping the DDG scores from a ddg_monomer run to a list of structure numbers.'''
 
         # Sanity checks
         num_structures = max(wildtype_scores.keys())
@@ -645,6 +1097,21 @@ class BenchmarkManager(ReportingObject):
 
 
 
+def extract_data_work_unit(work_unit):
+    '''Extracts the data for a chunk of job directories. This is a module-level function so that it can be used by a process pool.
+       Errors are returned as strings rather than raised as colortext.Exception objects cannot be pickled.'''
+    job_dirs, take_lowest, prediction_cap = work_unit
+    results = []
+    for jd in job_dirs:
+        record_id = int(os.path.split(jd)[1])
+        try:
+            results.append((record_id, BenchmarkManager.extract_data(jd, take_lowest, prediction_cap = prediction_cap), None))
+        except Exception as e:
+            results.append((record_id, None, 'An error occurred extracting the data from {0}: {1}'.format(jd, str(e))))
+    return results
+
+
+
 class BenchmarkRun(ReportingObject):
     '''A object to contain benchmark run data which can be used to analyze that run or else to cross-analyze the run with another run.'''
 
@@ -652,15 +1119,27 @@ class BenchmarkRun(ReportingObject):
     amino_acid_details = {}
     CAA, PAA, HAA = set(), set(), set()
 
+    # The range of prediction cutoffs considered when optimizing the fraction correct metric
+    min_fraction_correct_y_cutoff, max_fraction_correct_y_cutoff = 0.5, 8.0
+
+    # The per-mutation features of each dataset, keyed by get_mutation_features_key. Increment the version whenever
+    # create_mutation_features changes so that previously cached feature tables are not used.
+    mutation_features_version = 1
+    mutation_feature_tables = {}
+
+    # The maximum number of variants of the analysis input (one per set of analysis parameters and input data) kept in analysis_input.pandas
+    max_analysis_input_variants = 16
+
 
     def __init__(self, benchmark_run_name, benchmark_run_directory, analysis_directory, dataset_cases, analysis_data, use_single_reported_value,
-                 description = None, dataset_description = None, credit = None, take_lowest = 3, generate_plots = True, report_analysis = True, include_derived_mutations = False, recreate_graphs = False, silent = False, burial_cutoff = 0.25,
-                 stability_classication_x_cutoff = 1.0, stability_classication_y_cutoff = 1.0, use_existing_benchmark_data = False, prediction_cap = None):
+                 description = None, dataset_description = None, credit = None, take_lowest = 3, generate_plots = True, plot_backend = 'R', plot_workers = 1, report_analysis = True, include_derived_mutations = False, recreate_graphs = False, silent = False, burial_cutoff = 0.25, feature_cache_directory = None,
+                 stability_classication_x_cutoff = 1.0, stability_classication_y_cutoff = 1.0, use_existing_benchmark_data = False, prediction_cap = None, structure_scores = None):
         self.amino_acid_details, self.CAA, self.PAA, self.HAA = BenchmarkRun.get_amino_acid_details()
         self.benchmark_run_name = benchmark_run_name
         self.benchmark_run_directory = benchmark_run_directory
         self.dataset_cases = dataset_cases
         self.analysis_data = analysis_data
+        self.structure_scores = structure_scores # a StructureScoreStore containing the per-structure scores of each case
         self.analysis_directory = analysis_directory
         self.subplot_directory = os.path.join(self.analysis_directory, self.benchmark_run_name + '_subplots')
         self.analysis_file_prefix = os.path.join(self.analysis_directory, self.benchmark_run_name + '_subplots', self.benchmark_run_name + '_')
@@ -669,15 +1148,23 @@ class BenchmarkRun(ReportingObject):
         self.dataset_description = dataset_description
         self.credit = credit
         self.generate_plots = generate_plots
+        self.plot_backend = plot_backend
+        self.plot_workers = plot_workers
+        self.plot_dataframe = None
+        self.plot_data_filepath = None
+        self.group_metrics = {}
         self.report_analysis = report_analysis
         self.silent = silent
         self.take_lowest = take_lowest
         self.include_derived_mutations = include_derived_mutations
         self.burial_cutoff = burial_cutoff
+        self.feature_cache_directory = feature_cache_directory
         self.recreate_graphs = recreate_graphs
         self.stability_classication_x_cutoff = stability_classication_x_cutoff
         self.stability_classication_y_cutoff = stability_classication_y_cutoff
         self.scalar_adjustment = None
+        self.analysis_input_key = None
+        self.optimum_fraction_correct_cutoffs = {} # a cache mapping experimental cutoffs to the fraction correct curves over the prediction cutoffs
         self.analysis_csv_input_filepath = os.path.join(self.benchmark_run_directory, 'analysis_input.csv')
         self.analysis_json_input_filepath = os.path.join(self.benchmark_run_directory, 'analysis_input.json')
         self.analysis_raw_data_input_filepath = os.path.join(self.benchmark_run_directory, 'benchmark_data.json')
@@ -780,27 +1267,11 @@ class BenchmarkRun(ReportingObject):
            This function also determines a scalar_adjustment used to scale the predictions to try to improve the fraction
            correct score and the MAE.
         '''
-
-        if self.use_existing_benchmark_data and os.path.exists(self.analysis_pandas_input_filepath):
-            store = pandas.HDFStore(self.analysis_pandas_input_filepath)
-            self.dataframe = store['dataframe']
-            self.scalar_adjustment = store['scalar_adjustment'].to_dict()['scalar_adjustment']
-            self.ddg_analysis_type = store['ddg_analysis_type'].to_dict()['ddg_analysis_type']
-            self.ddg_analysis_type_description = store['ddg_analysis_type_description'].to_dict()['ddg_analysis_type_description']
-            store.close()
-            return
+        import numpy
 
         analysis_data = self.analysis_data
         dataset_cases = self.dataset_cases
-        amino_acid_details, CAA, PAA, HAA = self.amino_acid_details, self.CAA, self.PAA, self.HAA
-        burial_cutoff, stability_classication_x_cutoff, stability_classication_y_cutoff = self.burial_cutoff, self.stability_classication_x_cutoff, self.stability_classication_y_cutoff\
-
-        # Create XY data
-        self.log('Creating the analysis input file %s and human-readable CSV and JSON versions %s and %s.' % (self.analysis_pandas_input_filepath, self.analysis_csv_input_filepath, self.analysis_json_input_filepath))
-        if len(analysis_data) > len(dataset_cases):
-            raise colortext.Exception('ERROR: There seems to be an error - there are more predictions than cases in the dataset. Exiting.')
-        elif len(analysis_data) < len(dataset_cases):
-            self.log('\nWARNING: %d cases missing for analysis; there are %d predictions in the output directory but %d cases in the dataset. The analysis below does not cover the complete dataset.\n' % (len(dataset_cases) - len(analysis_data), len(analysis_data), len(dataset_cases)), colortext.error)
+        stability_classication_x_cutoff, stability_classication_y_cutoff = self.stability_classication_x_cutoff, self.stability_classication_y_cutoff
 
         # ddg_analysis_type can be set to 'DDG' or 'DDG_Top[x]' (e.g. 'DDG_Top3').
         # 'DDG' uses the value reported by ddg_monomer.
@@ -813,36 +1284,263 @@ class BenchmarkRun(ReportingObject):
             self.ddg_analysis_type_description = '\nThe predicted DDG value per case is computed using the {0} lowest-scoring mutant structures and the {0} lowest-scoring wildtype structures as in the paper by Kellogg et al.'.format(self.take_lowest)
         else:
             self.ddg_analysis_type_description = '\nThe predicted DDG value per case is computed using the {0} lowest-scoring mutant structures and the {0} lowest-scoring wildtype structures.'.format(self.take_lowest)
+
+        # Reuse a dataframe previously created from the same input data with the same analysis parameters
+        self.analysis_input_key = self.get_analysis_input_key()
+        if self.load_analysis_input(self.analysis_input_key):
+            self.log('Using the analysis input in {0} (variant {1}).'.format(self.analysis_pandas_input_filepath, self.analysis_input_key))
+            self.log(self.ddg_analysis_type_description)
+            self.write_analysis_input_files(self.dataframe)
+            return
+
+        # Create XY data
+        self.log('Creating the analysis input file %s and human-readable CSV and JSON versions %s and %s.' % (self.analysis_pandas_input_filepath, self.analysis_csv_input_filepath, self.analysis_json_input_filepath))
+        if len(analysis_data) > len(dataset_cases):
+            raise colortext.Exception('ERROR: There seems to be an error - there are more predictions than cases in the dataset. Exiting.')
+        elif len(analysis_data) < len(dataset_cases):
+            self.log('\nWARNING: %d cases missing for analysis; there are %d predictions in the output directory but %d cases in the dataset. The analysis below does not cover the complete dataset.\n' % (len(dataset_cases) - len(analysis_data), len(analysis_data), len(dataset_cases)), colortext.error)
         self.log(self.ddg_analysis_type_description)
 
-        # Initialize the data structures
-        csv_headers=[
-            'DatasetID', 'PDBFileID', 'Mutations', 'NumberOfMutations', 'Experimental', 'Predicted', 'AbsoluteError', 'StabilityClassification',
+        # Join the predictions onto the per-mutation features of the dataset records. AbsoluteError and
+        # StabilityClassification are computed over the whole columns once the predictions have been added.
+        dataframe_headers = [
+            'PDBFileID', 'Mutations', 'NumberOfMutations', 'Experimental', 'Predicted', 'AbsoluteError', 'StabilityClassification',
             'ResidueCharges', 'VolumeChange',
             'WildTypeDSSPType', 'WildTypeDSSPSimpleSSType', 'WildTypeDSSPExposure',
             'WildTypeSCOPClass', 'WildTypeSCOPFold', 'WildTypeSCOPClassification',
             'WildTypeExposure', 'WildTypeAA', 'MutantAA', 'HasGPMutation',
             'PDBResolution', 'PDBResolutionBin', 'MonomerLength', 'NumberOfDerivativeErrors',
         ]
-        csv_file = [','.join(csv_headers)]
+        features = self.get_mutation_features()
+        record_ids = sorted(analysis_data.keys())
+        missing_record_ids = [record_id for record_id in record_ids if record_id not in features.index]
+        if missing_record_ids:
+            raise colortext.Exception('ERROR: The benchmark run contains predictions for records which are not in the dataset: {0}.'.format(', '.join(map(str, missing_record_ids))))
+        dataframe = features.loc[record_ids]
+
+        # Ignore derived mutations if appropriate
+        if not self.include_derived_mutations:
+            dataframe = dataframe[dataframe['DerivedMutation'] == 0]
+        dataframe = dataframe.copy()
+
+        record_ids = dataframe.index.values.tolist()
+        dataframe['Predicted'] = numpy.array([analysis_data[record_id][self.ddg_analysis_type] for record_id in record_ids], dtype = numpy.float64)
+        dataframe['NumberOfDerivativeErrors'] = numpy.array([analysis_data[record_id].get('Errors', {}).get('Derivative error count', 0) for record_id in record_ids], dtype = numpy.int64)
+        dataframe['AbsoluteError'] = (dataframe['Experimental'] - dataframe['Predicted']).abs()
+        dataframe['StabilityClassification'] = fraction_correct_values_array(dataframe['Experimental'].values, dataframe['Predicted'].values, x_cutoff = stability_classication_x_cutoff, y_cutoff = stability_classication_y_cutoff)
+        dataframe = dataframe[dataframe_headers]
+        self.dataframe = dataframe
+        self.optimum_fraction_correct_cutoffs = {}
+
+        # Report the SCOPe classification counts
+        SCOP_classifications = set(dataframe['WildTypeSCOPClassification'].values.tolist())
+        SCOP_folds = set(dataframe['WildTypeSCOPFold'].values.tolist())
+        SCOP_classes = set(dataframe['WildTypeSCOPClass'].values.tolist())
+        self.log('The mutated residues span {0} unique SCOP(e) classifications in {1} unique SCOP(e) folds and {2} unique SCOP(e) classes.'.format(len(SCOP_classifications), len(SCOP_folds), len(SCOP_classes)), colortext.message)
+
+        # Plot the optimum y-cutoff over a range of x-cutoffs for the fraction correct metric. Include the user's cutoff in the range
+        self.log('Determining a scalar adjustment with which to scale the predicted values to improve the fraction correct measurement.', colortext.warning)
+        self.scalar_adjustment, plot_filename = self.plot_optimum_prediction_fraction_correct_cutoffs_over_range(min(self.stability_classication_x_cutoff, 0.5), max(self.stability_classication_x_cutoff, 3.0), suppress_plot = True)
+
+        # Add new columns derived from the adjusted values
+        dataframe['Predicted_adj'] = dataframe['Predicted'] / self.scalar_adjustment
+        dataframe['AbsoluteError_adj'] = (dataframe['Experimental'] - dataframe['Predicted_adj']).abs()
+        add_fraction_correct_values_to_dataframe(dataframe, 'Experimental', 'Predicted_adj', 'StabilityClassification_adj',  x_cutoff = stability_classication_x_cutoff, y_cutoff = stability_classication_y_cutoff)
+
+        # Write the dataframe out to CSV and JSON and store the values computed in this function
+        self.write_analysis_input_files(dataframe)
+        self.save_analysis_input(self.analysis_input_key)
+
+
+    def get_analysis_input_parameters(self):
+        '''Returns the parameters which affect the dataframe and scalar adjustment created by create_dataframe.'''
+        return dict(
+            ddg_analysis_type = self.ddg_analysis_type,
+            take_lowest = self.take_lowest,
+            prediction_cap = self.prediction_cap,
+            burial_cutoff = self.burial_cutoff,
+            stability_classication_x_cutoff = self.stability_classication_x_cutoff,
+            stability_classication_y_cutoff = self.stability_classication_y_cutoff,
+            include_derived_mutations = bool(self.include_derived_mutations),
+        )
+
+
+    def get_analysis_input_key(self):
+        '''Returns a key identifying the analysis parameters and the input data (the extracted benchmark data, the dataset,
+           and the PDB data) used by create_dataframe. The key is used to name the variant in analysis_input.pandas.'''
+        h = hashlib.sha1()
+        h.update(json.dumps(self.get_analysis_input_parameters(), sort_keys = True).encode('utf-8'))
+        h.update(json.dumps(self.analysis_data, sort_keys = True, default = repr).encode('utf-8'))
+        h.update(self.get_mutation_features_key().encode('utf-8'))
+        return 'variant_{0}'.format(h.hexdigest())
+
+
+    def load_analysis_input(self, variant):
+        '''Loads the dataframe, scalar adjustment, and analysis type for the variant from analysis_input.pandas. Returns
+           False if the variant is not stored in that file.'''
+        import pandas
+        if not os.path.exists(self.analysis_pandas_input_filepath):
+            return False
+        try:
+            store = pandas.HDFStore(self.analysis_pandas_input_filepath)
+            try:
+                if '/{0}/dataframe'.format(variant) not in store.keys():
+                    return False
+                self.dataframe = store['{0}/dataframe'.format(variant)]
+                self.scalar_adjustment = store['{0}/scalar_adjustment'.format(variant)].to_dict()['scalar_adjustment']
+                self.ddg_analysis_type = store['{0}/ddg_analysis_type'.format(variant)].to_dict()['ddg_analysis_type']
+                self.ddg_analysis_type_description = store['{0}/ddg_analysis_type_description'.format(variant)].to_dict()['ddg_analysis_type_description']
+                self.optimum_fraction_correct_cutoffs = {}
+                return True
+            finally:
+                store.close()
+        except Exception as e:
+            self.log('The analysis input in {0} could not be read ({1}). Recreating it.'.format(self.analysis_pandas_input_filepath, str(e)), colortext.warning)
+            return False
+
+
+    def save_analysis_input(self, variant):
+        '''Stores the dataframe, scalar adjustment, and analysis type under the variant in analysis_input.pandas. Variants
+           created with other parameters or input data are kept alongside, up to max_analysis_input_variants of the most
+           recently created variants.'''
+        import pandas
+        store = pandas.HDFStore(self.analysis_pandas_input_filepath)
+        try:
+            # Remove the keys written by previous versions of this script, which stored a single unkeyed analysis
+            existing_keys = store.keys()
+            for k in ['/dataframe', '/scalar_adjustment', '/ddg_analysis_type', '/ddg_analysis_type_description']:
+                if k in existing_keys:
+                    store.remove(k)
+
+            parameters = self.get_analysis_input_parameters()
+            parameters['prediction_cap'] = parameters['prediction_cap'] or 0 # 0 means no cap
+            parameters['created'] = time.time()
+            store['{0}/parameters'.format(variant)] = pandas.Series(parameters)
+            store['{0}/dataframe'.format(variant)] = self.dataframe
+            store['{0}/scalar_adjustment'.format(variant)] = pandas.Series(dict(scalar_adjustment = self.scalar_adjustment))
+            store['{0}/ddg_analysis_type'.format(variant)] = pandas.Series(dict(ddg_analysis_type = self.ddg_analysis_type))
+            store['{0}/ddg_analysis_type_description'.format(variant)] = pandas.Series(dict(ddg_analysis_type_description = self.ddg_analysis_type_description))
+
+            # Remove the oldest variants
+            variants = []
+            for k in store.keys():
+                tokens = k.strip('/').split('/')
+                if len(tokens) == 2 and tokens[1] == 'parameters':
+                    variants.append((store[k].to_dict().get('created', 0), tokens[0]))
+            for created, old_variant in sorted(variants, reverse = True)[BenchmarkRun.max_analysis_input_variants:]:
+                store.remove(old_variant)
+        finally:
+            store.close()
+
+
+    def write_analysis_input_files(self, dataframe):
+        '''Writes the human-readable CSV and JSON versions of the dataframe.'''
+
+        # Write the dataframe out to CSV
+        dataframe.to_csv(self.analysis_csv_input_filepath, sep = ',', header = True)
+
+        # Write the dataframe out to JSON
+        # Note: I rolled my own as dataframe.to_dict(orient = 'records') gives us the correct format but discards the DatasetID (index) field
+        json_records = {}
+        indices = dataframe.index.values.tolist()
+        for i in indices:
+            json_records[i] = {}
+        for k, v in dataframe.to_dict().items():
+            for i, v in v.items():
+                assert(k not in json_records[i])
+                json_records[i][k] = v
+        write_file(self.analysis_json_input_filepath, json.dumps(json_records, indent = 4, sort_keys=True))
+
+
+    def get_mutation_features_key(self):
+        '''Returns a key identifying the inputs of create_mutation_features: the dataset records, the PDB data, and the burial cutoff.'''
+        h = hashlib.sha1()
+        h.update(str(BenchmarkRun.mutation_features_version).encode('utf-8'))
+        h.update(json.dumps(self.dataset_cases, sort_keys = True).encode('utf-8'))
+        if os.path.exists(pdb_data_filepath):
+            h.update(BenchmarkManager.get_file_hash(pdb_data_filepath).encode('utf-8'))
+        h.update(repr(float(self.burial_cutoff)).encode('utf-8'))
+        return h.hexdigest()
+
+
+    def get_mutation_features(self):
+        '''Returns the per-mutation features of the dataset records, indexed by DatasetID. The features are cached in memory
+           and, if a feature cache directory was specified, on disk in a pandas HDF5 file named by get_mutation_features_key
+           so that they are computed once per dataset and burial cutoff rather than once per analysis.'''
+        import pandas
+        key = self.get_mutation_features_key()
+        if key in BenchmarkRun.mutation_feature_tables:
+            return BenchmarkRun.mutation_feature_tables[key]
+
+        features = None
+        feature_cache_filepath = None
+        if self.feature_cache_directory:
+            feature_cache_filepath = os.path.join(self.feature_cache_directory, 'mutation_features_{0}.pandas'.format(key))
+            if os.path.exists(feature_cache_filepath):
+                try:
+                    store = pandas.HDFStore(feature_cache_filepath)
+                    features = store['features']
+                    store.close()
+                    self.log('Using the cached mutation features in {0}.'.format(feature_cache_filepath))
+                except Exception as e:
+                    self.log('The cached mutation features in {0} could not be read ({1}). Recomputing them.'.format(feature_cache_filepath, str(e)), colortext.warning)
+
+        if features is None:
+            features = self.create_mutation_features()
+            if feature_cache_filepath:
+                try:
+                    if not os.path.exists(self.feature_cache_directory):
+                        os.makedirs(self.feature_cache_directory)
+                    if os.path.exists(feature_cache_filepath):
+                        os.remove(feature_cache_filepath)
+                    store = pandas.HDFStore(feature_cache_filepath)
+                    store['features'] = features
+                    store['burial_cutoff'] = pandas.Series(dict(burial_cutoff = self.burial_cutoff))
+                    store.close()
+                except Exception as e:
+                    self.log('The mutation features could not be cached in {0}: {1}'.format(feature_cache_filepath, str(e)), colortext.warning)
+
+        BenchmarkRun.mutation_feature_tables[key] = features
+        return features
+
+
+    def create_mutation_features(self):
+        '''Creates a dataframe with one row per dataset record and one column per mutation feature. These features depend only
+           on the dataset, the PDB data, and the burial cutoff so they are shared between the benchmark runs.
+           For rows with multiple mutations, there may be multiple values for some fields e.g. wildtype residue exposure.
+           We take the approach of marking these records as None (to be read as: N/A).
+        '''
+        import numpy
+        import pandas
+
+        dataset_cases = self.dataset_cases
+        amino_acid_details, CAA, PAA, HAA = self.amino_acid_details, self.CAA, self.PAA, self.HAA
+        burial_cutoff = self.burial_cutoff
+
+        # Initialize the data structures. The columns are filled record-by-record and typed when the dataframe is created.
+        feature_headers = [
+            'DatasetID', 'PDBFileID', 'Mutations', 'NumberOfMutations', 'Experimental', 'DerivedMutation',
+            'ResidueCharges', 'VolumeChange',
+            'WildTypeDSSPType', 'WildTypeDSSPSimpleSSType', 'WildTypeDSSPExposure',
+            'WildTypeSCOPClass', 'WildTypeSCOPFold', 'WildTypeSCOPClassification',
+            'WildTypeExposure', 'WildTypeAA', 'MutantAA', 'HasGPMutation',
+            'PDBResolution', 'PDBResolutionBin', 'MonomerLength',
+        ]
+        int_headers = ['DatasetID', 'NumberOfMutations', 'DerivedMutation', 'HasGPMutation']
+        float_headers = ['Experimental', 'WildTypeDSSPExposure', 'PDBResolution', 'MonomerLength'] # None values become NaN
+        feature_columns = dict((h, []) for h in feature_headers)
 
         # Set the PDB input path
         pdb_data = {}
         try:
-            pdb_data_ = json.loads(read_file('../../input/json/pdbs.json'))
+            pdb_data_ = json.loads(read_file(pdb_data_filepath))
             for k, v in pdb_data_.items():
                 pdb_data[k.upper()] = v
         except Exception as e:
             self.log('input/json/pdbs.json could not be found - PDB-specific analysis cannot be performed.', colortext.error)
 
-        # Create the dataframe
-        for record_id, predicted_data in sorted(analysis_data.items()):
-
-            record = dataset_cases[record_id]
-
-            # Ignore derived mutations if appropriate
-            if record['DerivedMutation'] and not self.include_derived_mutations:
-                continue
+        # Create the feature table
+        for record_id, record in sorted(dataset_cases.items()):
 
             # Initialize variables. For ambiguous cases where the set of distinct values has multiple values, we default to None
             residue_charge, residue_charges = None, set()
@@ -856,7 +1554,6 @@ class BenchmarkRun(ReportingObject):
             scops = set()
             pdb_chains = set()
             mutation_string = []
-            num_derivative_errors = predicted_data.get('Errors', {}).get('Derivative error count', 0)
 
             mutations = record['Mutations']
             for m in mutations:
@@ -932,16 +1629,12 @@ class BenchmarkRun(ReportingObject):
                 if len(scop_tokens) > 1:
                     scop_fold = '.'.join(scop_tokens[0:2])
 
-            # Calculate the stability classification and absolute_error for this case
-            stability_classification = fraction_correct([record['DDG']], [predicted_data[self.ddg_analysis_type]], x_cutoff = stability_classication_x_cutoff, y_cutoff = stability_classication_y_cutoff)
-            assert(stability_classification == 0 or stability_classification == 1)
-            #stability_classification = int(stability_classification)
-            absolute_error = abs(record['DDG'] - predicted_data[self.ddg_analysis_type])
-
             # Partition the data by PDB resolution with bins: N/A, <1.5, 1.5-<2.0, 2.0-<2.5, >=2.5
             pdb_record = pdb_data.get(record['PDBFileID'].upper())
             pdb_resolution_bin = None
             pdb_resolution = pdb_record.get('Resolution')
+            if pdb_resolution == 'N/A':
+                pdb_resolution = None # e.g. NMR structures
             if pdb_resolution != None:
                 if pdb_resolution < 1.5:
                     pdb_resolution_bin = '<1.5'
@@ -956,16 +1649,14 @@ class BenchmarkRun(ReportingObject):
             # Mark mutations involving glycine or proline
             has_gp_mutation = 'G' in all_residues or 'P' in all_residues
 
-            # Create the data matrix
-            dataframe_record = dict(
+            # Create the feature record
+            feature_record = dict(
                 DatasetID = record_id,
                 PDBFileID = record['PDBFileID'],
                 Mutations = mutation_string,
                 NumberOfMutations = len(mutations),
                 Experimental = record['DDG'],
-                Predicted = predicted_data[self.ddg_analysis_type],
-                AbsoluteError = absolute_error,
-                StabilityClassification = stability_classification,
+                DerivedMutation = int(bool(record['DerivedMutation'])),
                 ResidueCharges = residue_charge,
                 VolumeChange = volume_change,
                 HasGPMutation = int(has_gp_mutation),
@@ -978,60 +1669,21 @@ class BenchmarkRun(ReportingObject):
                 WildTypeExposure = exposure,
                 WildTypeAA = record_wtaa,
                 MutantAA = record_mutaa,
-                PDBResolution = pdb_record.get('Resolution'),
+                PDBResolution = pdb_resolution,
                 PDBResolutionBin = pdb_resolution_bin,
                 MonomerLength = len(pdb_record.get('Chains', {}).get(pdb_chain, {}).get('Sequence', '')) or None,
-                NumberOfDerivativeErrors = num_derivative_errors,
                 )
 
-            for h in csv_headers:
-                assert(',' not in str(dataframe_record[h]))
-            csv_file.append(','.join([str(dataframe_record[h]) for h in csv_headers]))
-            assert(sorted(csv_headers) == sorted(dataframe_record.keys()))
-
-        # Create the CSV file in memory (we are not done added data just yet) and pass it to pandas
-        dataframe = pandas.read_csv(io.StringIO('\n'.join(csv_file)), sep=',', header=0, skip_blank_lines=True, index_col = 0)
-        self.dataframe = dataframe
-
-        # Report the SCOPe classification counts
-        SCOP_classifications = set(dataframe['WildTypeSCOPClassification'].values.tolist())
-        SCOP_folds = set(dataframe['WildTypeSCOPFold'].values.tolist())
-        SCOP_classes = set(dataframe['WildTypeSCOPClass'].values.tolist())
-        self.log('The mutated residues span {0} unique SCOP(e) classifications in {1} unique SCOP(e) folds and {2} unique SCOP(e) classes.'.format(len(SCOP_classifications), len(SCOP_folds), len(SCOP_classes)), colortext.message)
-
-        # Plot the optimum y-cutoff over a range of x-cutoffs for the fraction correct metric. Include the user's cutoff in the range
-        self.log('Determining a scalar adjustment with which to scale the predicted values to improve the fraction correct measurement.', colortext.warning)
-        self.scalar_adjustment, plot_filename = self.plot_optimum_prediction_fraction_correct_cutoffs_over_range(min(self.stability_classication_x_cutoff, 0.5), max(self.stability_classication_x_cutoff, 3.0), suppress_plot = True)
+            assert(len(feature_record) == len(feature_columns))
+            for h, v in feature_record.items():
+                feature_columns[h].append(v)
 
-        # Add new columns derived from the adjusted values
-        dataframe['Predicted_adj'] = dataframe['Predicted'] / self.scalar_adjustment
-        dataframe['AbsoluteError_adj'] = (dataframe['Experimental'] - dataframe['Predicted_adj']).abs()
-        add_fraction_correct_values_to_dataframe(dataframe, 'Experimental', 'Predicted_adj', 'StabilityClassification_adj',  x_cutoff = stability_classication_x_cutoff, y_cutoff = stability_classication_y_cutoff)
-
-        # Write the dataframe out to CSV
-        dataframe.to_csv(self.analysis_csv_input_filepath, sep = ',', header = True)
-
-        # Write the dataframe out to JSON
-        # Note: I rolled my own as dataframe.to_dict(orient = 'records') gives us the correct format but discards the DatasetID (index) field
-        json_records = {}
-        indices = dataframe.index.values.tolist()
-        for i in indices:
-            json_records[i] = {}
-        for k, v in dataframe.to_dict().items():
-            for i, v in v.items():
-                assert(k not in json_records[i])
-                json_records[i][k] = v
-        write_file(self.analysis_json_input_filepath, json.dumps(json_records, indent = 4, sort_keys=True))
-
-        # Write the values computed in this function out to disk
-        if os.path.exists(self.analysis_pandas_input_filepath):
-            os.remove(self.analysis_pandas_input_filepath)
-        store = pandas.HDFStore(self.analysis_pandas_input_filepath)
-        store['dataframe'] = dataframe
-        store['scalar_adjustment'] = pandas.Series(dict(scalar_adjustment = self.scalar_adjustment))
-        store['ddg_analysis_type'] = pandas.Series(dict(ddg_analysis_type = self.ddg_analysis_type))
-        store['ddg_analysis_type_description'] = pandas.Series(dict(ddg_analysis_type_description = self.ddg_analysis_type_description))
-        store.close()
+        # Type the columns and create the dataframe
+        for h in int_headers:
+            feature_columns[h] = numpy.array(feature_columns[h], dtype = numpy.int64)
+        for h in float_headers:
+            feature_columns[h] = numpy.array(feature_columns[h], dtype = numpy.float64)
+        return pandas.DataFrame(feature_columns, columns = feature_headers).set_index('DatasetID')
 
 
     def analyze(self):
@@ -1061,6 +1713,9 @@ class BenchmarkRun(ReportingObject):
 
         amino_acid_details, CAA, PAA, HAA = self.amino_acid_details, self.CAA, self.PAA, self.HAA
 
+        # Compute the metrics of every group of every breakdown with one pass per breakdown
+        self.calculate_group_metrics()
+
         # This dict is used for the print-statement below
         volume_groups = {}
         for aa_code, aa_details in amino_acid_details.items():
@@ -1072,20 +1727,14 @@ class BenchmarkRun(ReportingObject):
         metrics_textfile.append('A case is considered a small-to-large (resp. large-to-small) mutation if all of the wildtype residues have a smaller (resp. larger) van der Waals volume than the corresponding mutant residue. The order is defined as %s so some cases are considered to have no change in volume e.g. MET -> LEU.' % (' < '.join([''.join(sorted(v)) for k, v in sorted(volume_groups.items())])))
         self.report('\n'.join(metrics_textfile[-2:]), fn = colortext.sprint)
         for subcase in ('XX', 'SL', 'LS'):
-            subcase_dataframe = dataframe[dataframe['VolumeChange'] == subcase]
-            metrics_textfile.append('\n' + '*'*10 + (' Statistics - %s (%d cases)' % (by_volume_descriptions[subcase], len(subcase_dataframe))) +'*'*10)
-            metrics_textfile.append(format_stats_for_printing(get_xy_dataset_statistics_pandas(subcase_dataframe, 'Experimental', 'Predicted', fcorrect_x_cutoff = self.stability_classication_x_cutoff, fcorrect_y_cutoff = self.stability_classication_y_cutoff)))
+            metrics_textfile.extend(self.format_group_metrics('VolumeChange', subcase, by_volume_descriptions[subcase]))
             self.report('\n'.join(metrics_textfile[-2:]), fn = colortext.sprint)
 
         metrics_textfile.append('\n\nSection 2. Separating out mutations involving glycine or proline.')
         metrics_textfile.append('This cases may involve changes to secondary structure so we separate them out here.')
-        subcase_dataframe = dataframe[dataframe['HasGPMutation'] == 1]
-        metrics_textfile.append('\n' + '*'*10 + (' Statistics - cases with G or P (%d cases)' % (len(subcase_dataframe))) +'*'*10)
-        metrics_textfile.append(format_stats_for_printing(get_xy_dataset_statistics_pandas(subcase_dataframe, 'Experimental', 'Predicted', fcorrect_x_cutoff = self.stability_classication_x_cutoff, fcorrect_y_cutoff = self.stability_classication_y_cutoff)))
+        metrics_textfile.extend(self.format_group_metrics('GP', 'GP', 'cases with G or P'))
         self.report('\n'.join(metrics_textfile[-4:]), fn = colortext.sprint)
-        subcase_dataframe = dataframe[dataframe['HasGPMutation'] == 0]
-        metrics_textfile.append('\n' + '*'*10 + (' Statistics - cases without G or P (%d cases)' % (len(subcase_dataframe))) +'*'*10)
-        metrics_textfile.append(format_stats_for_printing(get_xy_dataset_statistics_pandas(subcase_dataframe, 'Experimental', 'Predicted', fcorrect_x_cutoff = self.stability_classication_x_cutoff, fcorrect_y_cutoff = self.stability_classication_y_cutoff)))
+        metrics_textfile.extend(self.format_group_metrics('GP', 'Other', 'cases without G or P'))
         self.report('\n'.join(metrics_textfile[-2:]), fn = colortext.sprint)
 
 
@@ -1114,17 +1763,224 @@ class BenchmarkRun(ReportingObject):
             metrics_textfile.append('\n\nDerivative errors were found in the run. Record #{0} - {1}, {2} - has the most amount ({3}) of derivative errors.'.format(record_index, pdb_id, mutation_str, num_errors))
             self.report(metrics_textfile[-1], fn = colortext.warning)
 
+        # Write the metrics of all breakdowns to a table
+        group_metrics_filepath = os.path.join(self.analysis_directory, '{0}_group_metrics.csv'.format(self.benchmark_run_name))
+        self.get_group_metrics_dataframe().to_csv(group_metrics_filepath, sep = ',', header = True, index = False)
+        metrics_textfile.append('\n\nThe metrics broken down by {0} were written to {1}.'.format(', '.join(metric_group_columns), group_metrics_filepath))
+        self.report(metrics_textfile[-1], fn = colortext.message)
+
         # Write the analysis to file
         write_file(self.metrics_filepath, '\n'.join(metrics_textfile))
 
 
+    def calculate_group_metrics(self):
+        '''Computes the metrics for each group of each of the breakdowns in metric_group_columns. The groups are the values of
+           the columns of the plot dataframe so the same tables are used in the metrics file and in the scatterplot legends.'''
+        self.plot_dataframe = None
+        plot_dataframe = self.create_plot_dataframe()
+        self.group_metrics = {}
+        for column in metric_group_columns:
+            self.group_metrics[column] = get_xy_dataset_statistics_grouped(plot_dataframe, column, 'Experimental', 'Predicted', fcorrect_x_cutoff = self.stability_classication_x_cutoff, fcorrect_y_cutoff = self.stability_classication_y_cutoff)
+
+
+    def format_group_metrics(self, column, group, description):
+        '''Returns the header and the formatted metrics for one group of a breakdown as two lines of the metrics file.'''
+        group_stats = self.group_metrics[column].get(group)
+        if not group_stats:
+            return ['\n' + '*'*10 + (' Statistics - %s (0 cases)' % description) +'*'*10, 'There are no cases in this group.']
+        return ['\n' + '*'*10 + (' Statistics - %s (%d cases)' % (description, group_stats['num_points'])) +'*'*10, format_stats_for_printing(group_stats)]
+
+
+    def get_group_metrics_dataframe(self):
+        '''Returns a dataframe with one row per group of each breakdown containing the main metrics. Correlation coefficients
+           are missing for groups which are too small.'''
+        import numpy
+        import pandas
+        rows = []
+        for column in metric_group_columns:
+            for group, group_stats in self.group_metrics.get(column, {}).items():
+                rows.append([column, group, group_stats['num_points'], group_stats.get('pearsonr', (numpy.nan,))[0], group_stats.get('spearmanr', (numpy.nan,))[0],
+                             group_stats.get('kendalltau', numpy.nan), group_stats['MAE'], group_stats['fraction_correct'], group_stats['fraction_correct_fuzzy_linear']])
+        return pandas.DataFrame(rows, columns = ['Breakdown', 'Group', 'Cases', "Pearson's R", "Spearman's R", "Kendall's tau-b", 'MAE', 'Fraction correct', 'Fraction correct (fuzzy)'])
+
+
+    def sweep_ddg_estimators(self, boltzmann_kTs = (0.5, 1.0, 2.0)):
+        '''Reports the main metrics for the DDG_TopN estimates for N from 1 to the number of structures per case, and for the
+           mean and Boltzmann-weighted estimates, over the cases in the dataframe. The estimates are computed from the
+           per-structure scores with one vectorized reduction per estimator. The table is written to a CSV file in the
+           analysis directory.'''
+        import numpy
+        import pandas
+        from structure_scores import ddg_top_n_sweep, ddg_mean, ddg_boltzmann
+        if not self.structure_scores:
+            raise colortext.Exception('The per-structure scores (benchmark_structure_scores.npz) are required to compute the DDG estimators.')
+
+        record_ids = self.dataframe.index.values.tolist()
+        experimental = self.dataframe['Experimental'].values
+        mutant_counts = self.structure_scores.get_sorted_scores('Mutant')[1]
+        wildtype_counts = self.structure_scores.get_sorted_scores('WildType')[1]
+        num_structures = int(max(numpy.minimum(mutant_counts, wildtype_counts).max(), 1)) if len(mutant_counts) else 1
+
+        # Compute the predictions for each estimator
+        estimators = []
+        top_n_values = ddg_top_n_sweep(self.structure_scores, list(range(1, num_structures + 1)), record_ids = record_ids, prediction_cap = self.prediction_cap)
+        for n in range(1, num_structures + 1):
+            estimators.append(('DDG_Top%d' % n, top_n_values[:, n - 1]))
+        estimators.append(('DDG_Mean', ddg_mean(self.structure_scores, record_ids = record_ids, prediction_cap = self.prediction_cap)))
+        for kT in boltzmann_kTs:
+            estimators.append(('DDG_Boltzmann_kT%s' % kT, ddg_boltzmann(self.structure_scores, kT = kT, record_ids = record_ids, prediction_cap = self.prediction_cap)))
+
+        # Compute the metrics for all estimators at once
+        headers = ['Estimator', 'Cases', "Pearson's R", "Spearman's R", 'MAE', 'Fraction correct']
+        estimator_stats = get_multi_predictor_statistics(experimental, numpy.column_stack([predicted for estimator, predicted in estimators]), y_names = [estimator for estimator, predicted in estimators], fcorrect_x_cutoff = self.stability_classication_x_cutoff, fcorrect_y_cutoff = self.stability_classication_y_cutoff)
+        rows = []
+        for estimator, s in estimator_stats.items():
+            rows.append([estimator, s['num_points'], s['pearsonr'][0], s['spearmanr'][0], s['MAE'], s['fraction_correct']])
+        sweep_dataframe = pandas.DataFrame(rows, columns = headers).set_index('Estimator')
+
+        sweep_filepath = os.path.join(self.analysis_directory, '{0}_ddg_estimator_sweep.csv'.format(self.benchmark_run_name))
+        sweep_dataframe.to_csv(sweep_filepath, sep = ',', header = True)
+        self.report('\n' + '*'*10 + (' Metrics by DDG estimator (%d cases, %d structures per case)' % (len(record_ids), num_structures)) + '*'*10, fn = colortext.message)
+        self.report(sweep_dataframe.to_string(float_format = lambda v: '%0.3f' % v), fn = colortext.sprint)
+        self.report('The table was written to {0}.'.format(sweep_filepath), fn = colortext.message)
+        return sweep_dataframe
+
+
+    def analyze_structure_count_convergence(self, num_repeats, tolerance, random_seed = 0):
+        '''Reports how the Pearson correlation coefficient, MAE, and fraction correct of the DDG_Top<take_lowest> predictions
+           converge as the number of structures per case grows. For each structure count k, num_repeats random subsamples
+           of k wildtype and k mutant structures per case are drawn from the stored per-structure scores and the metrics
+           are computed for all subsamples at once. Returns a dataframe with the mean, standard deviation, and 95% range of
+           each metric per k and writes it to a CSV file in the analysis directory.'''
+        import numpy
+        import pandas
+        import comparison
+        from structure_scores import ddg_top_n, ddg_top_n_subsamples
+
+        if not self.structure_scores:
+            raise colortext.Exception('The per-structure scores (benchmark_structure_scores.npz) are required for the convergence analysis.')
+
+        # Only use the cases with both wildtype and mutant structures
+        mutant_counts = self.structure_scores.get_sorted_scores('Mutant')[1]
+        wildtype_counts = self.structure_scores.get_sorted_scores('WildType')[1]
+        case_index = self.structure_scores.case_index
+        record_ids = [record_id for record_id in self.dataframe.index.values.tolist() if record_id in case_index and min(mutant_counts[case_index[record_id]], wildtype_counts[case_index[record_id]]) > 0]
+        if len(record_ids) < 2:
+            raise colortext.Exception('At least two cases with structures are required for the convergence analysis.')
+        rows = numpy.array([case_index[record_id] for record_id in record_ids])
+        num_structures = int(numpy.minimum(mutant_counts[rows], wildtype_counts[rows]).max())
+        experimental = self.dataframe.loc[record_ids, 'Experimental'].values
+
+        # Compute the predictions for each subsample and for the full set of structures
+        ks = numpy.arange(1, num_structures + 1)
+        random_state = numpy.random.RandomState(random_seed)
+        predictions = ddg_top_n_subsamples(self.structure_scores, ks, self.take_lowest, num_repeats, random_state, record_ids = record_ids, prediction_cap = self.prediction_cap)
+        full_predictions = ddg_top_n(self.structure_scores, self.take_lowest, record_ids = record_ids, prediction_cap = self.prediction_cap)
+
+        # Compute the metrics over the last axis (cases) for every structure count and repeat at once
+        metrics = comparison.prediction_metrics(predictions, experimental, x_cutoff = self.stability_classication_x_cutoff, y_cutoff = self.stability_classication_y_cutoff)
+        full_metrics = comparison.prediction_metrics(full_predictions, experimental, x_cutoff = self.stability_classication_x_cutoff, y_cutoff = self.stability_classication_y_cutoff)
+
+        # Summarize the metrics per structure count
+        metric_names = comparison.metric_names
+        convergence_dataframe = pandas.DataFrame(dict(NumStructures = ks)).set_index('NumStructures')
+        converged = numpy.ones(len(ks), dtype = bool)
+        for metric_name in metric_names:
+            values = metrics[metric_name]
+            convergence_dataframe[metric_name] = values.mean(axis = 1)
+            convergence_dataframe[metric_name + '_std'] = values.std(axis = 1)
+            convergence_dataframe[metric_name + '_2.5%'] = numpy.percentile(values, 2.5, axis = 1)
+            convergence_dataframe[metric_name + '_97.5%'] = numpy.percentile(values, 97.5, axis = 1)
+            converged &= numpy.abs(values.mean(axis = 1) - full_metrics[metric_name]) <= tolerance
+
+        convergence_filepath = os.path.join(self.analysis_directory, '{0}_structure_count_convergence.csv'.format(self.benchmark_run_name))
+        convergence_dataframe.to_csv(convergence_filepath, sep = ',', header = True)
+
+        self.report('\n' + '*'*10 + (' Structure-count convergence of DDG_Top%d (%d cases, %d repeats)' % (self.take_lowest, len(record_ids), num_repeats)) + '*'*10, fn = colortext.message)
+        self.report('Using all {0} structures: Pearson = {1:0.3f}, MAE = {2:0.3f}, fraction correct = {3:0.3f}.'.format(num_structures, float(full_metrics['Pearson']), float(full_metrics['MAE']), float(full_metrics['FractionCorrect'])), fn = colortext.sprint)
+        self.report(convergence_dataframe[['Pearson', 'Pearson_std', 'MAE', 'MAE_std', 'FractionCorrect', 'FractionCorrect_std']].to_string(float_format = lambda v: '%0.3f' % v), fn = colortext.sprint)
+
+        # Suggest the smallest structure count from which the average metrics stay within the tolerance
+        suggested_k = None
+        not_converged = numpy.where(~converged)[0]
+        if not len(not_converged):
+            suggested_k = ks[0]
+        elif not_converged[-1] + 1 < len(ks):
+            suggested_k = ks[not_converged[-1] + 1]
+        if suggested_k:
+            self.report('The average metrics are within {0} of the metrics using all structures from {1} structures per case.'.format(tolerance, suggested_k), fn = colortext.message)
+        else:
+            self.report('The average metrics do not converge to within {0} of the metrics using all structures.'.format(tolerance), fn = colortext.warning)
+        self.report('The table was written to {0}.'.format(convergence_filepath), fn = colortext.message)
+        return convergence_dataframe
+
+
+    def reweight_score_terms(self, objective, num_folds, source = 'structures', random_seed = 0, alphas = (0.0, 0.1, 1.0, 10.0, 100.0, 1000.0)):
+        '''Fits weights for the score terms against the experimental DDG values and reports the metrics of the out-of-fold
+           predictions of k-fold cross-validation for each regularization strength in alphas. The weights fitted to all
+           cases with the regularization strength giving the highest cross-validated Pearson correlation coefficient are
+           written to a CSV file in the analysis directory along with the metrics table. See reweighting.py.'''
+        import numpy
+        import pandas
+        import reweighting
+
+        # Assemble the per-case score term differences
+        record_ids = self.dataframe.index.values.tolist()
+        if source == 'structures':
+            if not self.structure_scores:
+                raise colortext.Exception('The per-structure scores (benchmark_structure_scores.npz) are required to reweight the score terms.')
+            record_ids = [record_id for record_id in record_ids if record_id in self.structure_scores]
+            X, score_terms = reweighting.component_difference_matrix(self.structure_scores, self.take_lowest, record_ids = record_ids)
+        else:
+            X, score_terms = reweighting.summary_component_matrix(self.analysis_data, record_ids)
+        y = self.dataframe.loc[record_ids, 'Experimental'].values
+        mask = ~numpy.isnan(X).any(axis = 1)
+        X, y, record_ids = X[mask], y[mask], [record_id for record_id, m in zip(record_ids, mask) if m]
+        if len(y) < num_folds or not score_terms:
+            raise colortext.Exception('There are too few cases ({0}) or score terms ({1}) to fit the score term weights.'.format(len(y), len(score_terms)))
+
+        # The baseline is the current score function i.e. unit weights. Its predictions are on the Rosetta energy scale.
+        x_cutoff, y_cutoff = self.stability_classication_x_cutoff, self.stability_classication_y_cutoff
+        baseline_metrics = reweighting.prediction_metrics(X.sum(axis = 1), y, x_cutoff = x_cutoff, y_cutoff = y_cutoff)
+
+        # The fitted predictions are on the experimental scale so we use the experimental cutoff for both axes
+        random_state = numpy.random.RandomState(random_seed)
+        predictions = reweighting.cross_validated_predictions(X, y, alphas, num_folds, random_state, objective = objective)
+        metrics = reweighting.prediction_metrics(predictions, y, x_cutoff = x_cutoff, y_cutoff = x_cutoff)
+
+        headers = ['Weights', 'Alpha', 'Pearson', 'MAE', 'FractionCorrect']
+        rows = [['unit (current score function)', numpy.nan] + [float(baseline_metrics[h][0]) for h in headers[2:]]]
+        for x, alpha in enumerate(alphas):
+            rows.append(['{0} ({1}-fold cross-validation)'.format(objective, num_folds), alpha] + [float(metrics[h][x]) for h in headers[2:]])
+        reweighting_dataframe = pandas.DataFrame(rows, columns = headers)
+
+        # Fit the weights to all cases using the best regularization strength
+        best = int(numpy.nanargmax(metrics['Pearson'])) if not numpy.isnan(metrics['Pearson']).all() else 0
+        weights, intercepts = reweighting.fit(X, y, [alphas[best]], objective = objective)
+        weights_dataframe = pandas.DataFrame(dict(ScoreTerm = score_terms + ['intercept'], Weight = weights[0].tolist() + [float(intercepts[0])])).set_index('ScoreTerm')
+
+        metrics_filepath = os.path.join(self.analysis_directory, '{0}_score_term_reweighting.csv'.format(self.benchmark_run_name))
+        weights_filepath = os.path.join(self.analysis_directory, '{0}_score_term_weights.csv'.format(self.benchmark_run_name))
+        reweighting_dataframe.to_csv(metrics_filepath, sep = ',', header = True, index = False)
+        weights_dataframe.to_csv(weights_filepath, sep = ',', header = True)
+
+        self.report('\n' + '*'*10 + (' Score term reweighting (%d cases, %d score terms)' % (len(y), len(score_terms))) + '*'*10, fn = colortext.message)
+        self.report(reweighting_dataframe.to_string(index = False, float_format = lambda v: '%0.3f' % v), fn = colortext.sprint)
+        self.report('\nWeights fitted to all cases (alpha = {0}):'.format(alphas[best]), fn = colortext.message)
+        self.report(weights_dataframe.to_string(float_format = lambda v: '%0.4f' % v), fn = colortext.sprint)
+        self.report('The tables were written to {0} and {1}.'.format(metrics_filepath, weights_filepath), fn = colortext.message)
+        return reweighting_dataframe, weights_dataframe
+
+
     def plot(self):
 
         if not self.generate_plots:
             return
 
+        # The main scatterplots are rendered by plot_pandas which uses the module-level backend
+        set_plot_backend(self.plot_backend)
+
         dataframe = self.dataframe
-        graph_order = []
 
         # Create a subtitle for the first page
         subtitle = self.benchmark_run_name
@@ -1143,72 +1999,71 @@ class BenchmarkRun(ReportingObject):
         if self.dataset_description:
             subtitle += '\n{0}'.format(self.dataset_description)
 
-        # Plot which y-cutoff yields the best value for the fraction correct metric
-        scalar_adjustment, scalar_adjustment_calculation_plot = self.plot_optimum_prediction_fraction_correct_cutoffs_over_range(min(self.stability_classication_x_cutoff, 0.5), max(self.stability_classication_x_cutoff, 3.0), suppress_plot = False)
-        assert(self.scalar_adjustment == scalar_adjustment)
+        # Export the data used by the plots once. All of the R plot jobs read this file.
+        self.export_plot_data()
 
-        # Plot which the optimum y-cutoff given the specified or default x-cutoff
-        optimal_predictive_cutoff_plot = self.plot_optimum_prediction_fraction_correct_cutoffs(self.stability_classication_x_cutoff)
+        # Determine the scalar adjustment up-front as it does not depend on any plot
+        scalar_adjustment, _ = self.plot_optimum_prediction_fraction_correct_cutoffs_over_range(min(self.stability_classication_x_cutoff, 0.5), max(self.stability_classication_x_cutoff, 3.0), suppress_plot = True)
+        assert(self.scalar_adjustment == scalar_adjustment)
 
-        # Create a scatterplot for the results
-        main_scatterplot = '{0}main_scatterplot.png'.format(self.analysis_file_prefix)
-        if not(os.path.exists(main_scatterplot) and not(self.recreate_graphs)):
-            self.log('Saving scatterplot to %s.' % main_scatterplot)
-            plot_pandas(dataframe, 'Experimental', 'Predicted', main_scatterplot, RInterface.correlation_coefficient_gplot, title = 'Experimental vs. Prediction')
+        # The plots are independent so we queue them as jobs in the order that they appear in the PDF and render them concurrently
+        plot_jobs = []
 
+        # Main metrics
         if self.prediction_cap != None:
-            graph_order.append(self.create_section_slide('{0}section_1.png'.format(self.analysis_file_prefix), 'Main metrics', subtitle, self.credit, 'Predictions capped at \\u00b1{0} energy units'.format(self.prediction_cap)))
+            plot_jobs.append(lambda: self.create_section_slide('{0}section_1.png'.format(self.analysis_file_prefix), 'Main metrics', subtitle, self.credit, 'Predictions capped at \\u00b1{0} energy units'.format(self.prediction_cap)))
         else:
-            graph_order.append(self.create_section_slide('{0}section_1.png'.format(self.analysis_file_prefix), 'Main metrics', subtitle, self.credit))
-        graph_order.append(main_scatterplot)
+            plot_jobs.append(lambda: self.create_section_slide('{0}section_1.png'.format(self.analysis_file_prefix), 'Main metrics', subtitle, self.credit))
+        plot_jobs.append(lambda: self.plot_main_scatterplot('Predicted', '{0}main_scatterplot.png'.format(self.analysis_file_prefix), 'Experimental vs. Prediction'))
 
         # Plot a histogram of the absolute errors
-        graph_order.append(self.plot_absolute_error_histogram('{0}absolute_errors'.format(self.analysis_file_prefix), 'AbsoluteError'))
-        graph_order.append(self.create_section_slide('{0}section_2.png'.format(self.analysis_file_prefix), 'Adjustments', 'Optimization of the cutoffs\nfor the fraction correct metric'))
-        graph_order.append(scalar_adjustment_calculation_plot)
-        graph_order.append(optimal_predictive_cutoff_plot)
+        plot_jobs.append(lambda: self.plot_absolute_error_histogram('{0}absolute_errors'.format(self.analysis_file_prefix), 'AbsoluteError'))
+        plot_jobs.append(lambda: self.create_section_slide('{0}section_2.png'.format(self.analysis_file_prefix), 'Adjustments', 'Optimization of the cutoffs\nfor the fraction correct metric'))
+
+        # Plot which y-cutoff yields the best value for the fraction correct metric and the optimum y-cutoff given the specified or default x-cutoff
+        plot_jobs.append(lambda: self.plot_optimum_prediction_fraction_correct_cutoffs_over_range(min(self.stability_classication_x_cutoff, 0.5), max(self.stability_classication_x_cutoff, 3.0), suppress_plot = False)[1])
+        plot_jobs.append(lambda: self.plot_optimum_prediction_fraction_correct_cutoffs(self.stability_classication_x_cutoff))
 
         # Create a scatterplot and histogram for the adjusted results
-        main_adj_scatterplot = '{0}main_adjusted_with_scalar_scatterplot.png'.format(self.analysis_file_prefix)
-        if not(os.path.exists(main_adj_scatterplot) and not(self.recreate_graphs)):
-            self.log('Saving scatterplot to %s.' % main_adj_scatterplot)
-            plot_pandas(dataframe, 'Experimental', 'Predicted_adj', main_adj_scatterplot, RInterface.correlation_coefficient_gplot, title = 'Experimental vs. Prediction: adjusted scale')
-        graph_order.append(main_adj_scatterplot)
-        graph_order.append(self.plot_absolute_error_histogram('{0}absolute_errors_adjusted_with_scalar'.format(self.analysis_file_prefix), 'AbsoluteError_adj'))
+        plot_jobs.append(lambda: self.plot_main_scatterplot('Predicted_adj', '{0}main_adjusted_with_scalar_scatterplot.png'.format(self.analysis_file_prefix), 'Experimental vs. Prediction: adjusted scale'))
+        plot_jobs.append(lambda: self.plot_absolute_error_histogram('{0}absolute_errors_adjusted_with_scalar'.format(self.analysis_file_prefix), 'AbsoluteError_adj'))
 
         # Scatterplots colored by residue context / change on mutation
-        graph_order.append(self.create_section_slide('{0}section_3.png'.format(self.analysis_file_prefix), 'Residue context'))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Residue charges', self.scatterplot_charges, '{0}scatterplot_charges.png'.format(self.analysis_file_prefix)))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Exposure (cutoff = %0.2f)' % self.burial_cutoff, self.scatterplot_exposure, '{0}scatterplot_exposure.png'.format(self.analysis_file_prefix)))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Change in volume', self.scatterplot_volume, '{0}scatterplot_volume.png'.format(self.analysis_file_prefix)))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Wildtype residue s.s.', self.scatterplot_ss, '{0}scatterplot_ss.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.create_section_slide('{0}section_3.png'.format(self.analysis_file_prefix), 'Residue context'))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Residue charges', self.scatterplot_charges, '{0}scatterplot_charges.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Exposure (cutoff = %0.2f)' % self.burial_cutoff, self.scatterplot_exposure, '{0}scatterplot_exposure.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Change in volume', self.scatterplot_volume, '{0}scatterplot_volume.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Wildtype residue s.s.', self.scatterplot_ss, '{0}scatterplot_ss.png'.format(self.analysis_file_prefix)))
 
         # Scatterplots colored by SCOPe classification
-        graph_order.append(self.create_section_slide('{0}section_4.png'.format(self.analysis_file_prefix), 'SCOPe classes'))
+        plot_jobs.append(lambda: self.create_section_slide('{0}section_4.png'.format(self.analysis_file_prefix), 'SCOPe classes'))
         SCOP_classifications = set(dataframe['WildTypeSCOPClassification'].values.tolist())
         SCOP_folds = set(dataframe['WildTypeSCOPFold'].values.tolist())
         SCOP_classes = set(dataframe['WildTypeSCOPClass'].values.tolist())
         if len(SCOP_classes) <= 25:
-            graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - WT residue SCOP class', self.scatterplot_scop_class, '{0}scatterplot_scop_class.png'.format(self.analysis_file_prefix)))
+            plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - WT residue SCOP class', self.scatterplot_scop_class, '{0}scatterplot_scop_class.png'.format(self.analysis_file_prefix)))
         if len(SCOP_folds) <= 25:
-            graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - WT residue SCOP fold', self.scatterplot_scop_fold, '{0}scatterplot_scop_fold.png'.format(self.analysis_file_prefix)))
+            plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - WT residue SCOP fold', self.scatterplot_scop_fold, '{0}scatterplot_scop_fold.png'.format(self.analysis_file_prefix)))
         if len(SCOP_classifications) <= 25:
-            graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - WT residue SCOP classification', self.scatterplot_scop_classification, '{0}scatterplot_scop_classification.png'.format(self.analysis_file_prefix)))
+            plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - WT residue SCOP classification', self.scatterplot_scop_classification, '{0}scatterplot_scop_classification.png'.format(self.analysis_file_prefix)))
 
         # Scatterplots colored by residue types
-        graph_order.append(self.create_section_slide('{0}section_5.png'.format(self.analysis_file_prefix), 'Residue types'))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Wildtype', self.scatterplot_wildtype_aa, '{0}scatterplot_wildtype_aa.png'.format(self.analysis_file_prefix)))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Mutant', self.scatterplot_mutant_aa, '{0}scatterplot_mutant_aa.png'.format(self.analysis_file_prefix)))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Glycine/Proline', self.scatterplot_GP, '{0}scatterplot_gp.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.create_section_slide('{0}section_5.png'.format(self.analysis_file_prefix), 'Residue types'))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Wildtype', self.scatterplot_wildtype_aa, '{0}scatterplot_wildtype_aa.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Mutant', self.scatterplot_mutant_aa, '{0}scatterplot_mutant_aa.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Glycine/Proline', self.scatterplot_GP, '{0}scatterplot_gp.png'.format(self.analysis_file_prefix)))
 
         # Scatterplots colored PDB resolution and chain length
-        graph_order.append(self.create_section_slide('{0}section_6.png'.format(self.analysis_file_prefix), 'Chain properties'))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - PDB resolution', self.scatterplot_pdb_res_binned, '{0}scatterplot_pdb_res_binned.png'.format(self.analysis_file_prefix)))
-        graph_order.append(self.scatterplot_generic('Experimental vs. Prediction - Chain length', self.scatterplot_chain_length, '{0}scatterplot_chain_length.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.create_section_slide('{0}section_6.png'.format(self.analysis_file_prefix), 'Chain properties'))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - PDB resolution', self.scatterplot_pdb_res_binned, '{0}scatterplot_pdb_res_binned.png'.format(self.analysis_file_prefix)))
+        plot_jobs.append(lambda: self.scatterplot_generic('Experimental vs. Prediction - Chain length', self.scatterplot_chain_length, '{0}scatterplot_chain_length.png'.format(self.analysis_file_prefix)))
 
         # Errors / debugging
-        graph_order.append(self.create_section_slide('{0}section_7.png'.format(self.analysis_file_prefix), 'Errors / debugging'))
-        graph_order.append(self.plot_derivative_error_barchart())
+        plot_jobs.append(lambda: self.create_section_slide('{0}section_7.png'.format(self.analysis_file_prefix), 'Errors / debugging'))
+        plot_jobs.append(lambda: self.plot_derivative_error_barchart())
+
+        # Render the plots. The results are returned in job order so graph_order matches the order above.
+        graph_order = self.run_plot_jobs(plot_jobs)
 
         # Make sure all of the graphs have been created
         relative_graph_paths = [os.path.join(self.benchmark_run_name + '_subplots', os.path.split(g)[1]) for g in graph_order]
@@ -1234,6 +2089,59 @@ class BenchmarkRun(ReportingObject):
             self.log('An error occurred while combining the positional scatterplots using the convert application (ImageMagick).', colortext.error)
 
 
+    def run_plot_jobs(self, plot_jobs):
+        '''Runs the plot jobs (functions which take no arguments and return a plot filename) on a bounded pool of worker threads.
+           Each job spends its time in an R process or in matplotlib rendering so threads give us concurrency without having
+           to copy the dataframe into other processes. The filenames are returned in the same order as the jobs.'''
+        num_workers = max(1, min(self.plot_workers, len(plot_jobs)))
+        if num_workers == 1:
+            return [j() for j in plot_jobs]
+        self.log('Rendering {0} plots using {1} worker threads.'.format(len(plot_jobs), num_workers), colortext.message)
+        pool = ThreadPool(processes = num_workers)
+        try:
+            return pool.map(lambda j: j(), plot_jobs, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+
+
+    def export_plot_data(self):
+        '''Writes the dataframe used by the plots to a single CSV file which is read by all of the R plot scripts.'''
+        plot_dataframe = self.create_plot_dataframe()
+        self.plot_data_filepath = '{0}plot_data.csv'.format(self.analysis_file_prefix)
+        plot_dataframe.to_csv(self.plot_data_filepath, sep = ',', header = True)
+
+
+    def create_plot_dataframe(self):
+        '''Creates the dataframe used by the plots and the metric breakdowns, adding the renamed and derived columns used by
+           the scatterplots.'''
+        import numpy
+        if self.plot_dataframe is not None:
+            return self.plot_dataframe
+        plot_dataframe = self.dataframe[['PDBFileID', 'Experimental', 'Predicted', 'Predicted_adj', 'AbsoluteError', 'AbsoluteError_adj', 'ResidueCharges', 'VolumeChange',
+                                         'WildTypeSCOPClass', 'WildTypeSCOPFold', 'WildTypeSCOPClassification', 'WildTypeAA', 'MutantAA', 'PDBResolutionBin', 'NumberOfDerivativeErrors']].copy()
+        plot_dataframe['Exposure'] = self.dataframe['WildTypeExposure']
+        plot_dataframe['WTSecondaryStructure'] = self.dataframe['WildTypeDSSPSimpleSSType']
+        plot_dataframe['GP'] = numpy.where(self.dataframe['HasGPMutation'] == 1, 'GP', 'Other')
+        plot_dataframe['Residues'] = self.dataframe['MonomerLength']
+        for categorical_column in ['ResidueCharges', 'VolumeChange', 'Exposure', 'WTSecondaryStructure', 'WildTypeAA', 'MutantAA']:
+            plot_dataframe[categorical_column] = plot_dataframe[categorical_column].where(plot_dataframe[categorical_column].notnull(), 'None') # the color scales use "None" for ambiguous values
+        self.plot_dataframe = plot_dataframe
+        return plot_dataframe
+
+
+    def plot_main_scatterplot(self, y_series, plot_filename, title):
+        if os.path.exists(plot_filename) and not(self.recreate_graphs):
+            return plot_filename
+        self.log('Saving scatterplot to %s.' % plot_filename)
+        if self.plot_backend == 'matplotlib' or plotting.use_density_plot(len(self.plot_dataframe)):
+            # plot_pandas renders large data sets as binned densities
+            plot_pandas(self.plot_dataframe, 'Experimental', y_series, plot_filename, RInterface.correlation_coefficient_gplot, title = title)
+        else:
+            RInterface.correlation_coefficient_gplot(self.plot_data_filepath, plot_filename, 'png', title = title, predicted_field = y_series)
+        return plot_filename
+
+
     def compare(self, other):
         '''Compare this benchmark run with another run.'''
         pass
@@ -1241,38 +2149,32 @@ class BenchmarkRun(ReportingObject):
 
 
     def determine_optimum_fraction_correct_cutoffs(self, dataframe, stability_classication_x_cutoff):
-        '''Determines the value of stability_classication_y_cutoff which approximately maximizes the fraction correct
-           measurement w.r.t. a fixed stability_classication_x_cutoff. This function uses discrete sampling and so it
-           may miss the actual maximum. We use two rounds of sampling: i) a coarse-grained sampling (0.1 energy unit
-           intervals); and ii) finer sampling (0.01 unit intervals).
-           In both rounds, we choose the one corresponding to a lower value for the cutoff in cases of multiple maxima.'''
-
-        # Determine the value for the fraction correct y-value (predicted) cutoff which will approximately yield the
-        # maximum fraction-correct value
-
-        fraction_correct_range = []
-
-        # Round 1 : Coarse sampling. Test 0.5 -> 8.0 in 0.1 increments
-        for z in range(5, 80):
-            w = float(z) / 10.0
-            fraction_correct_range.append((w, fraction_correct_pandas(dataframe, 'Experimental', 'Predicted', x_cutoff = stability_classication_x_cutoff, y_cutoff = w)))
-
-        max_value_cutoff, max_value = fraction_correct_range[0][0], fraction_correct_range[0][1]
-        for p in fraction_correct_range:
-            if p[1] > max_value:
-                max_value_cutoff, max_value = p[0], p[1]
-
-        # Round 2 : Finer sampling. Test max_value_cutoff - 0.1 -> max_value_cutoff + 0.1 in 0.01 increments
-        for z in range(int((max_value_cutoff - 0.1) * 100), int((max_value_cutoff + 0.1) * 100)):
-            w = float(z) / 100.0
-            fraction_correct_range.append((w, fraction_correct_pandas(dataframe, 'Experimental', 'Predicted', x_cutoff = stability_classication_x_cutoff, y_cutoff = w)))
-        fraction_correct_range = sorted(set(fraction_correct_range)) # sort so that we find the lowest cutoff value in case of duplicate fraction correct values
-        max_value_cutoff, max_value = fraction_correct_range[0][0], fraction_correct_range[0][1]
-        for p in fraction_correct_range:
-            if p[1] > max_value:
-                max_value_cutoff, max_value = p[0], p[1]
-
-        return max_value_cutoff, max_value, fraction_correct_range
+        '''Determines the value of stability_classication_y_cutoff which maximizes the fraction correct measurement
+           w.r.t. a fixed stability_classication_x_cutoff. The fraction correct value only changes at the absolute
+           predicted values so we evaluate it exactly at each of these breakpoints in a single sorted sweep rather than
+           sampling a grid of cutoffs. In cases of multiple maxima, we choose the lowest cutoff value.
+           Returns the best cutoff, the maximal fraction correct value, and the list of (cutoff, fraction correct) pairs.'''
+        return self._determine_optimum_fraction_correct_cutoffs(dataframe, [stability_classication_x_cutoff])[0]
+
+
+    def determine_optimum_fraction_correct_cutoffs_over_range(self, stability_classication_x_cutoffs):
+        '''A cached version of determine_optimum_fraction_correct_cutoffs over the run dataframe for a list of experimental
+           cutoffs. The curves for all uncached cutoffs are computed at once so that create_dataframe and plot share the results.'''
+        missing_x_cutoffs = [x for x in stability_classication_x_cutoffs if x not in self.optimum_fraction_correct_cutoffs]
+        if missing_x_cutoffs:
+            for x_cutoff, result in zip(missing_x_cutoffs, self._determine_optimum_fraction_correct_cutoffs(self.dataframe, missing_x_cutoffs)):
+                self.optimum_fraction_correct_cutoffs[x_cutoff] = result
+        return [self.optimum_fraction_correct_cutoffs[x] for x in stability_classication_x_cutoffs]
+
+
+    def _determine_optimum_fraction_correct_cutoffs(self, dataframe, stability_classication_x_cutoffs):
+        results = []
+        surface = fraction_correct_cutoff_surface(dataframe['Experimental'].values, dataframe['Predicted'].values, stability_classication_x_cutoffs, min_y_cutoff = self.min_fraction_correct_y_cutoff, max_y_cutoff = self.max_fraction_correct_y_cutoff)
+        for y_cutoffs, fraction_correct_values in surface:
+            max_value_cutoff, max_value = optimum_fraction_correct_cutoff(y_cutoffs, fraction_correct_values)
+            fraction_correct_range = list(zip(y_cutoffs.tolist(), fraction_correct_values.tolist()))
+            results.append((max_value_cutoff, max_value, fraction_correct_range))
+        return results
 
 
     def create_section_slide(self, plot_filename, title, subtitle = '', footer = '', extra = ''):
@@ -1305,7 +2207,11 @@ class BenchmarkRun(ReportingObject):
         footer_size = 6
 
         # Create plot
-        if self.generate_plots:
+        if self.generate_plots and self.plot_backend == 'matplotlib':
+            self.log('Section slide %s.' % plot_filename)
+            plotting.section_slide(plot_filename, title, subtitle = subtitle, footer = footer, extra = extra, title_size = title_size, subtitle_size = subtitle_size, footer_size = footer_size)
+            return plot_filename
+        elif self.generate_plots:
             r_script = '''library(ggplot2)
 library(gridExtra)
 library(scales)
@@ -1330,7 +2236,7 @@ dev.off()'''
     def plot_optimum_prediction_fraction_correct_cutoffs(self, stability_classication_x_cutoff):
 
         # Determine the optimal values
-        max_value_cutoff, max_value, fraction_correct_range = self.determine_optimum_fraction_correct_cutoffs(self.dataframe, stability_classication_x_cutoff)
+        max_value_cutoff, max_value, fraction_correct_range = self.determine_optimum_fraction_correct_cutoffs_over_range([stability_classication_x_cutoff])[0]
 
         # Filenames
         output_filename_prefix = '{0}optimum_fraction_correct_at_{1}_kcal_mol'.format(self.analysis_file_prefix, '%.2f' % stability_classication_x_cutoff)
@@ -1351,7 +2257,12 @@ dev.off()'''
         write_file(csv_filename, '\n'.join(lines))
 
         # Create plot
-        if self.generate_plots:
+        if self.generate_plots and self.plot_backend == 'matplotlib':
+            self.log('Saving plot of approximate optimal fraction correct cutoffs to %s.' % plot_filename)
+            plotting.fraction_correct_cutoff_plot([p[0] for p in fraction_correct_range], [p[1] for p in fraction_correct_range], max_value_cutoff, max_value, plot_filename,
+                                                  title = 'Optimum cutoff for fraction correct metric at %0.2f kcal/mol' % stability_classication_x_cutoff)
+            return plot_filename
+        elif self.generate_plots:
             title = 'Optimum cutoff for fraction correct metric at %0.2f kcal/mol' % stability_classication_x_cutoff
             r_script = '''library(ggplot2)
 library(gridExtra)
@@ -1386,6 +2297,7 @@ dev.off()'''
     def plot_optimum_prediction_fraction_correct_cutoffs_over_range(self, min_stability_classication_x_cutoff, max_stability_classication_x_cutoff, suppress_plot = False):
         '''Plots the optimum cutoff for the predictions to maximize the fraction correct metric over a range of experimental cutoffs.
            Returns the average scalar corresponding to the best value of fraction correct over a range of cutoff values for the experimental cutoffs.'''
+        import numpy
 
         # Filenames
         output_filename_prefix = '{0}optimum_fraction_correct_at_varying_kcal_mol'.format(self.analysis_file_prefix)
@@ -1403,13 +2315,13 @@ dev.off()'''
         avg_scale = 0
         plot_graph = self.generate_plots and not(suppress_plot)
         while x_cutoff < max_stability_classication_x_cutoff + 0.1:
-            max_value_cutoff, max_value, fraction_correct_range = self.determine_optimum_fraction_correct_cutoffs(self.dataframe, x_cutoff)
+            x_values.append(x_cutoff)
+            x_cutoff += 0.1
+        for x_cutoff, (max_value_cutoff, max_value, fraction_correct_range) in zip(x_values, self.determine_optimum_fraction_correct_cutoffs_over_range(x_values)):
             if plot_graph:
                 lines.append(','.join(map(str, (x_cutoff, max_value_cutoff))))
-            x_values.append(x_cutoff)
             y_values.append(max_value_cutoff)
             avg_scale += max_value_cutoff / x_cutoff
-            x_cutoff += 0.1
 
         if plot_graph:
             write_file(csv_filename, '\n'.join(lines))
@@ -1430,6 +2342,11 @@ dev.off()'''
                 self.log('Saving plot of approximate optimal fraction correct cutoffs over varying experimental cutoffs to %s.' % plot_filename)
 
                 title = 'Optimum cutoff for fraction correct metric at varying experimental cutoffs'
+                if self.plot_backend == 'matplotlib':
+                    plotting.line_plot(x_values, y_values, plot_filename, title = title, xlabel = 'Experimental cutoff (kcal/mol)', ylabel = 'Optimal prediction cutoff (energy units)',
+                                       labels = ['Scalar = %0.2f' % average_scalar, '$\\sigma$ = %0.2f' % numpy.std(scalars)])
+                    return average_scalar, plot_filename
+
                 r_script = '''library(ggplot2)
 library(gridExtra)
 library(scales)
@@ -1461,14 +2378,7 @@ dev.off()'''
         # Filenames
         output_filename_prefix = '{0}errors_by_pdb_id'.format(self.analysis_file_prefix)
         plot_filename = output_filename_prefix + '.png'
-        csv_filename = output_filename_prefix + '.txt'
-        R_filename = output_filename_prefix + '.R'
-
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['PDBFileID', 'NumberOfDerivativeErrors']]
-        new_dataframe.columns = ['PDB', 'AverageDerivativeErrorCount']
-        new_dataframe = new_dataframe.groupby(['PDB'])['AverageDerivativeErrorCount'].mean()
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
+        plot_data_filepath = self.plot_data_filepath
 
         if os.path.exists(plot_filename) and not(self.recreate_graphs):
             return plot_filename
@@ -1478,13 +2388,19 @@ dev.off()'''
         brown = plot_colors['brown']
         self.log('Saving barchart to %s.' % plot_filename)
         title = 'Average count of Inaccurate G! errors by PDB ID'
+        if self.plot_backend == 'matplotlib':
+            average_error_counts = self.plot_dataframe.groupby(['PDBFileID'])['NumberOfDerivativeErrors'].mean()
+            plotting.barchart(average_error_counts.index.values.tolist(), average_error_counts.values.tolist(), plot_filename, title = title, xlabel = 'PDB ID', ylabel = 'Derivative errors (average)', edgecolor = brown, facecolor = firebrick)
+            return plot_filename
+
         r_script = '''library(ggplot2)
 library(gridExtra)
 library(scales)
 library(qualV)
 
 png('%(plot_filename)s', height=4096, width=4096, bg="white", res=600)
-plot_data <- read.csv('%(csv_filename)s', header=T)
+plot_data <- read.csv('%(plot_data_filepath)s', header=T)
+plot_data <- aggregate(AverageDerivativeErrorCount ~ PDB, data = data.frame(PDB = plot_data$PDBFileID, AverageDerivativeErrorCount = plot_data$NumberOfDerivativeErrors), FUN = mean)
 
 b <- ggplot(plot_data, aes(x=PDB, y=AverageDerivativeErrorCount)) +
      geom_bar(stat='identity', colour = "%(brown)s", fill = "%(firebrick)s") +
@@ -1509,29 +2425,28 @@ dev.off()'''
 
         # Filenames
         plot_filename = output_filename_prefix + '.png'
-        csv_filename = output_filename_prefix + '.txt'
-        R_filename = output_filename_prefix + '.R'
+        plot_data_filepath = self.plot_data_filepath
 
         if os.path.exists(plot_filename) and not(self.recreate_graphs):
             return plot_filename
 
-        # Create CSV input
-        new_dataframe = self.dataframe[[data_series]]
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
         if not self.generate_plots:
             return
 
         # Create plot
         self.log('Saving scatterplot to %s.' % plot_filename)
         title = 'Distribution of absolute errors (prediction - observed)'
+        if self.plot_backend == 'matplotlib':
+            plotting.histogram(self.plot_dataframe[data_series].values, plot_filename, title = title, xlabel = 'Absolute error (kcal/mol - energy units)')
+            return plot_filename
+
         r_script = '''library(ggplot2)
 library(gridExtra)
 library(scales)
 library(qualV)
 
 png('%(plot_filename)s', height=4096, width=4096, bg="white", res=600)
-plot_data <- read.csv('%(csv_filename)s', header=T)
+plot_data <- read.csv('%(plot_data_filepath)s', header=T)
 
 m <- ggplot(plot_data, aes(x=%(data_series)s)) +
     geom_histogram(colour = "darkgreen", fill = "green", binwidth = 0.5) +
@@ -1548,28 +2463,63 @@ dev.off()'''
         if os.path.exists(plot_filename) and not(self.recreate_graphs):
             return plot_filename
 
-        csv_filename = os.path.splitext(plot_filename)[0] + '.txt'
-        plot_commands = plotfn(title, csv_filename)
-        r_script = '''library(ggplot2)
+        plot_arguments = plotfn()
+        plot_arguments['color_scale'] = self.get_group_color_scale(plot_arguments['colorseries'], plot_arguments.get('color_scale'))
+        if self.generate_plots:
+            self.log('Saving scatterplot to %s.' % plot_filename)
+            if self.plot_backend == 'matplotlib':
+                xseries, yseries = plot_arguments.get('xseries', 'Experimental'), plot_arguments.get('yseries', 'Predicted')
+                plotting.scatterplot_color_by_series(self.plot_dataframe, xseries, yseries, plot_arguments['colorseries'], plot_filename, title = title,
+                                                     color_scale = plot_arguments.get('color_scale'), point_opacity = plot_arguments.get('point_opacity', 0.4), mae_str = self.get_mae_string(xseries, yseries))
+                return plot_filename
+
+            # Large data sets are binned into a temporary file which is deleted once the plot is drawn
+            plot_data_filepath = self.plot_data_filepath
+            binned_data_filepath = None
+            try:
+                if plotting.use_density_plot(len(self.plot_dataframe)):
+                    binned_data_filepath, plot_commands = self.scatterplot_density_by_series(title = title, **plot_arguments)
+                    plot_data_filepath = binned_data_filepath
+                else:
+                    plot_commands = self.scatterplot_color_by_series(title = title, **plot_arguments)
+                r_script = '''library(ggplot2)
 library(gridExtra)
 library(scales)
 library(qualV)
 
 png('%(plot_filename)s', height=4096, width=4096, bg="white", res=600)
-plot_data <- read.csv('%(csv_filename)s', header=T)
+plot_data <- read.csv('%(plot_data_filepath)s', header=T)
 
 %(plot_commands)s
 
 dev.off()''' % locals()
-        if self.generate_plots:
-            self.log('Saving scatterplot to %s.' % plot_filename)
-            RInterface._runRScript(r_script)
+                RInterface._runRScript(r_script)
+            finally:
+                if binned_data_filepath:
+                    delete_file(binned_data_filepath)
             return plot_filename
 
 
-    def scatterplot_color_by_series(self, colorseries, xseries = "Experimental", yseries = "Predicted", title = '', plot_scale = '', point_opacity = 0.4, extra_commands = ''):
+    def get_group_color_scale(self, colorseries, color_scale):
+        '''Adds the number of cases and the correlation coefficient of each group (see calculate_group_metrics) to the legend
+           labels of a categorical color scale.'''
+        if colorseries not in self.group_metrics or (color_scale and color_scale.get('gradient')):
+            return color_scale
+        color_scale = copy.deepcopy(color_scale or {})
+        labels = dict(color_scale.get('labels', []))
+        group_labels = []
+        for group, group_stats in self.group_metrics[colorseries].items():
+            group = str(group)
+            label = labels.get(group, group)
+            if 'pearsonr' in group_stats:
+                group_labels.append((group, '{0} (n={1}, R={2:.2f})'.format(label, group_stats['num_points'], group_stats['pearsonr'][0])))
+            else:
+                group_labels.append((group, '{0} (n={1})'.format(label, group_stats['num_points'])))
+        color_scale['labels'] = group_labels
+        return color_scale
 
-        # Compute MAE
+
+    def get_mae_string(self, xseries, yseries):
         mae_str = ''
         if xseries == 'Experimental':
             if yseries == 'Predicted':
@@ -1578,11 +2528,37 @@ dev.off()''' % locals()
                 mae_str = self.dataframe['AbsoluteError_adj'].mean()
         if mae_str:
             mae_str = 'MAE = {0:.3f}'.format(mae_str)
+        return mae_str
+
+
+    @staticmethod
+    def get_R_color_scale(color_scale):
+        '''Converts a color scale (see plotting.scatterplot_color_by_series) into a ggplot2 scale_color_manual command.'''
+        scale_arguments = []
+        if color_scale.get('name'):
+            scale_arguments.append('    name="%s"' % color_scale['name'])
+        if color_scale.get('values'):
+            scale_arguments.append('    values = c( %s)' % ', '.join(['"%s" = \'%s\'' % (k, v) for k, v in color_scale['values']]))
+        if color_scale.get('labels'):
+            scale_arguments.append('    labels = c( %s)' % ', '.join(['"%s" = "%s"' % (k, v) for k, v in color_scale['labels']]))
+        if not color_scale.get('values'):
+            # Keep the default colors but use the names and labels
+            return 'plot_scale <- scale_color_discrete(\n%s)' % ',\n'.join(scale_arguments)
+        return 'plot_scale <- scale_color_manual(\n%s)' % ',\n'.join(scale_arguments)
+
+
+    def scatterplot_color_by_series(self, colorseries, xseries = "Experimental", yseries = "Predicted", title = '', color_scale = None, point_opacity = 0.4):
+        '''Returns the R commands for a scatterplot with points colored by the values of colorseries.'''
+
+        mae_str = self.get_mae_string(xseries, yseries)
 
         plot_scale_line = ''
         plot_scale_argument = ''
-        if plot_scale:
-            plot_scale_line = plot_scale.strip()
+        extra_commands = ''
+        if color_scale and color_scale.get('gradient'):
+            extra_commands = '\n    scale_colour_gradient(low="%s", high="%s") +' % tuple(color_scale['gradient'])
+        elif color_scale:
+            plot_scale_line = BenchmarkRun.get_R_color_scale(color_scale)
             plot_scale_argument = '\n    plot_scale +'
 
         return '''
@@ -1627,196 +2603,152 @@ p
 ''' % locals()
 
 
-    def scatterplot_charges(self, title, csv_filename):
-        '''Scatterplot by residue charge.'''
+    def scatterplot_density_by_series(self, colorseries, xseries = "Experimental", yseries = "Predicted", title = '', color_scale = None, point_opacity = 0.4):
+        '''Writes the plot data binned by plotting.binned_density to a temporary file and returns the file path and the R
+           commands for the binned density version of scatterplot_color_by_series used for large data sets. Each bin is
+           drawn in the color of its most common category (or of the mean value of colorseries for a gradient). The
+           regression lines and the correlation coefficient are computed from all of the points.'''
+        import numpy
+        import pandas
+        mae_str = self.get_mae_string(xseries, yseries)
+        x_values = self.plot_dataframe[xseries].values.astype(float)
+        y_values = self.plot_dataframe[yseries].values.astype(float)
+        intercept, slope, origin_slope = plotting.regression_coefficients(x_values, y_values)
+        rvalue = numpy.corrcoef(y_values, x_values)[0, 1]
+        minx, maxx, miny, maxy = x_values.min(), x_values.max(), y_values.min(), y_values.max()
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'ResidueCharges']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
+        plot_scale_line = ''
+        plot_scale_argument = ''
+        extra_commands = ''
+        if color_scale and color_scale.get('gradient'):
+            color_values = self.plot_dataframe[colorseries].values.astype(float)
+            has_value = ~numpy.isnan(color_values)
+            counts, sums, xedges, yedges = plotting.binned_density(x_values, y_values, categories = has_value.astype(int), num_categories = 2, weights = numpy.where(has_value, color_values, 0.0))
+            with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+                bin_colors = sums / counts[:, :, 1] # NaN (NA in R) for bins without values
+            extra_commands = '\n    scale_fill_gradient(low="%s", high="%s") +' % tuple(color_scale['gradient'])
+        else:
+            categories = self.plot_dataframe[colorseries].fillna('None').astype(str).values
+            ordered_categories, category_indices = numpy.unique(categories, return_inverse = True)
+            counts, sums, xedges, yedges = plotting.binned_density(x_values, y_values, categories = category_indices.ravel(), num_categories = len(ordered_categories))
+            bin_colors = ordered_categories[counts.argmax(axis = 2)]
+            if color_scale:
+                plot_scale_line = BenchmarkRun.get_R_color_scale(color_scale).replace('scale_color_', 'scale_fill_')
+                plot_scale_argument = '\n    plot_scale +'
+        counts = counts.sum(axis = 2)
+        x_bins, y_bins = numpy.nonzero(counts)
+        binned_data = pandas.DataFrame({
+            xseries : ((xedges[:-1] + xedges[1:]) / 2.0)[x_bins],
+            yseries : ((yedges[:-1] + yedges[1:]) / 2.0)[y_bins],
+            'Opacity' : plotting.density_opacity(counts, max_opacity = max(point_opacity, 0.6))[x_bins, y_bins],
+            colorseries : bin_colors[x_bins, y_bins],
+        })
+        binned_data_filepath = write_temp_file('.', binned_data.to_csv(sep = ',', header = True, index = False), suffix = '.csv')
+        bin_width, bin_height = xedges[1] - xedges[0], yedges[1] - yedges[0]
+
+        return binned_data_filepath, '''
+xpos <- %(minx)f + ((%(maxx)f - %(minx)f) * 0.05)
+ypos_cor <- %(maxy)f - ((%(maxy)f - %(miny)f) * 0.015)
+ypos_mae <- %(maxy)f - ((%(maxy)f - %(miny)f) * 0.055)
 
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    values = c( "None" = '#777777', "Change" = '%(cornflower_blue)s', "Polar/Charged" = 'magenta', "Hydrophobic/Non-polar" = 'green'),
-    labels = c( "None" = "N/A", "Change" = "Change", "Polar/Charged" = "Polar/Charged", "Hydrophobic/Non-polar" = "Hydrophobic/Non-polar"))''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "ResidueCharges", title = title, plot_scale = plot_scale, point_opacity = 0.6)
+%(plot_scale_line)s
 
+p <- ggplot(data = plot_data, aes(x = %(xseries)s, y = %(yseries)s)) +%(plot_scale_argument)s %(extra_commands)s
+    xlab("Experimental (kcal/mol)") +
+    ylab("Predictions (energy units)") +
+    ggtitle("%(title)s") +
+    geom_tile(aes(fill = %(colorseries)s, alpha = Opacity), width = %(bin_width)f, height = %(bin_height)f) +
+    scale_alpha_identity() +
+    geom_abline(size = 0.25, intercept = %(intercept)f, slope = %(slope)f) +
+    geom_abline(color="blue",size = 0.25, intercept = 0, slope = %(origin_slope)f) +
+    annotate("text", hjust=0, size=4, x = xpos, y = ypos_cor, fontface="plain", family = "sans", label=sprintf("R = %%0.3f", round(%(rvalue)f, digits = 4))) +
+    annotate("text", hjust=0, size=4, x = xpos, y = ypos_mae, fontface="plain", family = "sans", label="%(mae_str)s")
+p
 
-    def scatterplot_exposure(self, title, csv_filename):
-        '''Scatterplot by exposure class.'''
+''' % locals()
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'WildTypeExposure']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.columns = ['Experimental', 'Predicted', 'Exposure', 'Opacity'] # rename the exposure column
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
 
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    values = c( "None" = '#777777', "B" = '%(brown)s', "E" = '%(purple)s'),
-    labels = c( "None" = "N/A", "B" = "Buried", "E" = "Exposed"))''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "Exposure", title = title, plot_scale = plot_scale)
+    # The scatterplot_* functions below return the arguments for scatterplot_color_by_series. The data is read from the plot dataframe (see export_plot_data).
 
 
-    def scatterplot_volume(self, title, csv_filename):
-        '''Scatterplot by change in volume upon mutation.'''
+    def scatterplot_charges(self):
+        '''Scatterplot by residue charge.'''
+        color_scale = dict(
+            values = [("None", '#777777'), ("Change", plot_colors['cornflower_blue']), ("Polar/Charged", 'magenta'), ("Hydrophobic/Non-polar", 'green')],
+            labels = [("None", "N/A"), ("Change", "Change"), ("Polar/Charged", "Polar/Charged"), ("Hydrophobic/Non-polar", "Hydrophobic/Non-polar")])
+        return dict(colorseries = "ResidueCharges", color_scale = color_scale, point_opacity = 0.6)
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'VolumeChange']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
 
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    values = c( "None" = '#777777', "SL" = '%(brown)s', "LS" = '%(purple)s', 'XX' = "%(cornflower_blue)s"),
-    labels = c( "None" = "N/A", "SL" = "Increase", "LS" = "Decrease", "XX" = "No change"))''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "VolumeChange", title = title, plot_scale = plot_scale)
+    def scatterplot_exposure(self):
+        '''Scatterplot by exposure class.'''
+        color_scale = dict(
+            values = [("None", '#777777'), ("B", plot_colors['brown']), ("E", plot_colors['purple'])],
+            labels = [("None", "N/A"), ("B", "Buried"), ("E", "Exposed")])
+        return dict(colorseries = "Exposure", color_scale = color_scale)
 
 
-    def scatterplot_ss(self, title, csv_filename):
-        '''Scatterplot by secondary structure.'''
+    def scatterplot_volume(self):
+        '''Scatterplot by change in volume upon mutation.'''
+        color_scale = dict(
+            values = [("None", '#777777'), ("SL", plot_colors['brown']), ("LS", plot_colors['purple']), ("XX", plot_colors['cornflower_blue'])],
+            labels = [("None", "N/A"), ("SL", "Increase"), ("LS", "Decrease"), ("XX", "No change")])
+        return dict(colorseries = "VolumeChange", color_scale = color_scale)
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'WildTypeDSSPSimpleSSType']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.columns = ['Experimental', 'Predicted', 'WTSecondaryStructure', 'Opacity'] # rename the s.s. column
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
 
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    name="Secondary structure",
-    values = c( "None" = '#777777', "H" = 'magenta', "S" = 'orange', "O" = '%(cornflower_blue)s'),
-    labels = c( "None" = "N/A", "H" = "Helix", "S" = "Sheet", "O" = "Other"))''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "WTSecondaryStructure", title = title, plot_scale = plot_scale, point_opacity = 0.6)
+    def scatterplot_ss(self):
+        '''Scatterplot by secondary structure.'''
+        color_scale = dict(
+            name = "Secondary structure",
+            values = [("None", '#777777'), ("H", 'magenta'), ("S", 'orange'), ("O", plot_colors['cornflower_blue'])],
+            labels = [("None", "N/A"), ("H", "Helix"), ("S", "Sheet"), ("O", "Other")])
+        return dict(colorseries = "WTSecondaryStructure", color_scale = color_scale, point_opacity = 0.6)
 
 
-    def scatterplot_scop_class(self, title, csv_filename):
+    def scatterplot_scop_class(self):
         '''Scatterplot by SCOPe class.'''
-
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'WildTypeSCOPClass']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        return self.scatterplot_color_by_series(colorseries = "WildTypeSCOPClass", title = title, point_opacity = 0.6)
+        return dict(colorseries = "WildTypeSCOPClass", point_opacity = 0.6)
 
 
-    def scatterplot_scop_fold(self, title, csv_filename):
+    def scatterplot_scop_fold(self):
         '''Scatterplot by SCOPe fold.'''
-
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'WildTypeSCOPFold']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        return self.scatterplot_color_by_series(colorseries = "WildTypeSCOPFold", title = title, point_opacity = 0.6)
+        return dict(colorseries = "WildTypeSCOPFold", point_opacity = 0.6)
 
 
-    def scatterplot_scop_classification(self, title, csv_filename):
+    def scatterplot_scop_classification(self):
         '''Scatterplot by SCOPe classification.'''
+        return dict(colorseries = "WildTypeSCOPClassification", point_opacity = 0.6)
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'WildTypeSCOPClassification']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        return self.scatterplot_color_by_series(colorseries = "WildTypeSCOPClassification", title = title, point_opacity = 0.6)
 
-
-    def scatterplot_wildtype_aa(self, title, csv_filename):
+    def scatterplot_wildtype_aa(self):
         '''Scatterplot by wildtype residue.'''
-
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'WildTypeAA']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    name="Residue",
-    values = c( "None" = '#808080', "A" = '#FF0000', "C" = '#BFBF00', "D" = '#008000', "E" = "#80FFFF", "F" = "#8080FF", "G" = "#BF40BF", "H" = "#A0A424", "I" = "#411BEA", "K" = "#1EAC41", "L" = "#F0C80E", "M" = "#B430E5", "N" = "#ED7651", "P" = "#19CB97", "Q" = "#362698", "R" = "#7E7EB8", "S" = "#603000", "T" = "#A71818", "V" = "#DF8020", "W" = "#E75858", "Y" = "#082008"),
-    labels = c( "None" = "N/A", "A" = "A", "C" = "C", "D" = "D", "E" = "E", "F" = "F", "G" = "G", "H" = "H", "I" = "I", "K" = "K", "L" = "L", "M" = "M", "N" = "N", "P" = "P", "Q" = "Q", "R" = "R", "S" = "S", "T" = "T", "V" = "V", "W" = "W", "Y" = "Y"))
-    ''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "WildTypeAA", title = title, plot_scale = plot_scale, point_opacity = 0.6)
+        return dict(colorseries = "WildTypeAA", color_scale = amino_acid_color_scale, point_opacity = 0.6)
 
 
-    def scatterplot_mutant_aa(self, title, csv_filename):
+    def scatterplot_mutant_aa(self):
         '''Scatterplot by mutant residue.'''
+        return dict(colorseries = "MutantAA", color_scale = amino_acid_color_scale, point_opacity = 0.6)
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'MutantAA']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    name="Residue",
-    values = c( "None" = '#808080', "A" = '#FF0000', "C" = '#BFBF00', "D" = '#008000', "E" = "#80FFFF", "F" = "#8080FF", "G" = "#BF40BF", "H" = "#A0A424", "I" = "#411BEA", "K" = "#1EAC41", "L" = "#F0C80E", "M" = "#B430E5", "N" = "#ED7651", "P" = "#19CB97", "Q" = "#362698", "R" = "#7E7EB8", "S" = "#603000", "T" = "#A71818", "V" = "#DF8020", "W" = "#E75858", "Y" = "#082008"),
-    labels = c( "None" = "N/A", "A" = "A", "C" = "C", "D" = "D", "E" = "E", "F" = "F", "G" = "G", "H" = "H", "I" = "I", "K" = "K", "L" = "L", "M" = "M", "N" = "N", "P" = "P", "Q" = "Q", "R" = "R", "S" = "S", "T" = "T", "V" = "V", "W" = "W", "Y" = "Y"))
-    ''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "MutantAA", title = title, plot_scale = plot_scale, point_opacity = 0.6)
-
-
-    def scatterplot_GP(self, title, csv_filename):
 
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'HasGPMutation']]
-        new_dataframe['GP'] = numpy.where(new_dataframe['HasGPMutation'] == 1, 'GP', 'Other')
-        new_dataframe['Opacity'] = numpy.where(new_dataframe['HasGPMutation'] == 1, 0.9, 0.5)
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'GP', 'Opacity']]
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        plot_scale = '''plot_scale <- scale_color_manual(
-    name="Glycine/Proline",
-    values = c( "None" = '#777777', "GP" = '%(neon_green)s', "Other" = '#440077'),
-    labels = c( "None" = "N/A", "GP" = "GP", "Other" = "Other"))''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "GP", title = title, plot_scale = plot_scale, point_opacity = 0.75)
+    def scatterplot_GP(self):
+        '''Scatterplot by whether the mutation involves glycine or proline.'''
+        color_scale = dict(
+            name = "Glycine/Proline",
+            values = [("None", '#777777'), ("GP", plot_colors['neon_green']), ("Other", '#440077')],
+            labels = [("None", "N/A"), ("GP", "GP"), ("Other", "Other")])
+        return dict(colorseries = "GP", color_scale = color_scale, point_opacity = 0.75)
 
 
-    def scatterplot_pdb_res_binned(self, title, csv_filename):
+    def scatterplot_pdb_res_binned(self):
         '''Scatterplot by binned PDB resolution.'''
-
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'PDBResolutionBin']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    name = "Resolution",
-    values = c( "N/A" = '#777777', "<1.5" = '#0052aE', "1.5-2.0" = '#554C54', '2.0-2.5' = "#FFA17F", '>=2.5' = "#ce4200")
-    )''' % plot_colors
-        return self.scatterplot_color_by_series(colorseries = "PDBResolutionBin", title = title, plot_scale = plot_scale, point_opacity = 0.75)
+        color_scale = dict(
+            name = "Resolution",
+            values = [("N/A", '#777777'), ("<1.5", '#0052aE'), ("1.5-2.0", '#554C54'), ("2.0-2.5", "#FFA17F"), (">=2.5", "#ce4200")])
+        return dict(colorseries = "PDBResolutionBin", color_scale = color_scale, point_opacity = 0.75)
 
 
-    def scatterplot_chain_length(self, title, csv_filename):
+    def scatterplot_chain_length(self):
         '''Scatterplot by chain length.'''
-
-        # Create CSV input
-        new_dataframe = self.dataframe.copy()
-        new_dataframe = new_dataframe[['Experimental', 'Predicted', 'MonomerLength']]
-        new_dataframe['Opacity'] = 0.4
-        new_dataframe.columns = ['Experimental', 'Predicted', 'Residues', 'Opacity'] # rename the monomer length column
-        new_dataframe.to_csv(csv_filename, sep = ',', header = True)
-
-        plot_scale = '''
-plot_scale <- scale_color_manual(
-    name = "Resolution",
-    values = c( "N/A" = '#777777', "<1.5" = '#0052aE', "1.5-2.0" = '#554C54', '2.0-2.5' = "#FFA17F", '>=2.5' = "#ce4200")
-    )''' % plot_colors
-        extra_commands ='\n    scale_colour_gradient(low="yellow", high="#880000") +'
-        return self.scatterplot_color_by_series(colorseries = "Residues", title = title, plot_scale = '', point_opacity = 0.75, extra_commands = extra_commands)
+        return dict(colorseries = "Residues", color_scale = dict(gradient = ("yellow", "#880000")), point_opacity = 0.75)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,300 @@
+#!/usr/bin/env python2
+
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""\
+A compact columnar store for the per-structure scores of a ddg_monomer benchmark run.
+
+ddg_monomer reports the total score and the score components of each wildtype and mutant structure. Rather than keeping
+these as nested dicts (structure ID -> score term -> value) per case, the store holds one table per state (wildtype or
+mutant) with one row per structure and one float64 column per score term. Rows are grouped by case (record ID) and sorted
+by structure ID within each case so that the rows for a case are a contiguous slice.
+
+The tables are saved in a single uncompressed NumPy .npz file. Columns are only read from the file when they are first
+used so, for example, analyses of the total scores never load the other score terms.
+
+The DDG estimators at the end of this module (DDG_TopN, the mean, and a Boltzmann-weighted average) are computed for all
+cases at once from the per-case total scores sorted into a padded matrix.
+"""
+
+import numpy
+
+
+# The two states in a ddg_monomer run. The names match the keys used in the extracted benchmark data.
+states = ['WildType', 'Mutant']
+
+
+class StructureScoreStore(object):
+    '''Read access to a saved store. The per-case accessors return views into the cached columns.'''
+
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.npz = numpy.load(filepath)
+        self.record_ids = self.npz['record_ids']
+        self.score_terms = [str(t) for t in self.npz['score_terms']]
+        self.case_index = dict((int(record_id), x) for x, record_id in enumerate(self.record_ids))
+        self.columns = {}
+        self.sorted_scores = {}
+
+
+    def close(self):
+        self.npz.close()
+
+
+    def __contains__(self, record_id):
+        return record_id in self.case_index
+
+
+    def __len__(self):
+        return len(self.record_ids)
+
+
+    def get_column(self, state, name):
+        '''Returns the full column for the state. name is a score term or one of "structure_ids" or "offsets".'''
+        key = (state, name)
+        if key not in self.columns:
+            if name in ['structure_ids', 'offsets']:
+                self.columns[key] = self.npz['{0}_{1}'.format(state, name)]
+            elif name in self.score_terms:
+                self.columns[key] = self.npz['{0}_term_{1}'.format(state, self.score_terms.index(name))]
+            else:
+                raise Exception('Unknown score term "{0}".'.format(name))
+        return self.columns[key]
+
+
+    def get_case_slice(self, state, record_id):
+        offsets = self.get_column(state, 'offsets')
+        x = self.case_index[record_id]
+        return slice(offsets[x], offsets[x + 1])
+
+
+    def get_case_structure_ids(self, state, record_id):
+        return self.get_column(state, 'structure_ids')[self.get_case_slice(state, record_id)]
+
+
+    def get_case_scores(self, state, record_id, score_term = 'total'):
+        '''Returns an array with the values of the score term for each structure of the case, ordered by structure ID.'''
+        return self.get_column(state, score_term)[self.get_case_slice(state, record_id)]
+
+
+    def get_case_table(self, state, record_id, score_terms = None):
+        '''Returns a pair (structure_ids, dict mapping score terms to value arrays) for the case.'''
+        case_slice = self.get_case_slice(state, record_id)
+        score_terms = score_terms or self.score_terms
+        return self.get_column(state, 'structure_ids')[case_slice], dict((t, self.get_column(state, t)[case_slice]) for t in score_terms)
+
+
+    def get_padded_scores(self, state, score_term = 'total'):
+        '''Returns a pair (matrix, counts) where row i of the matrix holds the values of the score term for the structures of
+           case self.record_ids[i], ordered by structure ID and padded with NaN, and counts[i] is the number of structures of
+           that case.'''
+        offsets = self.get_column(state, 'offsets')
+        values = self.get_column(state, score_term)
+        counts = numpy.diff(offsets)
+        matrix = numpy.empty((len(counts), max(counts.max() if len(counts) else 0, 1)), dtype = numpy.float64)
+        matrix.fill(numpy.nan)
+        rows = numpy.repeat(numpy.arange(len(counts)), counts)
+        matrix[rows, numpy.arange(len(values)) - offsets[:-1][rows]] = values
+        return matrix, counts
+
+
+    def get_sorted_scores(self, state, score_term = 'total', sort_term = None):
+        '''Returns a pair (matrix, counts) as in get_padded_scores where the values in each row are sorted in ascending order
+           of the sort term (by default, the score term itself) with the padding at the end of the row. The matrix is
+           cached so that estimators over all cases are single vectorized reductions.'''
+        sort_term = sort_term or score_term
+        key = (state, score_term, sort_term)
+        if key not in self.sorted_scores:
+            matrix, counts = self.get_padded_scores(state, score_term)
+            if sort_term == score_term:
+                matrix.sort(axis = 1) # NaN values are sorted to the end of each row
+            else:
+                sort_values = self.get_padded_scores(state, sort_term)[0]
+                order = numpy.argsort(sort_values, axis = 1, kind = 'mergesort')
+                matrix = matrix[numpy.arange(len(counts))[:, numpy.newaxis], order]
+            self.sorted_scores[key] = (matrix, counts)
+        return self.sorted_scores[key]
+
+
+    def get_case_score_dicts(self, state, record_id):
+        '''Returns the scores for the case in the nested dict format of BenchmarkManager.get_ddg_monomer_scores_per_structure.
+           This is provided for convenience; analyses should use the array accessors.'''
+        structure_ids, table = self.get_case_table(state, record_id)
+        scores = {}
+        for x, structure_id in enumerate(structure_ids):
+            scores[int(structure_id)] = dict((t, float(v[x])) for t, v in table.items() if not numpy.isnan(v[x]))
+        return scores
+
+
+def table_from_score_dicts(structure_scores):
+    '''Converts a dict mapping structure IDs to dicts of score components into the pair (structure_ids, dict mapping score
+       terms to value arrays) used by the store.'''
+    structure_ids = sorted(structure_scores.keys(), key = int)
+    score_terms = set()
+    for components in structure_scores.values():
+        score_terms = score_terms.union(components.keys())
+    table = {}
+    for t in score_terms:
+        table[t] = numpy.array([structure_scores[s].get(t, numpy.nan) for s in structure_ids], dtype = numpy.float64)
+    return numpy.array([int(s) for s in structure_ids], dtype = numpy.int32), table
+
+
+def write_store(filepath, case_tables):
+    '''Writes a store. case_tables maps record IDs to a dict mapping each state to a (structure_ids, table) pair as returned by
+       table_from_score_dicts or StructureScoreStore.get_case_table. Score terms missing from a case are stored as NaN.'''
+    record_ids = sorted(case_tables.keys())
+    score_terms = set()
+    for record_id in record_ids:
+        for state in states:
+            score_terms = score_terms.union(case_tables[record_id][state][1].keys())
+    score_terms = sorted(score_terms, key = lambda t: (t != 'total', t))
+
+    arrays = dict(
+        record_ids = numpy.array(record_ids, dtype = numpy.int64),
+        score_terms = numpy.array(score_terms),
+    )
+    for state in states:
+        sizes = [len(case_tables[record_id][state][0]) for record_id in record_ids]
+        offsets = numpy.zeros(len(record_ids) + 1, dtype = numpy.int64)
+        offsets[1:] = numpy.cumsum(sizes)
+        arrays['{0}_offsets'.format(state)] = offsets
+        arrays['{0}_structure_ids'.format(state)] = numpy.concatenate([case_tables[record_id][state][0] for record_id in record_ids] or [numpy.zeros(0)]).astype(numpy.int32)
+        for x, t in enumerate(score_terms):
+            column = numpy.empty(offsets[-1], dtype = numpy.float64)
+            for y, record_id in enumerate(record_ids):
+                values = case_tables[record_id][state][1].get(t)
+                column[offsets[y]:offsets[y + 1]] = numpy.nan if values is None else values
+            arrays['{0}_term_{1}'.format(state, x)] = column
+
+    # numpy.savez appends .npz to filenames without that extension so we write to an open file
+    with open(filepath, 'wb') as f:
+        numpy.savez(f, **arrays)
+
+
+###
+#  DDG estimators
+#  Each estimator returns an array of predicted DDG values (mutant estimate - wildtype estimate) for the cases of a store,
+#  in the order of record_ids (the store order if record_ids is None). Cases without structures are NaN.
+###
+
+
+def _get_sorted_totals(store, record_ids = None):
+    '''Returns the sorted total score matrices and structure counts of the mutant and wildtype structures of the cases.'''
+    mutant_scores, mutant_counts = store.get_sorted_scores('Mutant')
+    wildtype_scores, wildtype_counts = store.get_sorted_scores('WildType')
+    if record_ids is not None:
+        rows = numpy.array([store.case_index[record_id] for record_id in record_ids], dtype = numpy.int64)
+        mutant_scores, mutant_counts = mutant_scores[rows], mutant_counts[rows]
+        wildtype_scores, wildtype_counts = wildtype_scores[rows], wildtype_counts[rows]
+    return mutant_scores, mutant_counts, wildtype_scores, wildtype_counts
+
+
+def _cap(values, prediction_cap):
+    if prediction_cap is not None:
+        values = numpy.clip(values, -prediction_cap, prediction_cap)
+    return values
+
+
+def ddg_top_n_sweep(store, ns, record_ids = None, prediction_cap = None):
+    '''Returns a matrix with one row per case and one column per value of N in ns. Each value is the DDG_TopN estimate:
+       the average total score of the N lowest-scoring mutant structures minus the average total score of the N
+       lowest-scoring wildtype structures. As in BenchmarkManager.extract_data, if a case has fewer than N mutant or
+       wildtype structures then only as many as the lower number of structures are considered.'''
+    mutant_scores, mutant_counts, wildtype_scores, wildtype_counts = _get_sorted_totals(store, record_ids)
+    ns = numpy.asarray(ns, dtype = numpy.int64)
+    fair_top = numpy.minimum(ns[numpy.newaxis, :], numpy.minimum(mutant_counts, wildtype_counts)[:, numpy.newaxis])
+    columns = numpy.maximum(fair_top - 1, 0)
+    rows = numpy.arange(len(fair_top))[:, numpy.newaxis]
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        values = (numpy.nancumsum(mutant_scores, axis = 1)[rows, columns] / fair_top) - (numpy.nancumsum(wildtype_scores, axis = 1)[rows, columns] / fair_top)
+    values[fair_top == 0] = numpy.nan
+    return _cap(values, prediction_cap)
+
+
+def ddg_top_n(store, n, record_ids = None, prediction_cap = None):
+    '''Returns the DDG_TopN estimate of each case. See ddg_top_n_sweep.'''
+    return ddg_top_n_sweep(store, [n], record_ids = record_ids, prediction_cap = prediction_cap)[:, 0]
+
+
+def ddg_mean(store, record_ids = None, prediction_cap = None):
+    '''Returns the difference between the average total scores of all mutant and all wildtype structures of each case.'''
+    mutant_scores, mutant_counts, wildtype_scores, wildtype_counts = _get_sorted_totals(store, record_ids)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        values = numpy.nansum(mutant_scores, axis = 1) / mutant_counts - numpy.nansum(wildtype_scores, axis = 1) / wildtype_counts
+    return _cap(values, prediction_cap)
+
+
+def ddg_boltzmann(store, kT = 1.0, record_ids = None, prediction_cap = None):
+    '''Returns the difference between the Boltzmann-weighted average total scores of the mutant and wildtype structures of
+       each case. Structures are weighted by exp(-(E - E_min) / kT) where kT is in Rosetta energy units, so the estimate
+       tends to the lowest score as kT tends to zero and to the mean score as kT grows.'''
+    def boltzmann_average(scores):
+        with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+            weights = numpy.exp(-(scores - scores[:, :1]) / kT) # the rows are sorted so the first column holds the minimum
+            weights[numpy.isnan(weights)] = 0.0
+            return numpy.nansum(weights * scores, axis = 1) / weights.sum(axis = 1)
+    mutant_scores, mutant_counts, wildtype_scores, wildtype_counts = _get_sorted_totals(store, record_ids)
+    return _cap(boltzmann_average(mutant_scores) - boltzmann_average(wildtype_scores), prediction_cap)
+
+
+def _random_ranks(counts, width, num_repeats, random_state):
+    '''Returns an array of shape (num_repeats, len(counts), width) containing, for each repeat and case, a random ordering
+       (as ranks) of the structures of the case. The padding entries of the sorted score matrix are ranked last.'''
+    keys = random_state.random_sample((num_repeats, len(counts), width))
+    keys[:, numpy.arange(width)[numpy.newaxis, :] >= counts[:, numpy.newaxis]] = 2.0
+    return keys.argsort(axis = -1).argsort(axis = -1)
+
+
+def _subsample_top_n_average(scores, counts, ranks, k, fair_top):
+    '''Returns the average of the fair_top lowest scores among the structures ranked below k for each repeat and case.
+       The score matrix rows are sorted so the selected scores are already in ascending order.'''
+    selected = (ranks < k) & (ranks < counts[numpy.newaxis, :, numpy.newaxis])
+    sums = numpy.cumsum(numpy.where(selected, scores[numpy.newaxis, :, :], 0.0), axis = -1)
+    positions = numpy.argmax(numpy.cumsum(selected, axis = -1) >= fair_top[numpy.newaxis, :, numpy.newaxis], axis = -1)
+    repeat_indices, case_indices = numpy.ogrid[0:ranks.shape[0], 0:ranks.shape[1]]
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        return sums[repeat_indices, case_indices, positions] / fair_top[numpy.newaxis, :]
+
+
+def ddg_top_n_subsamples(store, ks, n, num_repeats, random_state, record_ids = None, prediction_cap = None, max_chunk_size = 1 << 22):
+    '''Returns an array of shape (len(ks), num_repeats, number of cases) of the DDG_TopN estimates which would have been
+       obtained had only k wildtype and k mutant structures been generated for each case, for each k in ks. For each repeat,
+       a random order of the structures of each case and state is drawn from random_state (a numpy.random.RandomState)
+       and the subsample of size k is made of the first k structures in that order. The subsamples are therefore nested
+       over ks which reduces the noise in convergence curves. The repeats are processed in chunks of at most
+       max_chunk_size matrix entries to bound the memory use.'''
+    mutant_scores, mutant_counts, wildtype_scores, wildtype_counts = _get_sorted_totals(store, record_ids)
+    ks = numpy.asarray(ks, dtype = numpy.int64)
+    num_cases = len(mutant_counts)
+    values = numpy.empty((len(ks), num_repeats, num_cases), dtype = numpy.float64)
+    chunk_size = max(1, max_chunk_size // max(1, num_cases * max(mutant_scores.shape[1], wildtype_scores.shape[1])))
+    for start in range(0, num_repeats, chunk_size):
+        stop = min(num_repeats, start + chunk_size)
+        mutant_ranks = _random_ranks(mutant_counts, mutant_scores.shape[1], stop - start, random_state)
+        wildtype_ranks = _random_ranks(wildtype_counts, wildtype_scores.shape[1], stop - start, random_state)
+        for x, k in enumerate(ks):
+            # As in ddg_top_n_sweep, only consider as many structures as the lower number of structures of the two states
+            fair_top = numpy.minimum(numpy.minimum(n, k), numpy.minimum(mutant_counts, wildtype_counts))
+            chunk_values = _subsample_top_n_average(mutant_scores, mutant_counts, mutant_ranks, k, fair_top) - _subsample_top_n_average(wildtype_scores, wildtype_counts, wildtype_ranks, k, fair_top)
+            chunk_values[:, fair_top == 0] = numpy.nan
+            values[x, start:stop] = chunk_values
+    return _cap(values, prediction_cap)
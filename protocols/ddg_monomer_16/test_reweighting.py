@@ -0,0 +1,92 @@
+#!/usr/bin/env python2
+
+'''
+Regression tests for the fitting functions in reweighting.py. Run from this directory with:
+    python -m unittest test_reweighting
+'''
+
+import unittest
+
+import numpy
+
+import reweighting
+
+
+def linear_data(num_cases, num_terms, random_seed, noise = 0.0):
+    '''Returns a triple (X, y, true weights) where the columns of X have different scales and offsets, as the score terms
+       do, and y is a linear function of the columns plus an intercept and optional noise.'''
+    random_state = numpy.random.RandomState(random_seed)
+    X = random_state.randn(num_cases, num_terms) * numpy.logspace(-1, 2, num_terms) + numpy.arange(num_terms)
+    true_weights = random_state.randn(num_terms)
+    y = X.dot(true_weights) + 0.5 + noise * random_state.randn(num_cases)
+    return X, y, true_weights
+
+
+class FitLeastSquaresTest(unittest.TestCase):
+
+
+    def test_unregularized_fit_matches_lstsq(self):
+        X, y, true_weights = linear_data(50, 4, 0, noise = 0.3)
+        weights, intercepts = reweighting.fit_least_squares(X, y, [0.0])
+        expected = numpy.linalg.lstsq(numpy.hstack((X, numpy.ones((len(y), 1)))), y, rcond = None)[0]
+        self.assertTrue(numpy.allclose(weights[0], expected[:-1]))
+        self.assertTrue(numpy.allclose(intercepts[0], expected[-1]))
+
+
+    def test_noiseless_fit_recovers_weights(self):
+        X, y, true_weights = linear_data(30, 5, 1)
+        weights, intercepts = reweighting.fit_least_squares(X, y, [0.0])
+        self.assertTrue(numpy.allclose(weights[0], true_weights))
+        self.assertTrue(numpy.allclose(intercepts[0], 0.5))
+
+
+    def test_ridge_fits_match_normal_equations(self):
+        X, y, true_weights = linear_data(40, 6, 2, noise = 1.0)
+        alphas = [0.0, 0.1, 1.0, 10.0, 1000.0]
+        weights, intercepts = reweighting.fit_least_squares(X, y, alphas)
+        means, stds = X.mean(axis = 0), X.std(axis = 0)
+        Xs = (X - means) / stds
+        for x, alpha in enumerate(alphas):
+            # The penalty is applied to the weights of the standardized columns
+            standardized_weights = numpy.linalg.solve(Xs.T.dot(Xs) + alpha * numpy.eye(X.shape[1]), Xs.T.dot(y - y.mean()))
+            self.assertTrue(numpy.allclose(weights[x], standardized_weights / stds))
+            self.assertTrue(numpy.allclose(intercepts[x], y.mean() - (standardized_weights / stds).dot(means)))
+            # Fitting the alphas one at a time gives the same fits
+            single_weights, single_intercepts = reweighting.fit_least_squares(X, y, [alpha])
+            self.assertTrue(numpy.allclose(single_weights[0], weights[x]))
+            self.assertTrue(numpy.allclose(single_intercepts[0], intercepts[x]))
+
+
+    def test_constant_and_collinear_columns(self):
+        X, y, true_weights = linear_data(30, 3, 3)
+        X = numpy.hstack((X, numpy.ones((len(y), 1)) * 7.0, X[:, :1] * 2.0))
+        weights, intercepts = reweighting.fit_least_squares(X, y, [0.0])
+        self.assertTrue(numpy.all(numpy.isfinite(weights)))
+        self.assertEqual(weights[0, 3], 0.0)
+        self.assertTrue(numpy.allclose(X.dot(weights[0]) + intercepts[0], y))
+
+
+class FitRankTest(unittest.TestCase):
+
+
+    def test_sample_pairs(self):
+        y = numpy.array([0.0, 1.0, 1.0, 2.0, 3.0])
+        first, second = reweighting.sample_pairs(y, 100, numpy.random.RandomState(0))
+        self.assertEqual(sorted(zip(first, second)), [(i, j) for i in range(5) for j in range(i + 1, 5) if y[i] != y[j]])
+        first, second = reweighting.sample_pairs(numpy.arange(100.0), 50, numpy.random.RandomState(0))
+        self.assertTrue(len(first) <= 50)
+        self.assertTrue(numpy.all(first != second))
+
+
+    def test_noiseless_fit_orders_cases(self):
+        X, y, true_weights = linear_data(60, 3, 4)
+        weights, intercepts = reweighting.fit_rank(X, y, [0.01, 1.0])
+        for x in range(2):
+            predictions = X.dot(weights[x]) + intercepts[x]
+            self.assertTrue(reweighting.prediction_metrics(predictions, y)['Pearson'][0] > 0.99)
+            # The scale and offset are calibrated by least squares
+            self.assertTrue(numpy.allclose(predictions.mean(), y.mean()))
+
+
+if __name__ == '__main__':
+    unittest.main()